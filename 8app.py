@@ -1,524 +1,15 @@
 import streamlit as st
-import pandas as pd
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
-from reportlab.lib.units import inch
-import io
-from num2words import num2words
-import datetime
-
-# ===== Auto-extraction Function =====
-def extract_invoice_details(df_raw):
-    """Extract invoice details from Excel sheet using keyword search - only from first 6 rows"""
-    
-    extracted_data = {}
-    
-    # Generate PI Number with today's date
-    today = datetime.datetime.now()
-    pi_date = today.strftime("%d/%m/%Y")
-    # Simple counter - in production, you might want a more sophisticated numbering system
-    import random
-    pi_num = f"SAR/LG/{random.randint(1000, 9999)}"
-    extracted_data['pi_number'] = f"{pi_num} Dt. {pi_date}"
-    
-    # Search through only the first 6 rows for keywords
-    max_search_rows = min(6, len(df_raw))
-    for row_idx in range(max_search_rows):
-        row = df_raw.iloc[row_idx]
-        for col_idx, cell in enumerate(row):
-            if pd.isna(cell):
-                continue
-            cell_str = str(cell).strip()
-            
-            # Buyer Name - Row 1, Column A (index 0)
-            if row_idx == 0 and col_idx == 0:
-                extracted_data['buyer_name'] = cell_str
-            
-            # Order No - search for "Order No :" and get value 2 cells to the right
-            elif "Order No" in cell_str and ":" in cell_str:
-                if col_idx + 2 < len(row):
-                    order_value = row.iloc[col_idx + 2]
-                    if not pd.isna(order_value):
-                        extracted_data['order_ref'] = str(order_value).strip()
-            
-            # Brand Name - search for "Brand" and get value 1 cell to the right
-            elif "Brand" in cell_str and cell_str.lower() != "brand name":  # Avoid header matches
-                if col_idx + 1 < len(row):
-                    brand_value = row.iloc[col_idx + 1]
-                    if not pd.isna(brand_value):
-                        extracted_data['brand_name'] = str(brand_value).strip()
-            
-            # Loading Country - search for "Made in Country" and get value 1 cell to the right
-            elif "Made in Country" in cell_str:
-                if col_idx + 1 < len(row):
-                    country_value = row.iloc[col_idx + 1]
-                    if not pd.isna(country_value):
-                        extracted_data['loading_country'] = str(country_value).strip()
-            
-            # Port of Loading - search for multiple keywords and get value 1 cell to the right
-            elif ("Loading Port" in cell_str) or ("PORT OF LOADING" in cell_str):
-                if col_idx + 1 < len(row):
-                    port_value = row.iloc[col_idx + 1]
-                    if not pd.isna(port_value):
-                        extracted_data['port_loading'] = str(port_value).strip()
-            
-            # Agreed Shipment Date - search for multiple keywords and get value based on keyword
-            elif ("Agreed Ship Date" in cell_str) or ("ETA" in cell_str):
-                # For "Agreed Ship Date", look 2 cells to the right
-                if "Agreed Ship Date" in cell_str:
-                    if col_idx + 2 < len(row):
-                        ship_value = row.iloc[col_idx + 2]
-                        if not pd.isna(ship_value):
-                            # Handle datetime objects by extracting only the date part
-                            if hasattr(ship_value, 'date'):
-                                extracted_data['shipment_date'] = ship_value.date().strftime('%d/%m/%Y')
-                            else:
-                                ship_str = str(ship_value).strip()
-                                if ' ' in ship_str:
-                                    ship_str = ship_str.split(' ')[0]
-                                extracted_data['shipment_date'] = ship_str
-                # For "ETA", look 1 cell to the right
-                elif "ETA" in cell_str:
-                    if col_idx + 1 < len(row):
-                        ship_value = row.iloc[col_idx + 1]
-                        if not pd.isna(ship_value):
-                            # Handle datetime objects by extracting only the date part
-                            if hasattr(ship_value, 'date'):
-                                extracted_data['shipment_date'] = ship_value.date().strftime('%d/%m/%Y')
-                            else:
-                                ship_str = str(ship_value).strip()
-                                if ' ' in ship_str:
-                                    ship_str = ship_str.split(' ')[0]
-                                extracted_data['shipment_date'] = ship_str
-            
-            # Description of goods - search for "ORDER OF" and get value 1 cell to the right
-            elif "ORDER OF" in cell_str:
-                if col_idx + 1 < len(row):
-                    goods_value = row.iloc[col_idx + 1]
-                    if not pd.isna(goods_value):
-                        extracted_data['goods_desc'] = str(goods_value).strip()
-    
-    return extracted_data
-
-# ===== Hidden Row Detection Function =====
-def get_visible_rows_openpyxl(uploaded_file, sheet_name=0):
-    """Get list of visible row indices using openpyxl"""
-    try:
-        import openpyxl
-        from io import BytesIO
-        
-        # Reset file pointer and read with openpyxl
-        uploaded_file.seek(0)
-        workbook = openpyxl.load_workbook(BytesIO(uploaded_file.read()))
-        
-        # Select the specific worksheet
-        if isinstance(sheet_name, str):
-            worksheet = workbook[sheet_name]
-        else:
-            worksheet = workbook.worksheets[sheet_name]
-        
-        visible_rows = []
-        for row_num in range(1, worksheet.max_row + 1):
-            # Check if row is not hidden
-            if not worksheet.row_dimensions[row_num].hidden:
-                visible_rows.append(row_num - 1)  # Convert to 0-based index for pandas
-        
-        return visible_rows
-    except Exception as e:
-        print(f"Could not detect hidden rows with openpyxl: {e}")
-        return None
-
-# ===== Preprocessing Function =====
-def preprocess_excel_flexible_auto(uploaded_file, max_rows=20):
-    # First, get visible row indices
-    visible_row_indices = get_visible_rows_openpyxl(uploaded_file)
-    
-    # Reset file pointer for pandas
-    uploaded_file.seek(0)
-    df_raw = pd.read_excel(uploaded_file, header=None)
-    
-    # Filter to only visible rows if we successfully detected them
-    if visible_row_indices is not None:
-        # Ensure we don't go beyond dataframe bounds
-        max_row_in_df = len(df_raw) - 1
-        valid_visible_rows = [r for r in visible_row_indices if r <= max_row_in_df]
-        
-        if valid_visible_rows:
-            print(f"Filtering to {len(valid_visible_rows)} visible rows out of {len(df_raw)} total rows")
-            df_raw = df_raw.iloc[valid_visible_rows].reset_index(drop=True)
-        else:
-            print("No valid visible rows found, using all rows")
-    else:
-        print("Hidden row detection failed, processing all rows")
-
-    # detect header row
-    header_row_idx = None
-    stacked_header_idx = None
-    for i in range(min(max_rows, len(df_raw))):
-        if i >= len(df_raw):
-            break
-        row = df_raw.iloc[i].astype(str)
-        if row.str.contains("Style", case=False, na=False).any():
-            header_row_idx = i
-            stacked_header_idx = i - 1
-            break
-    if header_row_idx is None:
-        raise ValueError("Could not detect header row with 'Style' column!")
-
-    # combine stacked headers
-    if stacked_header_idx >= 0:
-        headers = (
-            df_raw.iloc[stacked_header_idx].astype(str).fillna("") + " " +
-            df_raw.iloc[header_row_idx].astype(str).fillna("")
-        )
-    else:
-        headers = df_raw.iloc[header_row_idx].astype(str).fillna("")
-    headers = headers.str.strip().astype(str)
-
-    # column mapping
-    col_map = {
-        "STYLE NO": ["Style", "Style No", "Item Style", "STYLE"],
-        "ITEM DESCRIPTION": ["Descreption", "Description", "Item Description", "Item Desc", "DESC"],
-        "COMPOSITION": ["Composition", "Fabric Composition"],
-        "UNIT PRICE": ["Fob$", "USD Fob$", "Fob USD", "Fob $", "Unit Price", "FOB"],
-        "QTY": ["Total Qty", "Quantity", "Qty", "QTY"],
-        "AMOUNT": ["Total Value", "Amount", "Value", "TOTAL VALUE"],
-    }
-
-    df_columns = {}
-    hdr_list = list(headers)
-    for target_col, variants in col_map.items():
-        found = None
-        for var in variants:
-            for hdr in hdr_list:
-                if var.lower() in str(hdr).lower():
-                    found = hdr
-                    break
-            if found:
-                break
-        df_columns[target_col] = found
-
-    # build dataframe
-    df = df_raw.iloc[header_row_idx + 1:].copy()
-    df.columns = headers
-    df = df.reset_index(drop=True)
-
-    rename_dict = {v: k for k, v in df_columns.items() if v is not None}
-    if rename_dict:
-        df = df.rename(columns=rename_dict)
-
-    required_cols_defaults = {
-        "STYLE NO": "",
-        "ITEM DESCRIPTION": "",
-        "COMPOSITION": "",
-        "UNIT PRICE": 0.0,
-        "QTY": 0,
-        "AMOUNT": 0.0,
-    }
-    for col, default in required_cols_defaults.items():
-        if col not in df.columns:
-            df[col] = default
-
-    df["STYLE NO"] = df["STYLE NO"].astype(str).str.strip()
-    df = df[~df["STYLE NO"].isin(["", "nan", "NaN", "None", "NONE"])]
-    df = df[~df["STYLE NO"].str.contains("total|grand|remarks|note", case=False, na=False)]
-    
-    # Remove specific unwanted style codes (as backup filter)
-    df = df[df["STYLE NO"] != "SA0167A21"]
-
-    df["QTY"] = pd.to_numeric(df.get("QTY", 0), errors="coerce").fillna(0).astype(int)
-    df["UNIT PRICE"] = pd.to_numeric(df.get("UNIT PRICE", 0.0), errors="coerce").fillna(0.0).astype(float)
-    df["AMOUNT"] = df["QTY"] * df["UNIT PRICE"]
-
-    df = df[~((df["QTY"] == 0) & (df["UNIT PRICE"] == 0) & (df["STYLE NO"].str.strip() == ""))]
-
-    group_by_cols = ["STYLE NO", "ITEM DESCRIPTION", "COMPOSITION", "UNIT PRICE"]
-    for c in group_by_cols:
-        if c not in df.columns:
-            df[c] = "" if c != "UNIT PRICE" else 0.0
-
-    grouped = (
-        df.groupby(group_by_cols, dropna=False, as_index=False)
-        .agg({"QTY": "sum"})
-        .reset_index(drop=True)
-    )
-    grouped["AMOUNT"] = grouped["QTY"] * grouped["UNIT PRICE"]
-
-    # Read fabric type by searching for "Texture :" keyword (FIXED TO INCLUDE SPACE AND COLON)
-    try:
-        fabric_type_value = "Knitted"  # Default fallback
-        
-        # Search for "Texture :" keyword in the dataframe
-        for row_idx, row in df_raw.iterrows():
-            for col_idx, cell in enumerate(row):
-                if pd.isna(cell):
-                    continue
-                cell_str = str(cell).strip()
-                if "Texture :" in cell_str:  # FIXED: Now searches for "Texture :" with space and colon
-                    if col_idx + 1 < len(row):
-                        texture_value = row.iloc[col_idx + 1]
-                        if not pd.isna(texture_value):
-                            fabric_type_value = str(texture_value).strip()
-                            break
-            if fabric_type_value != "Knitted":  # If we found a value, break outer loop
-                break
-                
-    except Exception as e:
-        fabric_type_value = "Knitted"  # Default fallback if search fails
-
-    # static extras
-    grouped["FABRIC TYPE"] = fabric_type_value
-    grouped["HS CODE"] = "61112000"
-    grouped["COUNTRY OF ORIGIN"] = "India"
-
-    final_cols = [
-        "STYLE NO", "ITEM DESCRIPTION", "FABRIC TYPE", "HS CODE",
-        "COMPOSITION", "COUNTRY OF ORIGIN", "QTY", "UNIT PRICE", "AMOUNT",
-    ]
-    for c in final_cols:
-        if c not in grouped.columns:
-            grouped[c] = "" if c not in ["QTY", "UNIT PRICE", "AMOUNT"] else 0.0
-    grouped = grouped[final_cols].reset_index(drop=True)
-    return grouped
-
-# ===== PDF Generator =====
-def generate_proforma_invoice(df, form_data):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4,
-                            topMargin=24, bottomMargin=24,
-                            leftMargin=34.6, rightMargin=34.6)
-    elements = []
-
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('Title', parent=styles['Normal'], fontSize=12,
-                                 alignment=TA_CENTER, fontName='Helvetica-Bold', spaceAfter=6,
-                                 borderWidth=1, borderColor=colors.black, borderPadding=(2,6,6,6))
-    header_style = ParagraphStyle('Header', parent=styles['Normal'], fontSize=7,
-                                  fontName='Helvetica-Bold', alignment=TA_LEFT, 
-                                  spaceBefore=0, spaceAfter=0, leading=8)
-    normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=6, alignment=TA_LEFT,
-                                  spaceBefore=0, spaceAfter=0, leading=7)
-
-    elements.append(Paragraph("Proforma Invoice", title_style))
-
-    # width setup - adjust product table to align with header sections
-    # First calculate the total table width from original product columns to maintain consistency
-    original_product_col_widths = [0.8*inch, 1.3*inch, 0.8*inch, 0.7*inch,
-                                   1.1*inch, 0.7*inch, 0.5*inch, 0.6*inch, 0.8*inch]
-    total_table_width = sum(original_product_col_widths)
-    
-    # Calculate widths so the line between H.S NO and COMPOSITION aligns with center divider above
-    left_section_width = total_table_width/2  # This should align with the center line above
-    right_section_width = total_table_width/2
-    
-    # Distribute left section width among first 4 columns (STYLE NO, ITEM DESC, FABRIC TYPE, H.S NO)
-    # Distribute right section width among last 5 columns (COMPOSITION, COUNTRY, QTY, UNIT PRICE, AMOUNT)
-    product_col_widths = [
-        left_section_width * 0.2,   # STYLE NO (20% of left)
-        left_section_width * 0.35,  # ITEM DESCRIPTION (35% of left)  
-        left_section_width * 0.25,  # FABRIC TYPE (25% of left)
-        left_section_width * 0.2,   # H.S NO (20% of left)
-        right_section_width * 0.22, # COMPOSITION (22% of right)
-        right_section_width * 0.18, # COUNTRY OF ORIGIN (18% of right) - increased from 15%
-        right_section_width * 0.15, # QTY (15% of right)
-        right_section_width * 0.2,  # UNIT PRICE (20% of right)
-        right_section_width * 0.25  # AMOUNT (25% of right) - reduced from 28%
-    ]
-    header_col_widths = [total_table_width/2, total_table_width/2]
-
-    # Supplier section
-    supplier_data = [
-        [Paragraph("<b>Supplier Name:</b><br/><br/>", header_style),  # Added equal spacing to supplier name
-         Paragraph(f"<b>No. & date of PI:</b> {form_data['pi_number']}<br/><br/>", header_style)],  # Keep spacing for PI number
-        [Paragraph("<b>SAR APPARELS INDIA PVT.LTD.</b><br/><b>Address:</b> 6, Picaso Bithi, Kolkata - 700017<br/><b>Phone:</b> 9817473373<br/><b>Fax:</b> N.A.", ParagraphStyle('SupplierDetail', parent=header_style, leading=12)),
-         Paragraph(f"<b>Landmark order Reference:</b> {form_data['order_ref']}<br/><b>Buyer Name:</b> {form_data['buyer_name']}<br/><b>Brand Name:</b> {form_data['brand_name']}", ParagraphStyle('TopAlign', parent=header_style, alignment=TA_LEFT, spaceBefore=0, leading=12))],
-    ]
-    elements.append(Table(supplier_data, colWidths=header_col_widths,
-                          style=[('BOX',(0,0),(-1,-1),1,colors.black),
-                                 ('LINEBEFORE',(1,0),(1,-1),1,colors.black),
-                                 ('LINEBELOW',(1,0),(1,0),1,colors.black),
-                                 ('VALIGN',(0,1),(1,1),'TOP'),
-                                 ('BOTTOMPADDING',(0,1),(0,1),50),    # Increased bottom padding to 50 points
-                                 ('BOTTOMPADDING',(1,1),(1,1),50)]))  # Increased bottom padding to 50 points
-
-    # Consignee section - ULTRA TIGHT SPACING
-    # Create compact styles for bank details
-    bank_style = ParagraphStyle('BankCompact', parent=normal_style, fontSize=7, fontName='Helvetica', 
-                               leading=12, spaceAfter=0, spaceBefore=0, leftIndent=0, rightIndent=0)
-    
-    consignee_data = [
-        [Paragraph("<b>Consignee:</b><br/><br/>", header_style),
-         Paragraph(f"<b>Payment Term:</b> {form_data['payment_term']}", normal_style)],
-        [Paragraph(f"{form_data['consignee_name']}<br/>{form_data['consignee_address']}<br/>{form_data['consignee_tel']}", 
-                   ParagraphStyle('ConsigneeCompact', parent=normal_style, leading=12, spaceAfter=0, spaceBefore=0)),
-         Paragraph(f"<br/><br/><b>Bank Details</b><br/><b>BENEFICIARY</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:-&nbsp;{form_data['bank_beneficiary']}<br/><b>ACCOUNT NO</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:- {form_data['bank_account']}<br/><b>BANK'S NAME</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:- {form_data['bank_name']}<br/><b>BANK ADDRESS</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:- 2 BRABOURNE ROAD, GOVIND BHAVAN,<br/>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;GROUND FLOOR, KOLKATA-700001<br/><b>SWIFT CODE</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:- {form_data['bank_swift']}<br/><b>BANK CODE</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:- {form_data['bank_code']}", 
-                   bank_style)]
-    ]
-    consignee_table = Table(consignee_data, colWidths=header_col_widths,
-                            style=[('BOX',(0,0),(-1,-1),1,colors.black),
-                                   ('LINEBEFORE',(1,0),(1,-1),1,colors.black),
-                                   ('VALIGN',(0,0),(-1,-1),'TOP'),
-                                   # Ultra tight spacing
-                                   ('TOPPADDING',(0,0),(-1,-1),0),    # Zero top padding for all cells
-                                   ('BOTTOMPADDING',(0,0),(-1,-1),1), # Minimal bottom padding for all cells
-                                   ('LEFTPADDING',(0,0),(-1,-1),2),   # Minimal left padding
-                                   ('RIGHTPADDING',(0,0),(-1,-1),2)]) # Minimal right padding
-
-    elements.append(consignee_table)
-
-    # Shipping section - REDUCED SPACING BELOW AGREED SHIPMENT DATE
-    shipping_data = [
-        [Paragraph(f"<b>Loading Country:</b> {form_data['loading_country']}", normal_style),
-         Paragraph("<b>L/C Advising Bank:</b> (If applicable)", normal_style)],
-        [Paragraph(f"<b>Port of Loading:</b> {form_data['port_loading']}", normal_style), ""],
-        [Paragraph(f"<b>Agreed Shipment Date:</b> {form_data['shipment_date']}", normal_style), ""],
-        ["", Paragraph(f"<b>Remarks:</b> {form_data['remarks']}", normal_style)]
-    ]
-    shipping_table = Table(shipping_data, colWidths=header_col_widths,
-                          style=[('BOX',(0,0),(-1,-1),1,colors.black),
-                                 ('LINEBEFORE',(1,0),(1,-1),1,colors.black),
-                                 ('VALIGN',(0,0),(-1,-1),'TOP'),
-                                 ('TOPPADDING',(0,0),(-1,-1),1),    # Minimal top padding
-                                 ('BOTTOMPADDING',(0,0),(-1,-1),1)]) # Minimal bottom padding
-    
-    # Set specific row heights to reduce spacing - reduced by 9 units total
-    shipping_table._argH[0] = 9   # Loading Country row (was 18, now 9)
-    shipping_table._argH[1] = 9   # Port of Loading row (was 18, now 9)
-    shipping_table._argH[2] = 9   # Agreed Shipment Date row (was 18, now 9)
-    shipping_table._argH[3] = 11  # Remarks row (was 20, now 11)
-    
-    elements.append(shipping_table)
-
-    # Combined Goods and Currency block (NO LINE BETWEEN ROWS)
-    combined_data = [
-        # Row 1: Description of goods (left), Currency on right
-        [Paragraph(f"<b>Description of goods:</b> {form_data['goods_desc']}", 
-                   ParagraphStyle('Goods', parent=normal_style, fontSize=7)), 
-         Paragraph("<b>CURRENCY: USD</b>", 
-                   ParagraphStyle('Currency', parent=normal_style, 
-                                  fontSize=8, alignment=TA_RIGHT, fontName='Helvetica-Bold'))]
-    ]
-    
-    combined_table = Table(combined_data, colWidths=header_col_widths,
-                           style=[
-                               # Outer border only - NO line between rows
-                               ('BOX',(0,0),(-1,-1),1,colors.black),
-                               ('LINEBEFORE',(1,0),(1,-1),1,colors.black),
-                               ('VALIGN',(0,0),(0,0),'TOP'),      # Description of goods - TOP alignment
-                               ('VALIGN',(1,0),(1,0),'BOTTOM')   # Currency - BOTTOM alignment
-                           ])
-    # Set row height
-    combined_table._argH[0] = 50  # Single row height
-    elements.append(combined_table)
-
-    # Product Table with additional empty rows
-    headers = ["STYLE NO.","ITEM DESCRIPTION","FABRIC TYPE\nKNITTED / WOVEN","H.S NO\n(8digit)",
-               "COMPOSITION OF\nMATERIAL","COUNTRY OF\nORIGIN","QTY","UNIT PRICE\nFOB","AMOUNT"]
-    table_data = [headers]
-
-    total_qty,total_amount = 0,0.0
-    for _,row in df.iterrows():
-        qty = int(row.get("QTY",0) or 0); price = float(row.get("UNIT PRICE",0.0) or 0.0)
-        amt = float(row.get("AMOUNT", qty*price) or (qty*price))
-        total_qty += qty; total_amount += amt
-        table_data.append([str(row.get("STYLE NO","")),str(row.get("ITEM DESCRIPTION","")),
-                           str(row.get("FABRIC TYPE","")),str(row.get("HS CODE","")),
-                           str(row.get("COMPOSITION","")),str(row.get("COUNTRY OF ORIGIN","")),
-                           f"{qty:,}",f"{price:.2f}",f"{amt:.2f}"])
-
-    # Add 5 empty rows for spacing
-    for i in range(5):
-        table_data.append(["","","","","","","","",""])
-
-    # Function for Indian number formatting
-    def indian_format(number):
-        """Format number with Indian comma placement (x,xx,xxx pattern)"""
-        if number == 0:
-            return "0.00"
-        
-        # Convert to string with 2 decimal places
-        num_str = f"{number:.2f}"
-        integer_part, decimal_part = num_str.split(".")
-        
-        # Reverse the integer part for easier processing
-        reversed_int = integer_part[::-1]
-        
-        # Add commas: first comma after 3 digits, then every 2 digits
-        formatted = ""
-        for i, digit in enumerate(reversed_int):
-            if i == 3:  # First comma after 3 digits
-                formatted = "," + formatted
-            elif i > 3 and (i - 3) % 2 == 0:  # Then every 2 digits
-                formatted = "," + formatted
-            formatted = digit + formatted
-        
-        return f"{formatted}.{decimal_part}"
-
-    # TOTAL row with Indian formatting
-    table_data.append(
-        ["Total","","","","","",f"{total_qty:,}","",f"USD            {indian_format(total_amount)}"]
-    )
-
-    product_table = Table(table_data,colWidths=product_col_widths, repeatRows=1)
-    product_table.setStyle(TableStyle([
-        ('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'),
-        ('FONTSIZE',(0,0),(-1,-1),6),
-        ('ALIGN',(0,0),(-1,-1),'CENTER'),
-        ('VALIGN',(0,0),(-1,-1),'MIDDLE'),
-        ('BOX',(0,0),(-1,-1),1,colors.black),
-        ('LINEBEFORE',(1,0),(1,-1),0.5,colors.black),
-        ('LINEBEFORE',(2,0),(2,-1),0.5,colors.black),
-        ('LINEBEFORE',(3,0),(3,-1),0.5,colors.black),
-        ('LINEBEFORE',(4,0),(4,-1),0.5,colors.black),
-        ('LINEBEFORE',(5,0),(5,-1),0.5,colors.black),
-        ('LINEBEFORE',(6,0),(6,-1),0.5,colors.black),
-        ('LINEBEFORE',(7,0),(7,-1),0.5,colors.black),
-        ('LINEBEFORE',(8,0),(8,-1),0.5,colors.black),
-        ('LINEBELOW',(0,0),(-1,0),0.5,colors.black),
-        ('LINEABOVE',(0,-1),(-1,-1),0.5,colors.black),
-        ('SPAN',(0,-1),(5,-1)),
-        ('ALIGN',(0,-1),(5,-1),'CENTER'),
-        ('SPAN',(6,-1),(7,-1)),
-        ('FONTNAME',(0,-1),(-1,-1),'Helvetica-Bold'),  # Make TOTAL row bold
-        ('WORDWRAP', (0,0), (-1,-1), 'CJK'),  # Enable text wrapping for all cells
-    ]))
-    elements.append(product_table)
-
-    # Signature block with e-stamp and total in words
-    total_words_str = num2words(round(total_amount), to='cardinal', lang='en').upper()
-    # Remove commas from the total in words
-    total_words_str = total_words_str.replace(",", "")
-    total_words_str = f"TOTAL IN WORDS: USD {total_words_str} DOLLARS"
-
-    signature_data = [
-        [Paragraph(total_words_str, ParagraphStyle('TotalWords', parent=styles['Normal'], fontName='Helvetica-Bold', fontSize=7, alignment=TA_LEFT)), ""],
-        [Paragraph("Terms & Conditions (If Any)", ParagraphStyle('TermsCompact', parent=normal_style, spaceBefore=-10)), ""],
-        [Image("https://raw.githubusercontent.com/dyas-ai/invoice-generator1/main/Screenshot%202025-09-06%20163303.png", width=2.4*inch, height=1.2*inch), ""],
-        ["", ""],  # Empty row for spacing
-        [Paragraph("Signed by …………………….(Affix Stamp here)", normal_style),
-         Paragraph("&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;for RNA Resources Group Ltd-Landmark (Babyshop)", normal_style)]
-    ]
-    signature_table = Table(signature_data, colWidths=header_col_widths,
-                            style=[('BOX',(0,0),(-1,-1),1,colors.black),
-                                   ('VALIGN',(0,-1),(-1,-1),'BOTTOM'),
-                                   ('SPAN',(0,0),(-1,0)),
-                                   ('BOTTOMPADDING',(0,2),(0,2),15),  # Add bottom padding to stamp row
-                                   ('LEFTPADDING',(0,2),(0,2),30),   # Add left padding to move stamp right
-                                   ('TOPPADDING',(0,1),(0,1),0),     # Zero top padding for Terms row
-                                   ('BOTTOMPADDING',(0,1),(0,1),0),  # Zero bottom padding for Terms row
-                                   ('TOPPADDING',(0,2),(0,2),40)])   # Increased top padding to push e-signature down more
-    
-    # Set specific row heights
-    signature_table._argH[1] = 4   # Keep the "Terms & Conditions" row small
-    signature_table._argH[2] = 120 # Increase e-signature row height further to restore original spacing
-    elements.append(signature_table)
-
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+import contextlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from cache import ParseCache, PdfCache
+from form_fields import FORM_DEFAULTS
+from metrics import REGISTRY, capture_profile, enable_metrics_log, start_metrics_server, trace_request
+from render_jobs import RenderPool, RenderQueueFull
+from session_store import SessionStore
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # ===== Streamlit App =====
 st.set_page_config(page_title="Proforma Invoice Generator", layout="centered")
@@ -584,27 +75,257 @@ st.markdown("""
 
 st.title("📄 Proforma Invoice Generator")
 
-uploaded_file = st.file_uploader("Upload Excel File", type=["xlsx"])
+@st.cache_resource
+def get_parse_cache():
+    """Process-wide parse cache shared by all sessions; set INVOICE_CACHE_DIR to keep entries on disk"""
+    return ParseCache(max_entries=int(os.environ.get("INVOICE_CACHE_ENTRIES", "32")),
+                      disk_dir=os.environ.get("INVOICE_CACHE_DIR") or None)
+
+@st.cache_resource
+def get_session_store():
+    """Order frames of all sessions under INVOICE_SESSION_MEMORY_MB; idle ones are compacted after
+    INVOICE_SESSION_IDLE_MINUTES and, over the budget, spilled to INVOICE_SESSION_SPILL_DIR"""
+    return SessionStore(max_memory_bytes=int(os.environ.get("INVOICE_SESSION_MEMORY_MB", "512")) * 1024 * 1024,
+                        idle_seconds=float(os.environ.get("INVOICE_SESSION_IDLE_MINUTES", "15")) * 60,
+                        spill_dir=os.environ.get("INVOICE_SESSION_SPILL_DIR") or None,
+                        expire_seconds=float(os.environ.get("INVOICE_SESSION_EXPIRE_HOURS", "24")) * 3600)
+
+def session_id():
+    ctx = get_script_run_ctx()
+    # Bare `python 8app.py` runs have no script context, and so a single session
+    return ctx.session_id if ctx is not None else "bare"
+
+@st.cache_resource
+def start_diagnostics():
+    """JSON stage log (INVOICE_METRICS_LOG=1) and /metrics endpoint (INVOICE_METRICS_PORT), once per server"""
+    REGISTRY.add_collector(get_session_store().prometheus_lines)
+    if os.environ.get("INVOICE_METRICS_LOG"):
+        enable_metrics_log()
+    port = os.environ.get("INVOICE_METRICS_PORT")
+    return start_metrics_server(int(port)) if port else None
+
+start_diagnostics()
+
+@st.cache_resource
+def get_pdf_cache():
+    """Rendered PDFs shared by all sessions; INVOICE_PDF_CACHE_DIR keeps them on disk, the *_MB variables bound it"""
+    return PdfCache(max_memory_bytes=int(os.environ.get("INVOICE_PDF_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+                    disk_dir=os.environ.get("INVOICE_PDF_CACHE_DIR") or None,
+                    max_disk_bytes=int(os.environ.get("INVOICE_PDF_CACHE_MB", "1024")) * 1024 * 1024)
+
+@st.cache_resource
+def get_render_pool():
+    """PDF worker pool shared by all sessions; INVOICE_RENDER_WORKERS and INVOICE_RENDER_QUEUE bound it"""
+    return RenderPool(max_workers=int(os.environ.get("INVOICE_RENDER_WORKERS", "2")),
+                      max_pending=int(os.environ.get("INVOICE_RENDER_QUEUE", "8")),
+                      pdf_cache=get_pdf_cache())
+
+@st.cache_resource
+def get_parse_executor():
+    """Processes that parse the sheets of a multi-sheet workbook side by side; None on a single CPU"""
+    workers = min(int(os.environ.get("INVOICE_PARSE_WORKERS", os.cpu_count() or 1)), 4)
+    if workers < 2:
+        return None
+    # Spawned like the render pool: forking the threaded Streamlit server can deadlock a child
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+# ===== Column Mapping Review =====
+def show_header_layout(layout, sheet_name=None):
+    """Which header each invoice column was read from, so a new buyer template can be checked"""
+    if layout["known"]:
+        status = f"known template, used {layout['hits']} time(s) before"
+    else:
+        status = "new template, please check"
+    with st.expander(f"🧭 Column mapping{f' of {sheet_name}' if sheet_name else ''} ({status})"):
+        st.dataframe([{"Invoice column": target,
+                       "Header": choice["header"] or "not found",
+                       "Matched on": choice["variant"] or "",
+                       "Other candidates": ", ".join(choice["alternatives"])}
+                      for target, choice in layout["choices"].items()],
+                     hide_index=True, use_container_width=True)
+        st.caption(f"Header row {layout['header_row'] + 1} · template {layout['fingerprint'][:12]}")
+
+# ===== Background PDF Job =====
+def show_render_job(job, file_name="proforma_invoice.pdf"):
+    """Progress, result or error of one of the session's PDF jobs"""
+    if job.status in ("queued", "running"):
+        label = "Waiting for a free worker…" if job.status == "queued" else f"Generating PDF ({job.lines:,} lines)…"
+        st.progress(job.progress(), text=label)
+        if job.status == "queued" and st.button("Cancel", key=f"cancel_render_{job.id}"):
+            job.cancel()
+    elif job.status == "done":
+        st.download_button(f"📥 Download {file_name}", data=job.pdf_bytes(), file_name=file_name, mime="application/pdf",
+                           key=f"download_render_{job.id}")
+        st.caption("Served from the PDF cache" if job.cached else f"Generated in {job.elapsed():.1f}s")
+    elif job.status == "failed":
+        st.error(f"❌ PDF generation failed: {job.future.exception()}")
+    else:
+        st.info("PDF generation cancelled")
+
+@st.fragment(run_every=1.0)
+def poll_render_jobs():
+    """Redraw the job statuses every second without rerunning the whole page"""
+    jobs = st.session_state.render_jobs
+    for file_name, job in jobs:
+        show_render_job(job, file_name)
+    if all(job.done() for _, job in jobs):
+        # A full rerun draws the finished jobs once and stops the polling
+        st.rerun()
+
+# ===== Invoice Details and Live Preview =====
+# Seconds the invoice fields must stay unchanged before the preview is redrawn; INVOICE_PREVIEW_DEBOUNCE overrides it
+PREVIEW_DEBOUNCE_SECONDS = float(os.environ.get("INVOICE_PREVIEW_DEBOUNCE", "0.4"))
+
+def invoice_list(working_df, form_data, orders, auto_extracted, per_sheet):
+    """[(file name, lines, form data)] of the invoices to build: one per sheet, or one for the whole order"""
+    from parsing import SHEET_COLUMN, sheet_form_data
+    if not per_sheet:
+        return [("proforma_invoice.pdf", working_df, form_data)]
+    # Each sheet's own lines, with form fields left at their pre-filled value following the sheet
+    return [(f"proforma_invoice_{name}.pdf",
+             working_df[working_df[SHEET_COLUMN] == name].drop(columns=SHEET_COLUMN).reset_index(drop=True),
+             sheet_form_data(form_data, auto_extracted, extracted))
+            for name, _, extracted in orders]
+
+def show_invoice_preview(working_df, invoices, choice=0):
+    """HTML preview of one invoice: redrawn at once for new lines, once typing settles for new fields"""
+    from invoice_preview import invoice_preview_html
+    from parsing import SHEET_COLUMN
+    file_name, lines, form_data = invoices[choice]
+    # The normalizer hands back the same working_df until the table is edited, so identity tells unchanged lines
+    last = get_session_store().get(session_id(), "invoice_preview")
+    placeholder = st.empty()
+    if last is not None and last["lines"] is working_df:
+        placeholder.html(last["html"])
+        if last["file_name"] == file_name and last["form_data"] == form_data:
+            return
+        # Only field edits are debounced; a table edit's rerun redraws at once so the edit never stalls
+        status = st.empty()
+        status.caption("⏳ Updating preview…")
+        time.sleep(PREVIEW_DEBOUNCE_SECONDS)
+        # Drawing anything lets Streamlit stop this run here if a newer edit came in while waiting
+        status.empty()
+    html = invoice_preview_html(lines, form_data, section_column=SHEET_COLUMN)
+    get_session_store().put(session_id(), "invoice_preview", {"lines": working_df, "file_name": file_name,
+                                                              "form_data": dict(form_data), "html": html})
+    placeholder.html(html)
+
+@st.fragment
+def invoice_details(working_df, orders, auto_extracted, per_sheet):
+    """Invoice fields with a live HTML preview; changing a field reruns only this fragment.
+
+    The PDF is not built here: "Generate PDF" hands the fields to a full
+    rerun (st.session_state.generate_form), which queues the build.
+    """
+    st.subheader("✍️ Enter Invoice Details")
+    # Use extracted values as defaults, but allow manual override
+    pi_number = st.text_input("PI No. & Date", value=auto_extracted.get('pi_number', FORM_DEFAULTS['pi_number']))
+    order_ref = st.text_input("Landmark order Reference", value=auto_extracted.get('order_ref', FORM_DEFAULTS['order_ref']))
+    buyer_name = st.text_input("Buyer Name", value=auto_extracted.get('buyer_name', FORM_DEFAULTS['buyer_name']))
+    brand_name = st.text_input("Brand Name", value=auto_extracted.get('brand_name', FORM_DEFAULTS['brand_name']))
+    consignee_name = st.text_input("Consignee Name", value="", placeholder="Enter consignee company name")
+    consignee_address = st.text_area("Consignee Address", value="", placeholder="Enter complete consignee address with city, country, postal code")
+    consignee_tel = st.text_input("Consignee Tel/Fax", value="", placeholder="Tel: +XXX X XXXXXXX, Fax: +XXX X XXXXXXX")
+    payment_term = st.text_input("Payment Term", value=FORM_DEFAULTS['payment_term'])
+    bank_beneficiary = st.text_input("Bank Beneficiary", value=FORM_DEFAULTS['bank_beneficiary'], placeholder="Enter beneficiary company name")
+    bank_account = st.text_input("Account No", value=FORM_DEFAULTS['bank_account'], placeholder="Enter bank account number")
+    bank_name = st.text_input("Bank Name", value=FORM_DEFAULTS['bank_name'], placeholder="Enter bank name")
+    bank_address = st.text_area("Bank Address", value=FORM_DEFAULTS['bank_address'], placeholder="Enter complete bank address with branch, city, country")
+    bank_swift = st.text_input("SWIFT", value=FORM_DEFAULTS['bank_swift'], placeholder="Enter SWIFT/BIC code (e.g., KKBKINBBCPC)")
+    bank_code = st.text_input("Bank Code", value=FORM_DEFAULTS['bank_code'], placeholder="Enter bank code/routing number")
+    loading_country = st.text_input("Loading Country", value=auto_extracted.get('loading_country', FORM_DEFAULTS['loading_country']))
+    port_loading = st.text_input("Port of Loading", value=auto_extracted.get('port_loading', FORM_DEFAULTS['port_loading']))
+    shipment_date = st.text_input("Agreed Shipment Date", value=auto_extracted.get('shipment_date', FORM_DEFAULTS['shipment_date']))
+    remarks = st.text_area("Remarks", value="", placeholder="Enter any additional remarks or special instructions (optional)")
+    goods_desc = st.text_input("Description of goods", value=auto_extracted.get('goods_desc', FORM_DEFAULTS['goods_desc']))
+
+    form_data = {"pi_number":pi_number,"order_ref":order_ref,"buyer_name":buyer_name,"brand_name":brand_name,
+                 "consignee_name":consignee_name,"consignee_address":consignee_address,"consignee_tel":consignee_tel,
+                 "payment_term":payment_term,"bank_beneficiary":bank_beneficiary,"bank_account":bank_account,
+                 "bank_name":bank_name,"bank_address":bank_address,"bank_swift":bank_swift,"bank_code":bank_code,
+                 "loading_country":loading_country,"port_loading":port_loading,"shipment_date":shipment_date,
+                 "remarks":remarks,"goods_desc":goods_desc}
+
+    with st.expander("👁️ Live preview", expanded=True):
+        invoices = invoice_list(working_df, form_data, orders, auto_extracted, per_sheet)
+        choice = 0
+        if len(invoices) > 1:
+            choice = st.selectbox("Invoice", range(len(invoices)), format_func=lambda i: invoices[i][0], key="preview_choice")
+        show_invoice_preview(working_df, invoices, choice)
+
+    if st.button("Generate PDF", type="primary"):
+        st.session_state.generate_form = form_data
+        st.rerun()
+
+# ===== Diagnostics Sidebar =====
+# A captured profile disarms the switch; widget state can only be reset before the widget is drawn
+if st.session_state.pop("disarm_profile", False):
+    st.session_state.profile_armed = False
+with st.sidebar:
+    st.subheader("🔧 Diagnostics")
+    show_timings = st.checkbox("Show pipeline timings", key="show_timings")
+    trace_memory = st.checkbox("Trace memory per stage (slower)", key="trace_memory")
+    profile_armed = st.checkbox("Capture cProfile of the next upload or PDF", key="profile_armed")
+
+# Every stage below reports into this run's trace; the except below keeps errors from skipping close()
+diagnostics = contextlib.ExitStack()
+profile = diagnostics.enter_context(capture_profile(profile_armed))
+trace = diagnostics.enter_context(trace_request("streamlit_run", trace_memory=trace_memory))
+
+# xls, xlsb and ods need python-calamine; without it the upload explains what to install
+uploaded_file = st.file_uploader("Upload Excel or CSV File", type=["xlsx", "xlsm", "xls", "xlsb", "ods", "csv"])
 if uploaded_file is not None:
+    # pandas-backed modules load with the first upload, so the empty page comes up without them
+    from parsing import SHEET_COLUMN, load_order_sheets, merge_sheet_details, merge_sheet_orders
+    from normalization import IncrementalNormalizer, plain_text_columns
     try:
-        df = preprocess_excel_flexible_auto(uploaded_file)
-        
-        # Extract invoice details from Excel
-        df_raw = pd.read_excel(uploaded_file, header=None)
-        auto_extracted = extract_invoice_details(df_raw)
+        # Parse and extract each sheet once per distinct file; reruns are served from the cache
+        orders = load_order_sheets(uploaded_file, get_parse_cache(), get_parse_executor())
+        # Keep the PI numbers generated for this upload across reruns, so submitting the same
+        # form again asks for the same invoice and is served from the PDF cache
+        if st.session_state.get("pi_numbers_file") != uploaded_file.name:
+            st.session_state.pi_numbers = {name: extracted["pi_number"] for name, _, extracted in orders}
+            st.session_state.pi_numbers_file = uploaded_file.name
+        orders = [(name, order_df, dict(extracted, pi_number=st.session_state.pi_numbers.get(name, extracted["pi_number"])))
+                  for name, order_df, extracted in orders]
+        per_sheet = False
+        if len(orders) > 1:
+            st.info(f"📑 {len(orders)} order sheets found: {', '.join(name for name, _, _ in orders)}")
+            per_sheet = st.radio("Invoices", ["One merged invoice with per-sheet subtotals", "One invoice per sheet"],
+                                 key="sheet_mode") == "One invoice per sheet"
+            # One editable table for all sheets, with the source sheet in the SHEET column
+            df = merge_sheet_orders(orders)
+            auto_extracted = merge_sheet_details(orders)
+        else:
+            _, df, auto_extracted = orders[0]
         
         st.write("### Preview of Processed Data")
+        for name, order_df, _ in orders:
+            if "header_layout" in order_df.attrs:
+                show_header_layout(order_df.attrs["header_layout"], name if len(orders) > 1 else None)
         
         # Always update session state with new file data when file is uploaded
         # Store the current file name to detect when a new file is uploaded
         current_file_name = uploaded_file.name
-        if 'current_file_name' not in st.session_state or st.session_state.current_file_name != current_file_name:
-            st.session_state.edited_df = df.copy()
+        # The session's frames live in the shared store, which may have released them while the session sat idle
+        store = get_session_store()
+        editor_df = store.get(session_id(), "edited_df")
+        if st.session_state.get("current_file_name") != current_file_name or editor_df is None:
+            if editor_df is None and st.session_state.get("current_file_name") == current_file_name:
+                st.info("ℹ️ This session was idle and its table was released to free server memory; "
+                        "it has been reloaded from the uploaded file.")
+            # Free text in the editor; categorical columns would only offer their existing values.
+            # plain_text_columns builds a new frame and nothing edits it in place, so no copy is needed
+            editor_df = plain_text_columns(df)
+            store.put(session_id(), "edited_df", editor_df)
             st.session_state.current_file_name = current_file_name
+            store.pop(session_id(), "normalizer")
+            st.session_state.pop("render_jobs", None)
+            store.pop(session_id(), "invoice_preview")
         
         # Editable data editor - disable on_change to prevent constant re-runs
         edited_df = st.data_editor(
-            st.session_state.edited_df,
+            editor_df,
             use_container_width=True,
             num_rows="dynamic",
             column_config={
@@ -612,125 +333,98 @@ if uploaded_file is not None:
                 "UNIT PRICE": st.column_config.NumberColumn("UNIT PRICE", format="%.2f"),
                 "AMOUNT": st.column_config.NumberColumn("AMOUNT", format="%.2f")
             },
-            disabled=["AMOUNT"],  # Make AMOUNT read-only since it's calculated
+            disabled=["AMOUNT", SHEET_COLUMN],  # Make AMOUNT read-only since it's calculated
             key="data_editor"
         )
         
-        # Calculate amounts for the current edited data with proper NaN handling
-        working_df = edited_df.copy()
-        
-        # Clean and handle NaN values before processing
-        for col in working_df.columns:
-            if col in ["QTY", "UNIT PRICE", "AMOUNT"]:
-                # Replace NaN with 0 for numeric columns
-                working_df[col] = working_df[col].fillna(0)
-            else:
-                # Replace NaN with empty string for text columns
-                working_df[col] = working_df[col].fillna("")
-        
-        # Convert numeric columns with proper error handling
-        working_df["QTY"] = pd.to_numeric(working_df["QTY"], errors="coerce").fillna(0).astype(int)
-        working_df["UNIT PRICE"] = pd.to_numeric(working_df["UNIT PRICE"], errors="coerce").fillna(0.0).astype(float)
+        # Clean, truncate and validate the edited rows for the invoice; only rows changed since the last rerun are redone
+        # A parked session lost its normalizer; a new one starts with a full pass
+        normalizer = store.get(session_id(), "normalizer") or IncrementalNormalizer()
+        working_df, rejected_df = normalizer.update(edited_df)
+        store.put(session_id(), "normalizer", normalizer)
+        if len(rejected_df):
+            with st.expander(f"⚠️ {len(rejected_df)} row(s) left off the invoice"):
+                st.dataframe(rejected_df, use_container_width=True)
         
-        # Add text truncation and abbreviations for long content
-        def truncate_text(text, max_length=15):
-            """Truncate text and add ellipsis if too long"""
-            if pd.isna(text) or text == "":
-                return ""
-            text = str(text).strip()
-            if len(text) <= max_length:
-                return text
-            return text[:max_length-3] + "..."
-        
-        # Common country abbreviations
-        country_abbreviations = {
-            "United States of America": "USA",
-            "United Kingdom": "UK", 
-            "United Arab Emirates": "UAE",
-            "Saudi Arabia": "KSA",
-            "South Africa": "ZA",
-            "New Zealand": "NZ"
-        }
-        
-        # Apply truncation and abbreviations with proper NaN handling
-        for idx, row in working_df.iterrows():
-            # Handle country names with abbreviations first
-            country = str(row.get("COUNTRY OF ORIGIN", "")).strip()
-            if country in country_abbreviations:
-                working_df.at[idx, "COUNTRY OF ORIGIN"] = country_abbreviations[country]
-            else:
-                working_df.at[idx, "COUNTRY OF ORIGIN"] = truncate_text(country, 12)
-            
-            # Truncate other long text fields
-            working_df.at[idx, "STYLE NO"] = truncate_text(row.get("STYLE NO", ""), 12)
-            working_df.at[idx, "ITEM DESCRIPTION"] = truncate_text(row.get("ITEM DESCRIPTION", ""), 18)
-            working_df.at[idx, "FABRIC TYPE"] = truncate_text(row.get("FABRIC TYPE", ""), 12)
-            working_df.at[idx, "COMPOSITION"] = truncate_text(row.get("COMPOSITION", ""), 15)
-        
-        # Calculate amounts after all cleaning is done
-        working_df["AMOUNT"] = working_df["QTY"] * working_df["UNIT PRICE"]
-        
-        # Remove rows where required fields are not filled (but allow zero values)
-        # Check if the original data had null/empty values before we filled them with defaults
-        rows_to_keep = []
-        for idx, row in edited_df.iterrows():
-            style_filled = pd.notna(row["STYLE NO"]) and str(row["STYLE NO"]).strip() != ""
-            qty_filled = pd.notna(row["QTY"])  # Allow 0 but not NaN/empty
-            price_filled = pd.notna(row["UNIT PRICE"])  # Allow 0.0 but not NaN/empty
-            
-            if style_filled and qty_filled and price_filled:
-                rows_to_keep.append(idx)
-        
-        # Keep only rows that have all required fields filled
-        if rows_to_keep:
-            working_df = working_df.iloc[rows_to_keep].reset_index(drop=True)
-        else:
-            # If no valid rows, return empty dataframe with correct columns
-            working_df = working_df.iloc[0:0]
-        
-        # Show summary statistics
-        total_qty = working_df["QTY"].sum()
-        total_amount = working_df["AMOUNT"].sum()
+        # Show summary statistics, kept up to date by the normalizer as rows change
+        total_qty = normalizer.total_qty
+        total_amount = normalizer.total_amount
         st.write(f"**Total Quantity:** {total_qty:,} | **Total Amount:** ${total_amount:,.2f}")
+        if SHEET_COLUMN in working_df.columns:
+            st.dataframe(working_df.groupby(SHEET_COLUMN, sort=False)[["QTY", "AMOUNT"]].sum(), use_container_width=True)
 
-        with st.form("invoice_form"):
-            st.subheader("✍️ Enter Invoice Details")
-            # Use extracted values as defaults, but allow manual override
-            pi_number = st.text_input("PI No. & Date", value=auto_extracted.get('pi_number', 'SAR/LG/XXXX Dt. 10/09/2025'))
-            order_ref = st.text_input("Landmark order Reference", value=auto_extracted.get('order_ref', 'CPO/47062/25'))
-            buyer_name = st.text_input("Buyer Name", value=auto_extracted.get('buyer_name', 'LANDMARK GROUP'))
-            brand_name = st.text_input("Brand Name", value=auto_extracted.get('brand_name', 'Juniors'))
-            consignee_name = st.text_input("Consignee Name", value="", placeholder="Enter consignee company name")
-            consignee_address = st.text_area("Consignee Address", value="", placeholder="Enter complete consignee address with city, country, postal code")
-            consignee_tel = st.text_input("Consignee Tel/Fax", value="", placeholder="Tel: +XXX X XXXXXXX, Fax: +XXX X XXXXXXX")
-            payment_term = st.text_input("Payment Term", value="T/T")
-            bank_beneficiary = st.text_input("Bank Beneficiary", value="SAR APPARELS INDIA PVT.LTD.", placeholder="Enter beneficiary company name")
-            bank_account = st.text_input("Account No", value="2112819952", placeholder="Enter bank account number")
-            bank_name = st.text_input("Bank Name", value="KOTAK MAHINDRA BANK", placeholder="Enter bank name")
-            bank_address = st.text_area("Bank Address", value="2 BRABOURNE ROAD, GOVIND BHAVAN, GROUND FLOOR, KOLKATA-700001", placeholder="Enter complete bank address with branch, city, country")
-            bank_swift = st.text_input("SWIFT", value="KKBKINBBCPC", placeholder="Enter SWIFT/BIC code (e.g., KKBKINBBCPC)")
-            bank_code = st.text_input("Bank Code", value="0323", placeholder="Enter bank code/routing number")
-            loading_country = st.text_input("Loading Country", value=auto_extracted.get('loading_country', 'India'))
-            port_loading = st.text_input("Port of Loading", value=auto_extracted.get('port_loading', 'Mumbai'))
-            shipment_date = st.text_input("Agreed Shipment Date", value=auto_extracted.get('shipment_date', '07/02/2025'))
-            remarks = st.text_area("Remarks", value="", placeholder="Enter any additional remarks or special instructions (optional)")
-            goods_desc = st.text_input("Description of goods", value=auto_extracted.get('goods_desc', 'Value Packs'))
-            submitted = st.form_submit_button("Generate PDF")
+        # Field edits rerun only the details fragment; the PDF build starts from a full rerun
+        invoice_details(working_df, orders, auto_extracted, per_sheet)
+        form_data = st.session_state.pop("generate_form", None)
+        submitted = form_data is not None
 
         if submitted:
             # Update session state only when form is submitted
-            st.session_state.edited_df = working_df
-            
-            form_data = {"pi_number":pi_number,"order_ref":order_ref,"buyer_name":buyer_name,"brand_name":brand_name,
-                         "consignee_name":consignee_name,"consignee_address":consignee_address,"consignee_tel":consignee_tel,
-                         "payment_term":payment_term,"bank_beneficiary":bank_beneficiary,"bank_account":bank_account,
-                         "bank_name":bank_name,"bank_address":bank_address,"bank_swift":bank_swift,"bank_code":bank_code,
-                         "loading_country":loading_country,"port_loading":port_loading,"shipment_date":shipment_date,
-                         "remarks":remarks,"goods_desc":goods_desc}
+            store.put(session_id(), "edited_df", working_df)
 
             # Use the working dataframe (with calculated amounts) for PDF generation
-            pdf_buffer = generate_proforma_invoice(working_df, form_data)
-            st.download_button("📥 Download Proforma Invoice PDF", data=pdf_buffer, file_name="proforma_invoice.pdf", mime="application/pdf")
+            invoices = invoice_list(working_df, form_data, orders, auto_extracted, per_sheet)
+
+            if profile_armed:
+                # Render inline so the captured profile includes the PDF build
+                from invoice_pdf import generate_proforma_invoice
+                for file_name, invoice_df, invoice_form in invoices:
+                    pdf_buffer = generate_proforma_invoice(invoice_df, invoice_form, section_column=SHEET_COLUMN)
+                    st.download_button(f"📥 Download {file_name}", data=pdf_buffer, file_name=file_name, mime="application/pdf")
+            else:
+                # Queue on the shared worker pool, one job per invoice; the job handles outlive this rerun
+                jobs = []
+                try:
+                    for file_name, invoice_df, invoice_form in invoices:
+                        jobs.append((file_name, get_render_pool().submit(invoice_df, invoice_form, section_column=SHEET_COLUMN)))
+                except RenderQueueFull as e:
+                    st.warning(f"⏳ {e}")
+                if jobs:
+                    st.session_state.render_jobs = jobs
+
+        jobs = st.session_state.get("render_jobs")
+        if jobs and not (submitted and profile_armed):
+            if all(job.done() for _, job in jobs):
+                for file_name, job in jobs:
+                    show_render_job(job, file_name)
+            else:
+                poll_render_jobs()
 
     except Exception as e:
         st.error(f"❌ Error: {e}")
+    finally:
+        # Also when st.rerun() ends the run early; its exception passes the handler above
+        diagnostics.close()
+
+diagnostics.close()
+
+# Keep a profile only from a run that parsed a file or built a PDF, not from the rerun that armed it
+if profile.profile is not None and trace.ran("read_excel", "read_csv", "doc_build"):
+    st.session_state.profile_dump = profile.dump()
+    st.session_state.profile_summary = profile.summary()
+    st.session_state.disarm_profile = True
+
+with st.sidebar:
+    if show_timings and trace.records:
+        st.write("**Pipeline timings**")
+        st.dataframe(trace.records, use_container_width=True, hide_index=True)
+        st.caption(f"Run total {trace.total_seconds:.3f}s · peak_mb from {trace.memory_source}")
+    cache_stats = get_pdf_cache().stats()
+    st.caption(f"PDF cache: {cache_stats['hits']} hit(s) · {cache_stats['misses']} miss(es) · "
+               f"{cache_stats['evictions']} evicted ({cache_stats['evicted_bytes'] / 1048576:.1f} MB) · "
+               f"{cache_stats['memory_entries']} in memory ({cache_stats['memory_bytes'] / 1048576:.1f} MB)"
+               + (f" · {cache_stats['disk_entries']} on disk ({cache_stats['disk_bytes'] / 1048576:.1f} MB)"
+                  if get_pdf_cache().disk_dir else ""))
+    store_stats = get_session_store().stats()
+    st.caption(f"Sessions: {store_stats['active_sessions']} active, {store_stats['parked_sessions']} compacted "
+               f"({store_stats['memory_bytes'] / 1048576:.1f} of {store_stats['max_memory_bytes'] / 1048576:.0f} MB, "
+               f"this one {get_session_store().session_bytes(session_id()) / 1048576:.1f} MB) · "
+               f"{store_stats['spilled_sessions']} on disk ({store_stats['spilled_bytes'] / 1048576:.1f} MB) · "
+               f"{store_stats['releases']} released")
+    if profile.skipped:
+        st.warning("Another request was being profiled; this run was not captured.")
+    if "profile_dump" in st.session_state:
+        st.download_button("📥 Download cProfile dump", data=st.session_state.profile_dump,
+                           file_name="invoice_request.prof", mime="application/octet-stream")
+        with st.expander("Top functions by cumulative time"):
+            st.code(st.session_state.profile_summary)
@@ -0,0 +1,74 @@
+import os
+import threading
+
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Flowable
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# E-stamp shown above the signature line; INVOICE_STAMP_PATH points at a replacement image
+STAMP_FILENAME = "Screenshot 2025-09-06 163303.png"
+STAMP_PATH_ENV = "INVOICE_STAMP_PATH"
+
+
+# ===== Asset Lookup =====
+def resolve_asset(filename, env_var=None):
+    """Path of a bundled asset, or of the file named by env_var when that is set"""
+    path = os.environ.get(env_var) if env_var else None
+    path = path or os.path.join(ASSET_DIR, filename)
+    if not os.path.isfile(path):
+        source = f" (set by {env_var})" if env_var and os.environ.get(env_var) else ""
+        raise FileNotFoundError(f"Invoice asset not found: {path}{source}")
+    return path
+
+
+# ===== Decoded Images =====
+class ImageAsset:
+    """An image read and decoded once, then drawn into any number of documents.
+
+    Drawing goes through canvas.drawImage, which embeds an image once per
+    document and points every later draw of it at the same XObject, so a
+    bundle of invoices still carries the stamp once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reader = ImageReader(path)
+        self.width, self.height = self.reader.getSize()
+        # Decode now, so no document pays for it
+        self.reader.getRGBData()
+
+    def draw_on(self, canv, x, y, width, height):
+        """Draw the image scaled to width x height with its lower left corner at (x, y)"""
+        canv.drawImage(self.reader, x, y, width, height, mask="auto")
+
+
+class AssetImage(Flowable):
+    """Platypus flowable drawing an ImageAsset at a fixed size"""
+
+    def __init__(self, asset, width, height, hAlign="CENTER"):
+        Flowable.__init__(self)
+        self.asset = asset
+        self.drawWidth = width
+        self.drawHeight = height
+        self.hAlign = hAlign
+
+    def wrap(self, availWidth, availHeight):
+        return self.drawWidth, self.drawHeight
+
+    def draw(self):
+        self.asset.draw_on(self.canv, 0, 0, self.drawWidth, self.drawHeight)
+
+
+_stamp = None
+_stamp_lock = threading.Lock()
+
+
+def get_stamp():
+    """The e-stamp ImageAsset, loaded from disk on first use and kept for the life of the process"""
+    global _stamp
+    if _stamp is None:
+        with _stamp_lock:
+            if _stamp is None:
+                _stamp = ImageAsset(resolve_asset(STAMP_FILENAME, STAMP_PATH_ENV))
+    return _stamp
@@ -0,0 +1,386 @@
+"""Render a batch of buyer PO workbooks to proforma invoice PDFs without the Streamlit UI.
+
+    python batch.py orders/ --defaults defaults.json --out-dir invoices
+    python batch.py "orders/2025-*.xlsx" --workers 4 --report month_end.csv
+
+The defaults file is a JSON object of form fields (see form_fields.FORM_DEFAULTS).
+Values extracted from each PO take precedence; the defaults file fills in the
+rest, e.g. consignee and bank details.
+
+Every sheet with a "Style" header row is rendered: by default into one merged
+invoice with a subtotal per sheet (--sheets merged), or with --sheets per-sheet
+into one PDF per sheet, named <workbook>_<sheet>.pdf when there are several.
+--sheets first keeps to the first sheet only.
+
+With --consolidate every PO (each sheet of each workbook) goes onto one invoice,
+<out-dir>/consolidated.pdf or <out-dir>/<name>.pdf for --consolidate <name>.
+Lines that match across POs are merged, and each PO is folded into the running
+totals as soon as it is parsed. The PO column of the lines lists where each came from.
+
+With --bundle the invoices are rendered as usual but written, in input order,
+into one PDF, <out-dir>/invoices.pdf or <out-dir>/<name>.pdf, that embeds the
+stamp and the fixed header blocks once for all of them.
+
+With --pdf-cache <dir> each rendered PDF is also kept in <dir> (up to
+--pdf-cache-mb, least recently used dropped first), and an invoice whose lines
+and form fields match one rendered before is copied from there instead.
+"""
+import argparse
+import csv
+import glob
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cache import pdf_cache_key, shared_pdf_cache
+from form_fields import FORM_DEFAULTS
+from ingest import read_workbook, supported_extensions
+from normalization import prepare_invoice_lines
+from parsing import (PO_COLUMN, SHEET_COLUMN, OrderConsolidator, extract_invoice_details, load_order_sheets,
+                     merge_sheet_details, merge_sheet_orders, order_source, preprocess_excel_flexible_auto)
+
+REPORT_FIELDS = ["file", "status", "pdf", "sheets", "rows", "parse_seconds", "render_seconds", "total_seconds",
+                 "cached", "error"]
+SHEET_MODES = ["merged", "per-sheet", "first"]
+
+
+# ===== Input Discovery =====
+def collect_inputs(patterns):
+    """Expand directories and glob patterns into a sorted, de-duplicated list of workbook and CSV paths"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            # Every format an installed reader can open, see ingest.select_readers
+            matches = [p for ext in supported_extensions() for p in glob.glob(os.path.join(pattern, f"*.{ext}"))]
+        else:
+            matches = glob.glob(pattern)
+        # Skip Excel lock files such as "~$order.xlsx"
+        paths.extend(p for p in matches if not os.path.basename(p).startswith("~$"))
+    return sorted(set(paths))
+
+
+def assign_output_paths(paths, out_dir):
+    """Map each input to <out_dir>/<name>.pdf, suffixing repeated names from different folders"""
+    outputs = {}
+    seen = {}
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        name = stem if seen[stem] == 1 else f"{stem}_{seen[stem]}"
+        outputs[path] = os.path.join(out_dir, f"{name}.pdf")
+    return outputs
+
+
+def build_form_data(extracted, defaults):
+    """Built-in defaults, overridden by the defaults file, overridden by values extracted from the PO"""
+    form_data = dict(FORM_DEFAULTS)
+    form_data.update(defaults)
+    form_data.update({k: v for k, v in extracted.items() if v not in (None, "")})
+    return form_data
+
+
+def sheet_pdf_path(pdf_path, sheet_name):
+    """<name>_<sheet>.pdf next to pdf_path, with the sheet name made safe for a file name"""
+    stem, ext = os.path.splitext(pdf_path)
+    return f"{stem}_{re.sub(r'[^A-Za-z0-9._-]+', '_', sheet_name).strip('_')}{ext}"
+
+
+def load_invoices(f, pdf_path, defaults, sheets="merged"):
+    """(invoices, order sheets found) for one workbook in the given --sheets mode.
+
+    invoices is a list of (pdf path, order lines, form data) to render.
+    """
+    if sheets == "first":
+        workbook = read_workbook(f)
+        df = preprocess_excel_flexible_auto(workbook)
+        return [(pdf_path, df, build_form_data(extract_invoice_details(workbook), defaults))], 1
+    # Batch workers already run one file per process, so the sheets of a file are parsed in turn
+    orders = load_order_sheets(f, None)
+    if sheets == "per-sheet" and len(orders) > 1:
+        invoices = [(sheet_pdf_path(pdf_path, name), df, build_form_data(extracted, defaults))
+                    for name, df, extracted in orders]
+    elif len(orders) == 1:
+        _, df, extracted = orders[0]
+        invoices = [(pdf_path, df, build_form_data(extracted, defaults))]
+    else:
+        invoices = [(pdf_path, merge_sheet_orders(orders), build_form_data(merge_sheet_details(orders), defaults))]
+    return invoices, len(orders)
+
+
+# ===== Worker =====
+def fail(report, e):
+    """Mark a report row failed with the exception, on one line"""
+    report["status"] = "failed"
+    report["pdf"] = ""
+    # Keep the report one line per file even for multi-line exception messages
+    report["error"] = f"{type(e).__name__}: {' '.join(str(e).split())}"
+
+
+def parse_invoices(path, pdf_path, defaults, sheets="merged"):
+    """Parse one PO into the invoices to render; never raises.
+
+    Returns (report row, [(pdf path, invoice lines, form data)]).
+    """
+    report = {"file": path, "status": "ok", "pdf": pdf_path, "sheets": 0, "rows": 0,
+              "parse_seconds": 0.0, "render_seconds": 0.0, "total_seconds": 0.0, "cached": 0, "error": ""}
+    start = time.perf_counter()
+    invoices = []
+    try:
+        with open(path, "rb") as f:
+            invoices, report["sheets"] = load_invoices(f, pdf_path, defaults, sheets)
+        invoices = [(out_path, prepare_invoice_lines(df), form_data) for out_path, df, form_data in invoices]
+        report["rows"] = sum(len(working_df) for _, working_df, _ in invoices)
+    except Exception as e:
+        fail(report, e)
+        invoices = []
+    report["parse_seconds"] = report["total_seconds"] = round(time.perf_counter() - start, 4)
+    return report, invoices
+
+
+def write_invoice(out_path, working_df, form_data, report, section_column=None, pdf_cache=None):
+    """Render one invoice to out_path, or copy it from pdf_cache (a (directory, max bytes) pair) when rendered before"""
+    from invoice_pdf import generate_proforma_invoice
+    if pdf_cache is None:
+        generate_proforma_invoice(working_df, form_data, section_column=section_column, output=out_path)
+        return
+    cache = shared_pdf_cache(*pdf_cache)
+    # Batch PI numbers are generated afresh on every parse, so they stay out of the key: a rerun
+    # over an unchanged PO gets back the invoice, and PI number, it was issued the first time
+    key = pdf_cache_key(working_df, {k: v for k, v in form_data.items() if k != "pi_number"}, section_column)
+    pdf = cache.get(key)
+    if pdf is None:
+        pdf = generate_proforma_invoice(working_df, form_data, section_column=section_column).getvalue()
+        cache.put(key, pdf)
+    else:
+        report["cached"] += 1
+    with open(out_path, "wb") as f:
+        f.write(pdf)
+
+
+def render_file(path, pdf_path, defaults, sheets="merged", pdf_cache=None):
+    """Parse one PO and write its PDF(s); never raises, returns a report row instead"""
+    report, invoices = parse_invoices(path, pdf_path, defaults, sheets)
+    if invoices:
+        parsed = time.perf_counter()
+        try:
+            for out_path, working_df, form_data in invoices:
+                write_invoice(out_path, working_df, form_data, report, SHEET_COLUMN, pdf_cache)
+            report["pdf"] = "; ".join(out_path for out_path, _, _ in invoices)
+        except Exception as e:
+            fail(report, e)
+        report["render_seconds"] = round(time.perf_counter() - parsed, 4)
+    report["total_seconds"] = round(report["parse_seconds"] + report["render_seconds"], 4)
+    return report
+
+
+# ===== Bundling =====
+def bundle_files(paths, pdf_path, defaults, sheets="merged", workers=1):
+    """Render every invoice of paths, in path order, into the one PDF at pdf_path; returns the report rows.
+
+    Workers parse ahead of the writer by at most two files each. Each
+    invoice is handed to the bundle as soon as its file is parsed and laid
+    out while the next one is read, so neither its order nor its flowables are held.
+    """
+    from invoice_pdf import InvoiceBundle
+    reports = []
+    with InvoiceBundle(pdf_path) as bundle:
+        def add(report, invoices):
+            started = time.perf_counter()
+            try:
+                for _, working_df, form_data in invoices:
+                    bundle.add(working_df, form_data, section_column=SHEET_COLUMN)
+                if invoices:
+                    report["pdf"] = pdf_path
+            except Exception as e:
+                fail(report, e)
+            report["render_seconds"] = round(time.perf_counter() - started, 4)
+            report["total_seconds"] = round(report["parse_seconds"] + report["render_seconds"], 4)
+            reports.append(report)
+            print(f"[{report['status']}] {report['file']}")
+
+        if workers <= 1:
+            for path in paths:
+                add(*parse_invoices(path, pdf_path, defaults, sheets))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                remaining = iter(paths)
+                for path in itertools.islice(remaining, 2 * workers):
+                    pending.append(pool.submit(parse_invoices, path, pdf_path, defaults, sheets))
+                while pending:
+                    result = pending.popleft().result()
+                    path = next(remaining, None)
+                    if path is not None:
+                        pending.append(pool.submit(parse_invoices, path, pdf_path, defaults, sheets))
+                    add(*result)
+    if not bundle.invoices and os.path.exists(pdf_path):
+        os.remove(pdf_path)
+    return reports
+
+
+# ===== Consolidation =====
+def parse_file(path, sheets="merged"):
+    """Parse one PO workbook for a consolidated invoice; never raises.
+
+    Returns (report row, [(PO label, order lines, extracted fields)]).
+    """
+    report = {"file": path, "status": "ok", "pdf": "", "sheets": 0, "rows": 0,
+              "parse_seconds": 0.0, "render_seconds": 0.0, "total_seconds": 0.0, "cached": 0, "error": ""}
+    start = time.perf_counter()
+    orders = []
+    try:
+        with open(path, "rb") as f:
+            sheet_orders = load_order_sheets(f, None)
+        if sheets == "first":
+            sheet_orders = sheet_orders[:1]
+        file_name = os.path.basename(path)
+        orders = [(order_source(extracted, file_name, name if len(sheet_orders) > 1 else None), df, extracted)
+                  for name, df, extracted in sheet_orders]
+        report["sheets"] = len(orders)
+        report["rows"] = sum(len(df) for _, df, _ in orders)
+    except Exception as e:
+        fail(report, e)
+    report["parse_seconds"] = report["total_seconds"] = round(time.perf_counter() - start, 4)
+    return report, orders
+
+
+def consolidate_files(paths, pdf_path, defaults, sheets="merged", workers=1, pdf_cache=None):
+    """Render every PO of paths onto one invoice at pdf_path; returns the report rows.
+
+    Each workbook's lines are folded into an OrderConsolidator as soon as it
+    is parsed, so only the running aggregate stays in memory. One row per
+    input file, plus one for the consolidated PDF itself.
+    """
+    consolidator = OrderConsolidator()
+    details = {}
+    reports = []
+
+    def fold(report, orders):
+        for source, df, extracted in orders:
+            consolidator.add(df, source)
+        details[report["file"]] = [(source, None, extracted) for source, _, extracted in orders]
+        if orders:
+            report["pdf"] = pdf_path
+        reports.append(report)
+        print(f"[{report['status']}] {report['file']}")
+
+    started = time.perf_counter()
+    if workers <= 1:
+        for path in paths:
+            fold(*parse_file(path, sheets))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in as_completed([pool.submit(parse_file, path, sheets) for path in paths]):
+                fold(*future.result())
+    parsed = time.perf_counter()
+
+    report = {"file": pdf_path, "status": "ok", "pdf": pdf_path, "sheets": len(consolidator), "rows": 0,
+              "parse_seconds": round(parsed - started, 4), "render_seconds": 0.0, "total_seconds": 0.0, "cached": 0,
+              "error": ""}
+    try:
+        if not len(consolidator):
+            raise ValueError("no PO could be read")
+        # Header fields from the inputs in path order, whatever order the workers finished in
+        orders = [order for path in paths for order in details.get(path, [])]
+        form_data = build_form_data(merge_sheet_details(orders), defaults)
+        # One run of lines per PO (or set of POs sharing a line), so each closes with its own subtotal
+        lines = consolidator.lines().sort_values(PO_COLUMN, kind="stable", ignore_index=True)
+        working_df = prepare_invoice_lines(lines)
+        report["rows"] = len(working_df)
+        write_invoice(pdf_path, working_df, form_data, report, PO_COLUMN, pdf_cache)
+    except Exception as e:
+        fail(report, e)
+    report["render_seconds"] = round(time.perf_counter() - parsed, 4)
+    report["total_seconds"] = round(time.perf_counter() - started, 4)
+    return reports + [report]
+
+
+# ===== Command Line =====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render PO workbooks to proforma invoice PDFs in parallel")
+    parser.add_argument("inputs", nargs="+", help="workbooks or CSV exports, directories or glob patterns")
+    parser.add_argument("--defaults", help="JSON file with default form field values")
+    parser.add_argument("--out-dir", default="invoices", help="directory for the generated PDFs")
+    parser.add_argument("--report", help="CSV report path (default: <out-dir>/report.csv)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: all cores)")
+    parser.add_argument("--sheets", choices=SHEET_MODES, default="merged",
+                        help="multi-sheet workbooks: one merged invoice, one per sheet, or the first sheet only")
+    parser.add_argument("--consolidate", nargs="?", const="consolidated", metavar="NAME",
+                        help="put every PO on one invoice, <out-dir>/NAME.pdf (default NAME: consolidated)")
+    parser.add_argument("--bundle", nargs="?", const="invoices", metavar="NAME",
+                        help="write every invoice into one PDF, <out-dir>/NAME.pdf (default NAME: invoices)")
+    parser.add_argument("--pdf-cache", metavar="DIR",
+                        help="reuse PDFs rendered before for unchanged orders, kept in DIR (not with --bundle)")
+    parser.add_argument("--pdf-cache-mb", type=int, default=1024, help="size limit of --pdf-cache (default: 1024)")
+    args = parser.parse_args(argv)
+    if args.consolidate and args.bundle:
+        parser.error("--consolidate and --bundle cannot be combined")
+    if args.pdf_cache and args.bundle:
+        parser.error("--pdf-cache does not apply to --bundle, whose invoices share one document")
+    pdf_cache = (args.pdf_cache, args.pdf_cache_mb * 1024 * 1024) if args.pdf_cache else None
+
+    defaults = {}
+    if args.defaults:
+        with open(args.defaults, encoding="utf-8") as f:
+            defaults = json.load(f)
+        unknown = set(defaults) - set(FORM_DEFAULTS)
+        if unknown:
+            parser.error(f"Unknown form fields in {args.defaults}: {', '.join(sorted(unknown))}")
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        parser.error("No workbooks or CSV files matched the given inputs")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    outputs = assign_output_paths(paths, args.out_dir)
+    report_path = args.report or os.path.join(args.out_dir, "report.csv")
+
+    started = time.perf_counter()
+    reports = []
+    if args.consolidate:
+        pdf_path = os.path.join(args.out_dir, f"{args.consolidate}.pdf")
+        reports = consolidate_files(paths, pdf_path, defaults, args.sheets, args.workers, pdf_cache)
+    elif args.bundle:
+        pdf_path = os.path.join(args.out_dir, f"{args.bundle}.pdf")
+        reports = bundle_files(paths, pdf_path, defaults, args.sheets, args.workers)
+    elif args.workers <= 1:
+        for path in paths:
+            reports.append(render_file(path, outputs[path], defaults, args.sheets, pdf_cache))
+            print(f"[{reports[-1]['status']}] {path}")
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(render_file, path, outputs[path], defaults, args.sheets, pdf_cache)
+                       for path in paths]
+            for future in as_completed(futures):
+                reports.append(future.result())
+                print(f"[{reports[-1]['status']}] {reports[-1]['file']}")
+
+    reports.sort(key=lambda r: r["file"])
+    with open(report_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(reports)
+
+    failed = sum(1 for r in reports if r["status"] != "ok")
+    if pdf_cache:
+        print(f"{sum(r['cached'] for r in reports)} invoice(s) copied from the PDF cache in {args.pdf_cache}")
+    if args.consolidate:
+        read = sum(1 for r in reports if r["file"] != pdf_path and r["status"] == "ok")
+        print(f"Consolidated {read}/{len(paths)} files into {pdf_path} in "
+              f"{time.perf_counter() - started:.1f}s; report written to {report_path}")
+    elif args.bundle:
+        print(f"Bundled {len(reports) - failed}/{len(reports)} files into {pdf_path} in "
+              f"{time.perf_counter() - started:.1f}s; report written to {report_path}")
+    else:
+        print(f"Rendered {len(reports) - failed}/{len(reports)} invoices in "
+              f"{time.perf_counter() - started:.1f}s; report written to {report_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Compare one PDF per invoice against a single bundled PDF for a bulk run.
+
+For each count of invoices (synthetic POs, cycling through a few orders):
+seconds, total bytes written and peak traced memory, rendering each invoice
+to its own file against writing all of them into one InvoiceBundle.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_bundle --invoices 10 50 200 --rows 40
+    python -m benchmarks.bench_bundle --invoices 10 100 1000 --rows 10 --bundle-only
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import make_po_workbook
+from form_fields import FORM_DEFAULTS
+from ingest import read_workbook
+from invoice_pdf import InvoiceBundle, generate_proforma_invoice
+from normalization import prepare_invoice_lines
+from parsing import preprocess_excel_flexible_auto
+
+
+def measure(write):
+    """(seconds, peak MB) of write()"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    write()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--invoices", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--rows", type=int, default=40, help="order lines per synthetic PO")
+    parser.add_argument("--orders", type=int, default=3, help="distinct orders to cycle through")
+    parser.add_argument("--bundle-only", action="store_true",
+                        help="skip the separate files, the slow side at large counts")
+    args = parser.parse_args()
+
+    orders = [prepare_invoice_lines(preprocess_excel_flexible_auto(read_workbook(io.BytesIO(
+        make_po_workbook(args.rows, seed=seed))))) for seed in range(1, args.orders + 1)]
+    # Warm the template and stamp so neither side pays for them
+    generate_proforma_invoice(orders[0], dict(FORM_DEFAULTS))
+
+    print(f"{'invoices':>8} | {'separate s':>10} {'MB on disk':>10} {'peak MB':>8} | "
+          f"{'bundle s':>8} {'MB on disk':>10} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as out_dir:
+        for count in args.invoices:
+            paths = [os.path.join(out_dir, f"invoice_{i}.pdf") for i in range(count)]
+            bundle_path = os.path.join(out_dir, "bundle.pdf")
+
+            def separate():
+                for i, path in enumerate(paths):
+                    generate_proforma_invoice(orders[i % len(orders)], dict(FORM_DEFAULTS), output=path)
+
+            def bundled():
+                with InvoiceBundle(bundle_path) as bundle:
+                    for i in range(count):
+                        bundle.add(orders[i % len(orders)], dict(FORM_DEFAULTS))
+
+            if args.bundle_only:
+                separate_columns = f"{'-':>10} {'-':>10} {'-':>8}"
+            else:
+                separate_s, separate_peak = measure(separate)
+                separate_mb = sum(os.path.getsize(p) for p in paths) / (1024 * 1024)
+                separate_columns = f"{separate_s:>10.2f} {separate_mb:>10.2f} {separate_peak:>8.1f}"
+                for path in paths:
+                    os.remove(path)
+            bundle_s, bundle_peak = measure(bundled)
+            bundle_mb = os.path.getsize(bundle_path) / (1024 * 1024)
+            print(f"{count:>8} | {separate_columns} | {bundle_s:>8.2f} {bundle_mb:>10.2f} {bundle_peak:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Time the post-edit normalization stage on growing numbers of order lines.
+
+Reports the full pass and, as the app sees it after one data_editor change,
+an IncrementalNormalizer update for a single edited cell.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_normalization --rows 1000 10000 100000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from normalization import IncrementalNormalizer, normalize_invoice_lines
+
+
+def make_edited_frame(rows, seed=0):
+    """Order lines shaped like st.data_editor output, with some blanks and long text"""
+    rng = np.random.default_rng(seed)
+    styles = np.array([f"ST{i:05d}" for i in range(max(rows // 10, 1))] + ["", "VERYLONGSTYLECODE-2025"], dtype=object)
+    df = pd.DataFrame({
+        "STYLE NO": styles[rng.integers(0, len(styles), rows)],
+        "ITEM DESCRIPTION": rng.choice(["Tee", "Long sleeve knitted romper set", "Shorts"], rows),
+        "FABRIC TYPE": rng.choice(["Knitted", "Knitted Jersey Fleece"], rows),
+        "HS CODE": "61112000",
+        "COMPOSITION": rng.choice(["100% Cotton", "60% Cotton 40% Polyester"], rows),
+        "COUNTRY OF ORIGIN": rng.choice(["India", "United Arab Emirates", "Bangladesh Republic"], rows),
+        "QTY": rng.integers(0, 500, rows).astype(float),
+        "UNIT PRICE": rng.choice([1.25, 2.5, 3.75], rows),
+        "AMOUNT": 0.0,
+    })
+    # Blank out roughly 1% of quantities and prices the way a user clearing cells would
+    df.loc[rng.random(rows) < 0.01, "QTY"] = np.nan
+    df.loc[rng.random(rows) < 0.01, "UNIT PRICE"] = np.nan
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'seconds':>9} {'us/row':>8} {'rejected':>9} {'1 edit':>9}")
+    for rows in args.rows:
+        df = make_edited_frame(rows)
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            _, rejected = normalize_invoice_lines(df)
+            best = min(best, time.perf_counter() - start)
+
+        normalizer = IncrementalNormalizer()
+        normalizer.update(df)
+        best_edit = float("inf")
+        for i in range(args.repeat):
+            edited = df.copy()
+            edited.iloc[i % rows, edited.columns.get_loc("QTY")] = 1000 + i
+            start = time.perf_counter()
+            normalizer.update(edited)
+            best_edit = min(best_edit, time.perf_counter() - start)
+            df = edited
+        print(f"{rows:>8} {best:>9.4f} {best / rows * 1e6:>8.2f} {len(rejected):>9} {best_edit:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
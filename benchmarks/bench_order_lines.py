@@ -0,0 +1,55 @@
+"""Time parsing of synthetic POs and measure the memory of the grouped order lines.
+
+For each size: preprocess time (clean + group), grouped lines, memory of the
+compact frame (categorical text, prices grouped as cents) against the same
+lines as plain strings, and how far a float sum of the line amounts drifts
+from the exact total in cents.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_order_lines --rows 1000 10000 100000
+"""
+import argparse
+import io
+import time
+from decimal import Decimal
+
+from benchmarks.synthetic import make_po_workbook
+from ingest import read_workbook
+from money import to_cents
+from normalization import plain_text_columns
+from parsing import preprocess_excel_flexible_auto
+
+
+def mb(df):
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'seconds':>9} {'lines':>7} {'compact MB':>11} {'text MB':>8} {'float drift':>12}")
+    for rows in args.rows:
+        workbook = read_workbook(io.BytesIO(make_po_workbook(rows, noise_cols=3)))
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            grouped = preprocess_excel_flexible_auto(workbook)
+            best = min(best, time.perf_counter() - start)
+
+        # Exact decimal total of the line amounts against a running float sum
+        amounts = grouped["AMOUNT"].tolist()
+        exact = sum(Decimal(int(cents)) for cents in to_cents(grouped["AMOUNT"])) / 100
+        float_total = 0.0
+        for amount in amounts:
+            float_total += amount
+        drift = abs(Decimal(float_total) - exact)
+        print(f"{rows:>8} {best:>9.4f} {len(grouped):>7} {mb(grouped):>11.2f} "
+              f"{mb(plain_text_columns(grouped)):>8.2f} {float(drift):>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
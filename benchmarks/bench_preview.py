@@ -0,0 +1,51 @@
+"""Time the HTML live preview against the full PDF build of the same invoice.
+
+For each size: the preview (header blocks, the first PREVIEW_ROWS lines and
+the totals) and generate_proforma_invoice on the same order lines, best of
+--repeat runs each.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_preview --rows 100 1000 10000
+"""
+import argparse
+import io
+import time
+
+from benchmarks.synthetic import make_po_workbook
+from form_fields import FORM_DEFAULTS
+from ingest import read_workbook
+from invoice_pdf import generate_proforma_invoice
+from invoice_preview import invoice_preview_html
+from normalization import prepare_invoice_lines
+from parsing import preprocess_excel_flexible_auto
+
+
+def best_of(repeat, func, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    form_data = dict(FORM_DEFAULTS, consignee_name="ACME Trading LLC")
+    print(f"{'rows':>8} {'lines':>7} {'preview ms':>11} {'PDF ms':>9}")
+    for rows in args.rows:
+        # One style per line, so the order keeps as many lines as rows
+        df = prepare_invoice_lines(preprocess_excel_flexible_auto(read_workbook(io.BytesIO(
+            make_po_workbook(rows, styles=rows)))))
+        preview = best_of(args.repeat, invoice_preview_html, df, form_data)
+        pdf = best_of(args.repeat, generate_proforma_invoice, df, form_data)
+        print(f"{rows:>8} {len(df):>7} {preview * 1000:>11.1f} {pdf * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Time every installed reader backend on synthetic POs, as xlsx and as CSV.
+
+For each size the same PO is read as xlsx by each Excel backend (openpyxl,
+and calamine when python-calamine is installed) and, exported to CSV, by the
+CSV backend with pandas' C parser and with pyarrow. Each reader's order lines
+are checked against the openpyxl ones, and the fastest reader per format is
+marked. The CSV rows also show where pyarrow overtakes the C parser, which
+sets ingest.PYARROW_CSV_MIN_BYTES.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_readers --rows 1000 10000 100000
+"""
+import argparse
+import datetime
+import io
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import make_po_workbook
+from ingest import CalamineReader, CsvReader, OpenpyxlReader, ParsedWorkbook
+from layouts import LayoutStore
+from normalization import plain_text_columns
+from parsing import preprocess_excel_flexible_auto
+
+
+def csv_export(workbook):
+    """The visible cells written the way Excel saves a sheet as CSV, dates as displayed"""
+    grid = workbook.visible_cells().map(lambda v: v.strftime("%d/%m/%Y") if isinstance(v, datetime.datetime) else v)
+    return grid.to_csv(header=False, index=False).encode("utf-8")
+
+
+def order_lines(cells, visible_rows):
+    workbook = ParsedWorkbook(cells, visible_rows)
+    return plain_text_columns(preprocess_excel_flexible_auto(workbook, layouts=LayoutStore()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    readers = [("xlsx", "openpyxl", OpenpyxlReader()), ("xlsx", "calamine", CalamineReader()),
+               ("csv", "csv (c)", CsvReader("c")), ("csv", "csv (pyarrow)", CsvReader("pyarrow"))]
+    print(f"{'rows':>8} {'format':>6} {'MB':>7} {'reader':>14} {'seconds':>9} {'lines ok':>9}")
+    for rows in args.rows:
+        xlsx = make_po_workbook(rows, noise_cols=3)
+        files = {"xlsx": xlsx}
+        expected = None
+        results = []
+        for file_format, label, reader in readers:
+            if not reader.available():
+                print(f"{rows:>8} {file_format:>6} {'':>7} {label:>14} {'not installed':>19}")
+                continue
+            if file_format == "csv" and "csv" not in files:
+                files["csv"] = csv_export(ParsedWorkbook(*OpenpyxlReader().read(xlsx)))
+            data = files[file_format]
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                cells, visible_rows = reader.read(data)
+                best = min(best, time.perf_counter() - start)
+            lines = order_lines(cells, visible_rows)
+            if expected is None:
+                expected = lines
+            try:
+                pd.testing.assert_frame_equal(lines, expected, check_dtype=False)
+                same = "yes"
+            except AssertionError:
+                same = "NO"
+            results.append((file_format, label, best))
+            print(f"{rows:>8} {file_format:>6} {len(data) / 1048576:>7.2f} {label:>14} {best:>9.4f} {same:>9}")
+        for file_format in files:
+            times = [(best, label) for f, label, best in results if f == file_format]
+            print(f"{'':>8} {file_format:>6} fastest: {min(times)[1]}")
+
+
+if __name__ == "__main__":
+    main()
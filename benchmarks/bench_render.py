@@ -0,0 +1,36 @@
+"""Time PDF rendering of large orders with the chunked and the single-table product table.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_render --rows 1000 10000 50000
+    python -m benchmarks.bench_render --rows 1000 3000 --mode single
+"""
+import argparse
+import time
+
+from benchmarks.bench_normalization import make_edited_frame
+from invoice_pdf import FORM_DEFAULTS, generate_proforma_invoice
+from normalization import prepare_invoice_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--mode", choices=["chunked", "single"], default="chunked",
+                        help="chunked: per-page tables with subtotals; single: one long reportlab Table")
+    args = parser.parse_args()
+
+    # Warm up the template and stamp so the first size isn't charged for them
+    generate_proforma_invoice(prepare_invoice_lines(make_edited_frame(10)), dict(FORM_DEFAULTS))
+
+    print(f"{'lines':>8} {'seconds':>9} {'ms/line':>8} {'KB':>8}")
+    for rows in args.rows:
+        df = prepare_invoice_lines(make_edited_frame(rows))
+        start = time.perf_counter()
+        pdf = generate_proforma_invoice(df, dict(FORM_DEFAULTS), large_order=args.mode == "chunked")
+        elapsed = time.perf_counter() - start
+        print(f"{len(df):>8} {elapsed:>9.2f} {elapsed / len(df) * 1e3:>8.3f} {len(pdf.getvalue()) // 1024:>8}")
+
+
+if __name__ == "__main__":
+    main()
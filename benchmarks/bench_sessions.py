@@ -0,0 +1,98 @@
+"""Memory of many app sessions in the session store, under a budget.
+
+Each simulated session uploads the same synthetic PO and holds what the page
+keeps between reruns: the editor's table, the incremental normalizer and the
+preview. The report gives the bytes of one session as the page holds it and
+once parked, the store's totals after every session has been served once,
+and the time to bring each session back, which also checks that its table
+comes back unchanged.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_sessions --sessions 20 --rows 10000 --budget-mb 64
+    python -m benchmarks.bench_sessions --spill-dir /tmp/invoice_sessions
+"""
+import argparse
+import io
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import make_po_workbook
+from ingest import read_workbook
+from normalization import IncrementalNormalizer, plain_text_columns
+from parsing import preprocess_excel_flexible_auto
+from session_store import SessionStore, compact_frame, value_bytes
+
+
+def serve(store, session_id, df):
+    """One rerun of the page for session_id: table, normalizer and preview into the store"""
+    editor_df = store.get(session_id, "edited_df")
+    if editor_df is None:
+        editor_df = plain_text_columns(df)
+        store.put(session_id, "edited_df", editor_df)
+    normalizer = store.get(session_id, "normalizer") or IncrementalNormalizer()
+    working_df, _ = normalizer.update(editor_df)
+    store.put(session_id, "normalizer", normalizer)
+    store.put(session_id, "invoice_preview", {"lines": working_df, "html": ""})
+    return editor_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=10000, help="order lines per session")
+    parser.add_argument("--budget-mb", type=float, default=64)
+    parser.add_argument("--spill-dir", help="spill over-budget sessions here; a temporary directory by default")
+    parser.add_argument("--no-spill", action="store_true", help="release over-budget sessions instead of spilling")
+    args = parser.parse_args()
+
+    df = preprocess_excel_flexible_auto(read_workbook(io.BytesIO(make_po_workbook(args.rows, styles=args.rows))))
+    spill_dir = None if args.no_spill else (args.spill_dir or tempfile.mkdtemp(prefix="invoice_sessions_"))
+    # Every session but the one being served counts as idle, so each is parked as soon as another is served
+    store = SessionStore(max_memory_bytes=int(args.budget_mb * 1024 * 1024), idle_seconds=0, spill_dir=spill_dir)
+
+    originals = {}
+    start = time.perf_counter()
+    for i in range(args.sessions):
+        originals[f"s{i}"] = serve(store, f"s{i}", df)
+    served = time.perf_counter() - start
+
+    one = store.session_bytes(f"s{args.sessions - 1}")
+    parked = value_bytes(compact_frame(originals["s0"])[0])
+    print(f"{len(df):,} order lines per session, {args.sessions} sessions, budget {args.budget_mb:g} MB, "
+          f"{'spill to ' + spill_dir if spill_dir else 'no spill directory'}")
+    print(f"one session: {one / 1048576:.1f} MB served, {parked / 1048576:.1f} MB parked")
+    stats = store.stats()
+    print(f"after serving all: {stats['memory_bytes'] / 1048576:.1f} MB in memory "
+          f"({stats['active_sessions']} active, {stats['parked_sessions']} parked), "
+          f"{stats['spilled_sessions']} spilled ({stats['spilled_bytes'] / 1048576:.1f} MB on disk), "
+          f"{stats['releases']} released; without the store {one * args.sessions / 1048576:.1f} MB; "
+          f"{served / args.sessions * 1000:.0f} ms per first visit")
+
+    restored = same = 0
+    start = time.perf_counter()
+    for session_id, original in originals.items():
+        editor_df = store.get(session_id, "edited_df")
+        if editor_df is None:
+            continue
+        restored += 1
+        try:
+            pd.testing.assert_frame_equal(editor_df, original)
+            same += 1
+        except AssertionError:
+            pass
+    seconds = time.perf_counter() - start
+    stats = store.stats()
+    print(f"brought back {restored} session(s), {same} unchanged, "
+          f"{seconds / max(restored, 1) * 1000:.1f} ms each; {stats['memory_bytes'] / 1048576:.1f} MB in memory")
+    if spill_dir and not args.spill_dir:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return 0 if same == restored else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Measure the cold-start import time of each entry point against a budget.
+
+Every target is imported in a fresh `python -X importtime` interpreter, best of
+--repeat runs. The report gives the total import time, the packages that cost
+the most, and which heavy dependencies were loaded at all. The "app" target
+runs the imports at the top of 8app.py, since the script itself only runs under
+Streamlit. Exits 1 when a target is over its budget.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --budget 800 --repeat 5 --top 8
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds of imports each entry point may take on a cold start
+BUDGETS_MS = {
+    "app": 900,
+    "batch": 1200,
+    "service": 250,
+    "render worker": 1200,
+}
+
+# Loaded only on the code path that needs them; listed when a target pulls them in anyway
+HEAVY_MODULES = ["pandas", "reportlab", "num2words", "openpyxl", "streamlit"]
+
+
+def app_imports():
+    """The import statements at the top level of 8app.py"""
+    with open(os.path.join(ROOT, "8app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def targets():
+    return {
+        "app": app_imports(),
+        "batch": "import batch",
+        "service": "import service",
+        "render worker": "import render_jobs; render_jobs._warm_worker()",
+    }
+
+
+def import_profile(code):
+    """({package: self microseconds}, total microseconds, heavy modules loaded) for code run in a fresh interpreter"""
+    probe = f"{code}\nimport sys\nprint(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    packages = {}
+    for line in result.stderr.splitlines():
+        # "import time:      self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    loaded = [m for m in result.stdout.strip().splitlines()[-1].split(",") if m] if result.stdout.strip() else []
+    return packages, sum(packages.values()), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5, help="heaviest packages listed per target")
+    parser.add_argument("--budget", type=float, help="one budget in ms for every target, instead of BUDGETS_MS")
+    parser.add_argument("targets", nargs="*", help=f"subset of: {', '.join(targets())}")
+    args = parser.parse_args()
+
+    over = []
+    for name, code in targets().items():
+        if args.targets and name not in args.targets:
+            continue
+        # Best of several runs; the first may also be compiling .pyc files
+        packages, total, loaded = min((import_profile(code) for _ in range(args.repeat)), key=lambda run: run[1])
+        budget = args.budget or BUDGETS_MS[name]
+        status = "ok" if total / 1000 <= budget else "OVER"
+        if status == "OVER":
+            over.append(name)
+        print(f"[{status}] {name}: {total / 1000:.0f} ms of imports (budget {budget:.0f} ms); "
+              f"loads {', '.join(loaded) or 'none of ' + '/'.join(HEAVY_MODULES)}")
+        for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"    {package:<24} {self_us / 1000:>8.1f} ms")
+
+    if over:
+        print(f"Over budget: {', '.join(over)}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
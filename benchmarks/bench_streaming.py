@@ -0,0 +1,77 @@
+"""Peak memory and time of the whole-sheet parse against the streaming parse.
+
+For each size the same synthetic PO (xlsx, and exported to CSV) is parsed
+into order lines twice: read whole with read_workbook and
+preprocess_excel_flexible_auto, and chunk by chunk with stream_workbook and
+preprocess_streaming. Peak memory is the tracemalloc peak of the parse, the
+file's own bytes excluded; --styles fixes the distinct styles so the rows can
+grow while the aggregate stays the same size.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_streaming --rows 10000 100000 --styles 500
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.bench_readers import csv_export
+from benchmarks.synthetic import make_po_workbook
+from ingest import CHUNK_ROWS, OpenpyxlReader, ParsedWorkbook, read_workbook, stream_workbook
+from layouts import LayoutStore
+from parsing import preprocess_excel_flexible_auto, preprocess_streaming
+
+
+def whole(data, file_name, chunk_rows):
+    return preprocess_excel_flexible_auto(read_workbook(io.BytesIO(data), file_name=file_name), layouts=LayoutStore())
+
+
+def streamed(data, file_name, chunk_rows):
+    head, chunks = stream_workbook(io.BytesIO(data), file_name=file_name, chunk_rows=chunk_rows)
+    return preprocess_streaming(head, chunks, layouts=LayoutStore())
+
+
+def measure(parse, data, file_name, chunk_rows):
+    """(order lines, seconds, peak MB)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    lines = parse(data, file_name, chunk_rows)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return lines, seconds, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--styles", type=int, default=500, help="distinct style codes per PO")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'format':>6} {'mode':>9} {'seconds':>9} {'peak MB':>9} {'lines':>7} {'same':>5}")
+    for rows in args.rows:
+        xlsx = make_po_workbook(rows, noise_cols=3, styles=args.styles)
+        files = [("xlsx", "po.xlsx", xlsx),
+                 ("csv", "po.csv", csv_export(ParsedWorkbook(*OpenpyxlReader().read(xlsx))))]
+        for file_format, file_name, data in files:
+            expected = None
+            for mode, parse in [("whole", whole), ("streamed", streamed)]:
+                lines, seconds, peak = measure(parse, data, file_name, args.chunk_rows)
+                same = ""
+                if expected is None:
+                    expected = lines
+                else:
+                    try:
+                        pd.testing.assert_frame_equal(lines, expected)
+                        same = "yes"
+                    except AssertionError:
+                        same = "NO"
+                print(f"{rows:>8} {file_format:>6} {mode:>9} {seconds:>9.3f} {peak:>9.1f} {len(lines):>7} {same:>5}")
+
+
+if __name__ == "__main__":
+    main()
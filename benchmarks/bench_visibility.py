@@ -0,0 +1,65 @@
+"""Compare the streaming row-visibility scanner with the openpyxl full load.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_visibility --rows 10000 50000 100000
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import openpyxl
+
+from ingest import get_visible_rows_openpyxl, get_visible_rows_streaming
+
+
+def make_sheet(rows, cols=12, hidden_every=7):
+    """Build an xlsx in memory with every hidden_every-th row hidden"""
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    for row_num in range(1, rows + 1):
+        if row_num % hidden_every == 0:
+            worksheet.row_dimensions[row_num].hidden = True
+            worksheet.row_dimensions[row_num].outlineLevel = 1
+    for row_num in range(1, rows + 1):
+        worksheet.append([f"ST{row_num % 500}", "Knitted Tee", "100% Cotton", 2.5, row_num % 90]
+                         + [f"noise {c}" for c in range(cols - 5)])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def measure(func, data):
+    """Return (result, seconds, peak traced MB); timing and memory come from separate runs"""
+    start = time.perf_counter()
+    result = func(io.BytesIO(data))
+    elapsed = time.perf_counter() - start
+
+    # tracemalloc slows allocation-heavy code down a lot, so keep it out of the timed run
+    tracemalloc.start()
+    func(io.BytesIO(data))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--cols", type=int, default=12)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'backend':<10} {'seconds':>9} {'peak MB':>9}")
+    for rows in args.rows:
+        data = make_sheet(rows, args.cols)
+        baseline, base_s, base_mb = measure(get_visible_rows_openpyxl, data)
+        streamed, stream_s, stream_mb = measure(get_visible_rows_streaming, data)
+        if streamed != baseline:
+            raise SystemExit(f"Visible rows differ for {rows} rows")
+        print(f"{rows:>8} {'openpyxl':<10} {base_s:>9.3f} {base_mb:>9.1f}")
+        print(f"{rows:>8} {'streaming':<10} {stream_s:>9.3f} {stream_mb:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Exercise the HTTP rendering service end to end on localhost.
+
+Starts service.py in this process on a free port (or targets --url), then
+checks health, both request formats, a multi-sheet workbook, the PDF cache,
+client errors, 429 backpressure under a burst of concurrent renders, and the
+metrics endpoint. Exits 1 on any failure.
+
+    python -m benchmarks.service_harness
+    python -m benchmarks.service_harness --burst 12 --rows 2000
+    python -m benchmarks.service_harness --url http://127.0.0.1:8502
+"""
+import argparse
+import base64
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synthetic import make_po_workbook
+
+
+def request(url, data=None, headers=None, timeout=600):
+    """(status, headers, body) without raising on HTTP error statuses"""
+    req = urllib.request.Request(url, data=data, headers=headers or {}, method="POST" if data is not None else "GET")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+def post_json(base, workbook, form=None):
+    body = json.dumps({"workbook": base64.b64encode(workbook).decode("ascii"), "form": form or {}}).encode("utf-8")
+    return request(f"{base}/render", body, {"Content-Type": "application/json"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="an already running service; by default one is started here")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--queue", type=int, default=2)
+    parser.add_argument("--burst", type=int, default=8, help="concurrent distinct renders to send at once")
+    parser.add_argument("--rows", type=int, default=1000, help="order lines per synthetic PO")
+    args = parser.parse_args()
+
+    server = None
+    base = args.url
+    if base is None:
+        from service import make_server
+        cache_dir = tempfile.mkdtemp(prefix="invoice_pdf_cache_")
+        server = make_server(port=0, workers=args.workers, queue=args.queue, pdf_cache=(cache_dir, 64 * 1024 * 1024))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Service at {base}")
+
+    failures = []
+
+    def check(name, ok, detail=""):
+        print(f"[{'ok' if ok else 'FAIL'}] {name}{f' - {detail}' if detail else ''}")
+        if not ok:
+            failures.append(name)
+
+    status, headers, body = request(f"{base}/healthz")
+    check("GET /healthz", status == 200 and json.loads(body)["status"] == "ok", body.decode()[:120])
+
+    workbook = make_po_workbook(args.rows, noise_cols=3)
+    start = time.perf_counter()
+    status, headers, body = post_json(base, workbook, {"consignee_name": "ACME Trading LLC"})
+    check("POST /render (JSON)", status == 200 and body.startswith(b"%PDF"),
+          f"{status}, {headers.get('X-Invoice-Lines')} lines, {len(body) // 1024} KB in {time.perf_counter() - start:.2f}s")
+
+    status, headers, body = request(f"{base}/render", workbook,
+                                    {"Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                                     "X-Invoice-Form": json.dumps({"remarks": "raw upload"})})
+    check("POST /render (raw xlsx)", status == 200 and body.startswith(b"%PDF"), str(status))
+
+    status, headers, body = post_json(base, make_po_workbook(args.rows // 3 or 1, sheets=3, notes=True))
+    check("POST /render (3 PO sheets + notes)", status == 200 and headers.get("X-Invoice-Sheets") == "3",
+          f"{status}, {headers.get('X-Invoice-Sheets')} sheets, {headers.get('X-Invoice-Lines')} lines")
+
+    if server is not None:
+        form = {"consignee_name": "ACME Trading LLC", "pi_number": "SAR/LG/0001 Dt. 01/10/2025"}
+        first = post_json(base, workbook, form)
+        again = post_json(base, workbook, form)
+        check("repeated render served from the PDF cache",
+              again[1].get("X-Invoice-Cache") == "hit" and again[2] == first[2],
+              f"{first[1].get('X-Invoice-Cache')} then {again[1].get('X-Invoice-Cache')}, "
+              f"{float(first[1]['X-Render-Seconds']):.2f}s then {float(again[1]['X-Render-Seconds']):.2f}s")
+
+    status, _, body = post_json(base, b"not a workbook")
+    check("unreadable workbook -> 422", status == 422, body.decode()[:120])
+    status, _, body = post_json(base, workbook, {"no_such_field": "x"})
+    check("unknown form field -> 400", status == 400, body.decode()[:120])
+    status, _, body = request(f"{base}/render", b"{", {"Content-Type": "application/json"})
+    check("malformed JSON -> 400", status == 400, body.decode()[:120])
+
+    # Distinct orders so none of the burst is de-duplicated into another's job
+    orders = [make_po_workbook(args.rows, seed=seed) for seed in range(1, args.burst + 1)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.burst) as senders:
+        results = list(senders.map(lambda wb: post_json(base, wb), orders))
+    elapsed = time.perf_counter() - start
+    codes = [status for status, _, _ in results]
+    rejected = [headers for status, headers, _ in results if status == 429]
+    check("burst: every request answered 200 or 429", set(codes) <= {200, 429}, str(codes))
+    if server is not None and args.burst > args.queue:
+        check("burst: saturated queue answers 429", bool(rejected), f"{len(rejected)}/{args.burst} rejected")
+    if rejected:
+        check("429 carries queue headers", all("X-Queue-Depth" in h and "Retry-After" in h for h in rejected),
+              f"depth {rejected[0].get('X-Queue-Depth')}/{rejected[0].get('X-Queue-Limit')}")
+    print(f"       burst of {args.burst}: {codes.count(200)} rendered, {len(rejected)} rejected in {elapsed:.2f}s")
+
+    status, _, body = request(f"{base}/metrics")
+    text = body.decode()
+    check("GET /metrics", status == 200 and "invoice_stage_seconds_total" in text
+          and "invoice_service_queue_depth" in text
+          and (server is None or "invoice_pdf_cache_hits_total" in text), f"{len(text.splitlines())} lines")
+
+    if server is not None:
+        server.shutdown()
+        server.service.pool.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    print("All checks passed" if not failures else f"{len(failures)} check(s) failed: {', '.join(failures)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Time each stage of the invoice pipeline on synthetic POs and save the results.
+
+Run from the repository root:
+
+    python -m benchmarks.suite                                  # sizes 100, 1000, 10000
+    python -m benchmarks.suite --rows 1000 5000 --noise-cols 8
+    python -m benchmarks.suite --compare benchmarks/results/baseline.json
+
+Results go to benchmarks/results/<label>.json (label defaults to the current
+git commit). --compare prints each stage against an earlier results file and
+exits with status 1 when a stage got slower than --threshold.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.synthetic import make_po_workbook
+from ingest import get_visible_rows_openpyxl, read_workbook
+from invoice_pdf import FORM_DEFAULTS, generate_proforma_invoice
+from normalization import prepare_invoice_lines
+from parsing import extract_invoice_details, preprocess_excel_flexible_auto
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def git_revision():
+    """Short hash of the checked-out commit, or "unknown" outside a git checkout"""
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(RESULTS_DIR), timeout=10)
+        return out.stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def best_of(repeat, func, *args):
+    """Return (last result, fastest wall time in seconds over repeat calls)"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def run_size(rows, noise_cols, repeat):
+    """Time every stage on one synthetic PO; returns {stage: seconds} plus row counts"""
+    data = make_po_workbook(rows, noise_cols=noise_cols)
+    form_data = dict(FORM_DEFAULTS)
+
+    stages = {}
+    visible, stages["get_visible_rows_openpyxl"] = best_of(repeat, get_visible_rows_openpyxl, io.BytesIO(data))
+    workbook, stages["read_workbook"] = best_of(repeat, read_workbook, io.BytesIO(data))
+    # visible_cells() is memoized on the workbook, so filter once up front and time the parse itself
+    workbook.visible_cells()
+    df, stages["preprocess_excel_flexible_auto"] = best_of(repeat, preprocess_excel_flexible_auto, workbook)
+    _, stages["extract_invoice_details"] = best_of(repeat, extract_invoice_details, workbook)
+    lines = prepare_invoice_lines(df)
+    _, stages["generate_proforma_invoice"] = best_of(repeat, generate_proforma_invoice, lines, form_data)
+    return {
+        "rows": rows,
+        "visible_rows": len(visible),
+        "invoice_lines": len(lines),
+        "seconds": {stage: round(seconds, 5) for stage, seconds in stages.items()},
+    }
+
+
+def compare(current, previous, threshold):
+    """Print stage timings against an earlier run; returns the number of regressions"""
+    before = {r["rows"]: r["seconds"] for r in previous["results"]}
+    regressions = 0
+    print(f"\nAgainst {previous['label']} ({previous['revision']}, {previous['timestamp']}):")
+    for result in current["results"]:
+        old = before.get(result["rows"])
+        if old is None:
+            continue
+        for stage, seconds in result["seconds"].items():
+            if stage not in old or not old[stage]:
+                continue
+            ratio = seconds / old[stage]
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{result['rows']:>8} {stage:<32} {old[stage]:>9.4f} -> {seconds:>9.4f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--noise-cols", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest is kept")
+    parser.add_argument("--label", help="results file name (default: current git commit)")
+    parser.add_argument("--out-dir", default=RESULTS_DIR)
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="slowdown ratio above which --compare reports a regression (default 0.25)")
+    args = parser.parse_args()
+
+    revision = git_revision()
+    report = {
+        "label": args.label or revision,
+        "revision": revision,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "noise_cols": args.noise_cols,
+        "repeat": args.repeat,
+        "results": [],
+    }
+
+    # Build the invoice template and load the stamp before the first timed render
+    generate_proforma_invoice(prepare_invoice_lines(
+        preprocess_excel_flexible_auto(read_workbook(io.BytesIO(make_po_workbook(10))))), dict(FORM_DEFAULTS))
+
+    print(f"{'rows':>8} {'stage':<32} {'seconds':>9}")
+    for rows in args.rows:
+        result = run_size(rows, args.noise_cols, args.repeat)
+        report["results"].append(result)
+        for stage, seconds in result["seconds"].items():
+            print(f"{rows:>8} {stage:<32} {seconds:>9.4f}")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    path = os.path.join(args.out_dir, f"{report['label']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        if compare(report, previous, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
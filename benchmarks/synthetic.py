@@ -0,0 +1,150 @@
+"""Synthetic buyer PO workbooks for benchmarks.
+
+The layout follows the buyer sheets the app is built for: a buyer name and an
+"Order No :" / "Texture :" metadata block, stacked headers over a "Style" row,
+order lines with some hidden rows, periodic total rows and trailing
+total/remark rows. Extra noise columns with headers the column map ignores
+can be mixed in, and a workbook can hold several PO sheets plus a notes sheet
+without any order lines.
+
+    python -m benchmarks.synthetic po_10k.xlsx --rows 10000 --noise-cols 6
+    python -m benchmarks.synthetic po_3x.xlsx --rows 2000 --sheets 3 --notes
+"""
+import argparse
+import datetime
+import io
+
+import numpy as np
+import openpyxl
+
+ITEM_DESCRIPTIONS = ["Tee", "Long sleeve knitted romper set", "Shorts", "Sleepsuit 3 pack", "Bodysuit"]
+COMPOSITIONS = ["100% Cotton", "60% Cotton 40% Polyester", "95% Cotton 5% Elastane"]
+UNIT_PRICES = [1.25, 1.5, 2.5, 3.75, 4.1]
+NOISE_HEADERS = ["Colour", "Size Range", "Barcode", "Season", "Carton", "Ratio", "Dept", "Story"]
+
+# Rows above the order lines: buyer name, 4-row metadata block, blank row, stacked header, "Style" header
+HEADER_ROWS = 8
+
+
+def po_metadata(order_no=1):
+    """The header fields a generated PO carries, keyed like extract_invoice_details output"""
+    return {
+        "buyer_name": "LANDMARK GROUP",
+        "order_ref": f"CPO/{47000 + order_no}/25",
+        "brand_name": "Juniors",
+        "loading_country": "India",
+        "port_loading": "Mumbai",
+        "shipment_date": "07/02/2025",
+        "goods_desc": "Value Packs",
+        "fabric_type": "Knitted Jersey",
+    }
+
+
+def make_po_workbook(rows, noise_cols=0, hidden_every=7, total_every=50, styles=None, order_no=1, seed=0,
+                     sheets=1, notes=False):
+    """Build a PO workbook in memory and return its xlsx bytes.
+
+    rows         - order lines per PO sheet (hidden ones included)
+    noise_cols   - extra columns interleaved with the real ones
+    hidden_every - hide every n-th order line (0 hides none)
+    total_every  - insert a style "Total" row after every n lines (0 for none)
+    styles       - distinct style codes (default: one per 4 lines)
+    sheets       - PO sheets; with more than one they are "PO 1", "PO 2", ...
+                   each with its own order number and seed
+    notes        - add a leading "Notes" sheet that has no "Style" header
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    if notes:
+        worksheet = workbook.create_sheet("Notes")
+        worksheet.append(["Packing instructions"])
+        worksheet.append(["Cartons of 24, mixed sizes per ratio"])
+    for i in range(sheets):
+        title = "PO" if sheets == 1 else f"PO {i + 1}"
+        _write_po_sheet(workbook.create_sheet(title), rows, noise_cols, hidden_every, total_every, styles,
+                        order_no + i, seed + i)
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _write_po_sheet(worksheet, rows, noise_cols, hidden_every, total_every, styles, order_no, seed):
+    rng = np.random.default_rng(seed)
+    meta = po_metadata(order_no)
+    styles = styles or max(rows // 4, 1)
+
+    # Real columns in buyer order, with noise columns spread between them
+    columns = [("", "Style"), ("", "Descreption"), ("", "Composition"),
+               ("USD", "Fob$"), ("Total", "Qty"), ("Total", "Value")]
+    for i in range(noise_cols):
+        name = NOISE_HEADERS[i % len(NOISE_HEADERS)] + ("" if i < len(NOISE_HEADERS) else f" {i}")
+        columns.insert(1 + int(rng.integers(0, len(columns))), ("", name))
+    width = len(columns)
+    at = {header: i for i, (_, header) in enumerate(columns)}
+
+    def padded(values):
+        return values + [None] * (width - len(values))
+
+    # Mark hidden order lines before any row is written; write-only sheets only accept that order
+    if hidden_every:
+        for line in range(hidden_every - 1, rows, hidden_every):
+            excel_row = HEADER_ROWS + 1 + line + (line // total_every if total_every else 0)
+            worksheet.row_dimensions[excel_row].hidden = True
+
+    worksheet.append(padded([meta["buyer_name"]]))
+    worksheet.append(padded(["Order No :", None, meta["order_ref"], None, "Brand", meta["brand_name"]]))
+    worksheet.append(padded(["Made in Country", meta["loading_country"], "Loading Port", meta["port_loading"]]))
+    worksheet.append(padded(["Agreed Ship Date", None, datetime.datetime(2025, 2, 7), "ORDER OF", meta["goods_desc"]]))
+    worksheet.append(padded(["Texture :", meta["fabric_type"]]))
+    worksheet.append(padded([]))
+    worksheet.append([top or None for top, _ in columns])
+    worksheet.append([header for _, header in columns])
+
+    style_codes = rng.integers(0, styles, rows)
+    qtys = rng.integers(1, 600, rows)
+    desc = rng.integers(0, len(ITEM_DESCRIPTIONS), rows)
+    comp = rng.integers(0, len(COMPOSITIONS), rows)
+    noise = rng.integers(0, 10_000, (rows, width))
+    block_qty = 0
+    for line in range(rows):
+        # Price and description follow the style, so lines of one style group together
+        code = int(style_codes[line])
+        price = UNIT_PRICES[code % len(UNIT_PRICES)]
+        values = [f"N{v}" for v in noise[line]]
+        values[at["Style"]] = f"SA{code:05d}"
+        values[at["Descreption"]] = ITEM_DESCRIPTIONS[(code + int(desc[line]) % 2) % len(ITEM_DESCRIPTIONS)]
+        values[at["Composition"]] = COMPOSITIONS[(code + int(comp[line]) % 2) % len(COMPOSITIONS)]
+        values[at["Fob$"]] = price
+        values[at["Qty"]] = int(qtys[line])
+        values[at["Value"]] = round(price * int(qtys[line]), 2)
+        worksheet.append(values)
+        block_qty += int(qtys[line])
+        if total_every and (line + 1) % total_every == 0:
+            total = [None] * width
+            total[at["Style"]], total[at["Qty"]] = "Total", block_qty
+            worksheet.append(total)
+            block_qty = 0
+
+    grand = [None] * width
+    grand[at["Style"]], grand[at["Qty"]] = "Grand Total", int(qtys.sum())
+    worksheet.append(grand)
+    worksheet.append(padded(["Remarks: synthetic order for benchmarking"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic buyer PO workbook")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--noise-cols", type=int, default=0)
+    parser.add_argument("--hidden-every", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sheets", type=int, default=1, help="PO sheets in the workbook")
+    parser.add_argument("--notes", action="store_true", help="add a notes sheet without order lines")
+    args = parser.parse_args()
+    with open(args.path, "wb") as f:
+        f.write(make_po_workbook(args.rows, args.noise_cols, args.hidden_every, seed=args.seed,
+                                 sheets=args.sheets, notes=args.notes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+# Unreadable or unwritable entries are reported here rather than on stdout
+logger = logging.getLogger("invoice.cache")
+
+
+# ===== Cache Key =====
+# Modules whose code shapes the parsed order lines; their digest is the parser version
+PARSER_MODULES = ["parsing.py", "ingest.py", "extraction.py", "layouts.py", "money.py"]
+
+_parser_version = None
+_parser_version_lock = threading.Lock()
+
+
+def parser_version():
+    """Digest of the parser's modules, so a changed frame layout never serves an old parse"""
+    global _parser_version
+    with _parser_version_lock:
+        if _parser_version is None:
+            digest = hashlib.sha256()
+            for name in PARSER_MODULES:
+                with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), "rb") as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+            _parser_version = digest.hexdigest()
+    return _parser_version
+
+
+def parse_cache_key(file_bytes, max_rows, col_map, sheet_name):
+    """Digest of the uploaded bytes plus the sheet, parser settings and parser version that shape the result"""
+    digest = hashlib.sha256(file_bytes)
+    settings = {"max_rows": max_rows, "col_map": col_map, "sheet_name": sheet_name, "parser": parser_version()}
+    settings = json.dumps(settings, sort_keys=True)
+    digest.update(b"\0" + settings.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# ===== Parsed Order Cache =====
+class ParseCache:
+    """Two-tier cache of parsed orders: a bounded in-memory LRU plus an optional pickle directory.
+
+    One instance is shared by every session thread of the app, so the LRU is only touched under a lock.
+    """
+
+    def __init__(self, max_entries=32, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _remember(self, key, value):
+        """Keep value in memory, dropping the least recently used entries beyond max_entries (call with the lock held)"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    value = pickle.load(f)
+            except FileNotFoundError:
+                return None
+            except Exception as e:
+                logger.warning("Ignoring unreadable cache entry %s: %s", key, e)
+                return None
+            with self._lock:
+                self._remember(key, value)
+            return value
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        if self.disk_dir:
+            # Write to a temp file first so a crashed write never leaves a truncated entry
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.warning("Could not write cache entry %s: %s", key, e)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+
+# ===== Rendered PDF Cache =====
+# Modules whose code shapes the PDF; with the stamp image they make up the renderer version
+RENDERER_MODULES = ["invoice_pdf.py", "invoice_format.py", "assets.py", "money.py"]
+
+_renderer_version = None
+_renderer_version_lock = threading.Lock()
+
+
+def renderer_version():
+    """Digest of the renderer's modules and stamp image, so a changed layout or stamp never serves an old PDF"""
+    global _renderer_version
+    with _renderer_version_lock:
+        if _renderer_version is None:
+            from assets import STAMP_FILENAME, STAMP_PATH_ENV, resolve_asset
+            digest = hashlib.sha256()
+            paths = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name) for name in RENDERER_MODULES]
+            for path in paths + [resolve_asset(STAMP_FILENAME, STAMP_PATH_ENV)]:
+                with open(path, "rb") as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+            _renderer_version = digest.hexdigest()
+    return _renderer_version
+
+
+def pdf_cache_key(df, form_data, section_column=None, version=None):
+    """Canonical digest of an invoice render: its lines, form fields, section column and renderer version.
+
+    Columns are hashed in name order with the index ignored, numbers as
+    float64 and text by value, whether stored as str, object or categorical,
+    so the same lines give the same key however the frame was built. Form
+    values are compared as the text the invoice prints.
+    """
+    import numpy as np
+    import pandas as pd
+    digest = hashlib.sha256((version or renderer_version()).encode("ascii"))
+    for column in sorted(df.columns, key=str):
+        values = df[column]
+        if values.dtype.kind in "biuf":
+            values = pd.Series(values.to_numpy(dtype="float64", na_value=np.nan))
+        digest.update(b"\0" + str(column).encode("utf-8") + b"\0")
+        digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+    fields = {str(name): str(value) for name, value in form_data.items()}
+    digest.update(json.dumps([fields, section_column], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PdfCache:
+    """Finished invoice PDFs by pdf_cache_key(): a byte-bounded in-memory LRU plus an optional directory.
+
+    The directory holds at most max_disk_bytes of <key>.pdf files, dropping
+    the least recently used; several processes (app, batch workers, the
+    service) may share it. Hits, misses and evictions are counted per
+    process, see stats().
+    """
+
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, disk_dir=None, max_disk_bytes=1024 * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._disk_entries = 0
+        self._counts = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0,
+                        "evictions": 0, "evicted_bytes": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._trim_disk()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pdf")
+
+    def _remember(self, key, pdf):
+        """Keep pdf in memory, dropping least recently used entries beyond max_memory_bytes (call with the lock held)"""
+        if len(pdf) > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = pdf
+        self._memory_bytes += len(pdf)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_bytes -= len(dropped)
+            if not self.disk_dir:
+                # With a directory the entry is still served from disk, so only count real losses
+                self._counts["evictions"] += 1
+                self._counts["evicted_bytes"] += len(dropped)
+
+    def _trim_disk(self):
+        """Delete the least recently used files until the directory fits max_disk_bytes"""
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".pdf"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Trimmed by another process sharing the directory
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        evicted = evicted_bytes = 0
+        while entries and total > self.max_disk_bytes:
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+            evicted_bytes += size
+        with self._lock:
+            self._disk_bytes, self._disk_entries = total, len(entries)
+            self._counts["evictions"] += evicted
+            self._counts["evicted_bytes"] += evicted_bytes
+
+    def get(self, key):
+        """The cached PDF bytes for key, or None on a miss"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counts["memory_hits"] += 1
+                return self._memory[key]
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    pdf = f.read()
+                # The file's mtime is its last use, for the least-recently-used trim
+                os.utime(path)
+            except FileNotFoundError:
+                pdf = None
+            except Exception as e:
+                logger.warning("Ignoring unreadable PDF cache entry %s: %s", key, e)
+                pdf = None
+            if pdf is not None:
+                with self._lock:
+                    self._remember(key, pdf)
+                    self._counts["disk_hits"] += 1
+                return pdf
+
+        with self._lock:
+            self._counts["misses"] += 1
+        return None
+
+    def put(self, key, pdf):
+        with self._lock:
+            self._remember(key, pdf)
+            self._counts["stores"] += 1
+        if self.disk_dir:
+            # Write to a temp file first so a crashed write never leaves a truncated entry
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(pdf)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.warning("Could not write PDF cache entry %s: %s", key, e)
+                return
+            self._trim_disk()
+
+    def stats(self):
+        """Hit, miss, store and eviction counts of this process, plus what the cache holds now"""
+        with self._lock:
+            stats = dict(self._counts)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["disk_entries"] = self._disk_entries
+            stats["disk_bytes"] = self._disk_bytes
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+
+_shared_pdf_caches = {}
+_shared_pdf_caches_lock = threading.Lock()
+
+
+def shared_pdf_cache(disk_dir, max_disk_bytes=1024 * 1024 * 1024):
+    """Process-wide disk-only PdfCache for disk_dir, for worker processes that render one job after another"""
+    with _shared_pdf_caches_lock:
+        cache = _shared_pdf_caches.get(disk_dir)
+        if cache is None:
+            cache = _shared_pdf_caches[disk_dir] = PdfCache(0, disk_dir, max_disk_bytes)
+        cache.max_disk_bytes = max_disk_bytes
+        return cache
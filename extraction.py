@@ -0,0 +1,147 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# ===== Extraction Rules =====
+# Each rule describes one field as data:
+#   field     - key in the extracted dict
+#   position  - (row, col) of a fixed cell whose own text is the value
+#   keywords  - the label cell must contain one of these substrings
+#   requires  - ...and every one of these substrings
+#   exclude   - ...and must not equal any of these (compared lowercase)
+#   offset    - how many cells to the right of the label the value sits
+#   rows      - only search the first N rows (None searches the whole sheet)
+#   date      - normalize the value to dd/mm/YYYY
+#   pick      - "last" (later matches overwrite earlier ones) or "first"
+# When one cell satisfies several rules, the earliest rule in the list wins.
+INVOICE_DETAIL_RULES = [
+    # Buyer Name - Row 1, Column A (index 0)
+    {"field": "buyer_name", "position": (0, 0), "rows": 6},
+    # Order No - "Order No :" with the value 2 cells to the right
+    {"field": "order_ref", "keywords": ["Order No"], "requires": [":"], "offset": 2, "rows": 6},
+    # Brand Name - value 1 cell to the right, avoiding "Brand Name" header cells
+    {"field": "brand_name", "keywords": ["Brand"], "exclude": ["brand name"], "offset": 1, "rows": 6},
+    {"field": "loading_country", "keywords": ["Made in Country"], "offset": 1, "rows": 6},
+    {"field": "port_loading", "keywords": ["Loading Port", "PORT OF LOADING"], "offset": 1, "rows": 6},
+    # Agreed Shipment Date - 2 cells right of "Agreed Ship Date", 1 cell right of "ETA"
+    {"field": "shipment_date", "keywords": ["Agreed Ship Date"], "offset": 2, "rows": 6, "date": True},
+    {"field": "shipment_date", "keywords": ["ETA"], "offset": 1, "rows": 6, "date": True},
+    # Description of goods - value 1 cell to the right of "ORDER OF"
+    {"field": "goods_desc", "keywords": ["ORDER OF"], "offset": 1, "rows": 6},
+]
+
+FABRIC_TYPE_RULES = [
+    # Fabric type - first "Texture :" (with space and colon) anywhere on the visible sheet
+    {"field": "fabric_type", "keywords": ["Texture :"], "offset": 1, "rows": None, "pick": "first"},
+]
+
+
+def normalize_date(value):
+    """Render a date cell as dd/mm/YYYY, or keep only the date part of a text value"""
+    # Handle datetime objects by extracting only the date part
+    if hasattr(value, 'date'):
+        return value.date().strftime('%d/%m/%Y')
+    text = str(value).strip()
+    if ' ' in text:
+        text = text.split(' ')[0]
+    return text
+
+
+# ===== Cell Index =====
+class CellIndex:
+    """Row-major index of the non-empty cells of a raw sheet grid, with their stripped text"""
+
+    def __init__(self, grid, max_rows=None):
+        # Let pandas pick the common dtype first, so numbers read the same as in grid.iloc[row]
+        values = grid.to_numpy()
+        if values.dtype.kind == "M":
+            values = grid.astype(object).to_numpy()
+        elif values.dtype != object:
+            values = values.astype(object)
+        if max_rows is not None:
+            values = values[:max_rows]
+        self.values = values
+        self.n_cols = values.shape[1] if values.ndim == 2 else 0
+
+        rows, cols = np.nonzero(~pd.isna(values))
+        self.rows = rows
+        self.cols = cols
+        self.text = pd.Series(values[rows, cols], dtype=object).map(str).str.strip()
+
+    def value_at(self, row, col):
+        """Cell value, or None when the cell is empty or off the right edge of the sheet"""
+        if col >= self.n_cols:
+            return None
+        value = self.values[row, col]
+        return None if pd.isna(value) else value
+
+
+# ===== Keyword Matcher =====
+class KeywordMatcher:
+    """A set of extraction rules compiled into one regex, resolved in a single pass over a CellIndex"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        keywords = sorted({k for rule in rules for k in rule.get("keywords", [])}, key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(k) for k in keywords)) if keywords else None
+        self.positions = {rule["position"] for rule in rules if "position" in rule}
+        windows = [rule.get("rows") for rule in rules]
+        self.max_rows = None if None in windows else max(windows, default=0)
+
+    def _rule_for(self, row, col, text):
+        """First rule the cell at (row, col) satisfies, following the order of the rule list"""
+        for rule in self.rules:
+            window = rule.get("rows")
+            if window is not None and row >= window:
+                continue
+            if "position" in rule:
+                if rule["position"] == (row, col):
+                    return rule
+                continue
+            if not any(k in text for k in rule["keywords"]):
+                continue
+            if not all(r in text for r in rule.get("requires", [])):
+                continue
+            if text.lower() in rule.get("exclude", []):
+                continue
+            return rule
+        return None
+
+    def match(self, grid):
+        """Resolve every rule against a raw sheet grid; returns {field: value} for fields found"""
+        index = CellIndex(grid, self.max_rows)
+        if not len(index.text):
+            return {}
+
+        # One vectorized pass narrows the sheet down to the few cells that can be labels
+        candidates = np.zeros(len(index.text), dtype=bool)
+        if self.pattern is not None:
+            candidates |= index.text.str.contains(self.pattern, regex=True).to_numpy()
+        for row, col in self.positions:
+            candidates |= (index.rows == row) & (index.cols == col)
+
+        extracted = {}
+        for i in np.flatnonzero(candidates):
+            row, col, text = int(index.rows[i]), int(index.cols[i]), index.text.iat[i]
+            rule = self._rule_for(row, col, text)
+            if rule is None:
+                continue
+            field = rule["field"]
+            if rule.get("pick") == "first" and field in extracted:
+                continue
+
+            if "position" in rule:
+                value = text
+            else:
+                value = index.value_at(row, col + rule["offset"])
+                if value is None:
+                    continue
+                value = normalize_date(value) if rule.get("date") else str(value).strip()
+            extracted[field] = value
+        return extracted
+
+
+INVOICE_DETAIL_MATCHER = KeywordMatcher(INVOICE_DETAIL_RULES)
+FABRIC_TYPE_MATCHER = KeywordMatcher(FABRIC_TYPE_RULES)
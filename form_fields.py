@@ -0,0 +1,23 @@
+# ===== Invoice Form Defaults =====
+# Fallback values for every form_data field, used when nothing was extracted or entered
+FORM_DEFAULTS = {
+    "pi_number": "SAR/LG/XXXX Dt. 10/09/2025",
+    "order_ref": "CPO/47062/25",
+    "buyer_name": "LANDMARK GROUP",
+    "brand_name": "Juniors",
+    "consignee_name": "",
+    "consignee_address": "",
+    "consignee_tel": "",
+    "payment_term": "T/T",
+    "bank_beneficiary": "SAR APPARELS INDIA PVT.LTD.",
+    "bank_account": "2112819952",
+    "bank_name": "KOTAK MAHINDRA BANK",
+    "bank_address": "2 BRABOURNE ROAD, GOVIND BHAVAN, GROUND FLOOR, KOLKATA-700001",
+    "bank_swift": "KKBKINBBCPC",
+    "bank_code": "0323",
+    "loading_country": "India",
+    "port_loading": "Mumbai",
+    "shipment_date": "07/02/2025",
+    "remarks": "",
+    "goods_desc": "Value Packs",
+}
@@ -0,0 +1,607 @@
+import io
+import logging
+import os
+import posixpath
+import zipfile
+from xml.etree import ElementTree
+from xml.parsers import expat
+
+import numpy as np
+import pandas as pd
+
+from metrics import stage
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+WORKSHEET_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+
+# Reader fallbacks are reported here, so servers can filter them out of stdout
+logger = logging.getLogger("invoice.ingest")
+
+
+# ===== Parsed Workbook =====
+class ParsedWorkbook:
+    """Cell values and row visibility of one uploaded sheet, decoded in a single pass"""
+
+    def __init__(self, cells, visible_rows=None, sheet_name=0, file_name=None, reader=None):
+        # Raw cell grid in the same layout as pd.read_excel(..., header=None)
+        self.cells = cells
+        # 0-based visible row indices, or None if hidden row detection failed
+        self.visible_rows = visible_rows
+        self.sheet_name = sheet_name
+        self.file_name = file_name
+        # Name of the reader backend that decoded the cells
+        self.reader = reader
+        self._visible_cells = None
+
+    def visible_cells(self):
+        """Cell grid restricted to visible rows (all rows if detection failed)"""
+        if self._visible_cells is None:
+            self._visible_cells = self._filter_visible()
+        return self._visible_cells
+
+    def _filter_visible(self):
+        if self.visible_rows is None:
+            print("Hidden row detection failed, processing all rows")
+            return self.cells
+
+        # Ensure we don't go beyond dataframe bounds
+        max_row_in_df = len(self.cells) - 1
+        valid_visible_rows = [r for r in self.visible_rows if r <= max_row_in_df]
+
+        if not valid_visible_rows:
+            print("No valid visible rows found, using all rows")
+            return self.cells
+
+        print(f"Filtering to {len(valid_visible_rows)} visible rows out of {len(self.cells)} total rows")
+        return self.cells.iloc[valid_visible_rows].reset_index(drop=True)
+
+
+# ===== Hidden Row Detection Function =====
+def get_visible_rows_openpyxl(uploaded_file, sheet_name=0):
+    """Get list of visible row indices using openpyxl"""
+    try:
+        import openpyxl
+
+        # Reset file pointer and read with openpyxl
+        uploaded_file.seek(0)
+        workbook = openpyxl.load_workbook(io.BytesIO(uploaded_file.read()))
+
+        # Select the specific worksheet
+        if isinstance(sheet_name, str):
+            worksheet = workbook[sheet_name]
+        else:
+            worksheet = workbook.worksheets[sheet_name]
+
+        visible_rows = []
+        for row_num in range(1, worksheet.max_row + 1):
+            # Check if row is not hidden
+            if not worksheet.row_dimensions[row_num].hidden:
+                visible_rows.append(row_num - 1)  # Convert to 0-based index for pandas
+
+        return visible_rows
+    except Exception as e:
+        print(f"Could not detect hidden rows with openpyxl: {e}")
+        return None
+
+
+# ===== Streaming Row Visibility Scanner =====
+class RowVisibility:
+    """Row attributes of one sheet: hidden rows, outline levels and the last row holding cells.
+
+    Only rows carrying attributes are stored, so memory grows with the number of
+    hidden/grouped rows rather than with the size of the sheet.
+    """
+
+    def __init__(self, max_row, hidden_rows, outline_levels):
+        self.max_row = max_row                # 1-based, same meaning as openpyxl's worksheet.max_row
+        self.hidden_rows = hidden_rows        # set of 1-based hidden row numbers
+        self.outline_levels = outline_levels  # {1-based row number: outline level} for grouped rows
+
+    def visible_rows(self):
+        """0-based visible row indices, as returned by get_visible_rows_openpyxl"""
+        hidden = self.hidden_rows
+        return [row_num - 1 for row_num in range(1, self.max_row + 1) if row_num not in hidden]
+
+
+def _xml_bool(value):
+    return value is not None and value.strip().lower() in ("1", "true")
+
+
+def _worksheets(archive):
+    """(name, XML part) of every worksheet in the xlsx archive, in workbook order"""
+    workbook_xml = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    rels_xml = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+
+    targets = {}
+    for rel in rels_xml.iter(f"{PKG_REL_NS}Relationship"):
+        # Chartsheets are skipped, like openpyxl's workbook.worksheets
+        if rel.get("Type") != WORKSHEET_REL_TYPE:
+            continue
+        target = rel.get("Target")
+        if target.startswith("/"):
+            target = target.lstrip("/")
+        else:
+            target = posixpath.normpath(posixpath.join("xl", target))
+        targets[rel.get("Id")] = target
+
+    return [(sheet.get("name"), targets[sheet.get(f"{REL_NS}id")])
+            for sheet in workbook_xml.iter(f"{MAIN_NS}sheet")
+            if sheet.get(f"{REL_NS}id") in targets]
+
+
+def _worksheet_path(archive, sheet_name=0):
+    """Resolve a sheet name or worksheet index to its XML part inside the xlsx archive"""
+    sheets = _worksheets(archive)
+    if isinstance(sheet_name, str):
+        for name, target in sheets:
+            if name == sheet_name:
+                return target
+        raise KeyError(f"Worksheet {sheet_name} does not exist.")
+    return sheets[sheet_name][1]
+
+
+def scan_row_visibility(source, sheet_name=0):
+    """Stream the sheet XML of an xlsx and collect row attributes without building any cells.
+
+    source is a path or binary file object holding the xlsx bytes. An expat
+    parser with start/end callbacks is used instead of a tree builder, so only
+    the handful of counters below is alive at any point of the scan.
+    """
+    state = {"prefix": None, "row_num": 0, "row_has_cells": False, "max_row": 1}
+    hidden_rows = set()
+    outline_levels = {}
+
+    def start_element(name, attrs):
+        prefix = state["prefix"]
+        if prefix is None:
+            # The root element tells us whether the sheet uses a namespace prefix (e.g. "x:worksheet")
+            prefix = state["prefix"] = name[:name.index(":") + 1] if ":" in name else ""
+        if name == prefix + "c":
+            state["row_has_cells"] = True
+        elif name == prefix + "row":
+            # Rows without an explicit r attribute follow on from the previous one
+            r = attrs.get("r")
+            row_num = state["row_num"] = int(r) if r else state["row_num"] + 1
+            state["row_has_cells"] = False
+            if _xml_bool(attrs.get("hidden")):
+                hidden_rows.add(row_num)
+            level = attrs.get("outlineLevel")
+            if level and int(level):
+                outline_levels[row_num] = int(level)
+
+    def end_element(name):
+        # openpyxl's max_row counts rows that hold at least one cell element
+        if state["row_has_cells"] and name == state["prefix"] + "row":
+            state["max_row"] = max(state["max_row"], state["row_num"])
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+
+    with zipfile.ZipFile(source) as archive:
+        with archive.open(_worksheet_path(archive, sheet_name)) as sheet_xml:
+            parser.ParseFile(sheet_xml)
+
+    return RowVisibility(state["max_row"], hidden_rows, outline_levels)
+
+
+def get_visible_rows_streaming(uploaded_file, sheet_name=0):
+    """Get list of visible row indices by streaming the sheet XML (drop-in for get_visible_rows_openpyxl)"""
+    try:
+        uploaded_file.seek(0)
+        return scan_row_visibility(uploaded_file, sheet_name).visible_rows()
+    except Exception as e:
+        logger.warning("Could not detect hidden rows from sheet XML: %s", e)
+        return None
+
+
+# ===== Reader Backends =====
+ZIP_MAGIC = b"PK\x03\x04"
+OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+EXCEL_EXTENSIONS = {"xlsx": "xlsx", "xlsm": "xlsx", "xlsb": "xlsb", "xls": "xls", "ods": "ods"}
+# The one "sheet" of a CSV file
+CSV_SHEET_NAME = "Sheet1"
+# From about this size pyarrow's CSV parser beats pandas' C parser, even on one core (benchmarks/bench_readers.py)
+PYARROW_CSV_MIN_BYTES = 512 * 1024
+# Rows per chunk when a sheet is streamed (stream_workbook)
+CHUNK_ROWS = 10000
+# Text cells pd.read_excel reads as missing (pandas' default na_values)
+EXCEL_NA_STRINGS = frozenset(["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+                              "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"])
+# A whole cell holding a number as Excel writes it to CSV: optional sign and currency
+# symbol, thousands separators; no leading zeros, so codes like "00123" stay text
+CSV_NUMBER = r"[-+]?(?:[$€£₹]\s?)?(?:0|[1-9]\d{0,2}(?:,\d{3})+|[1-9]\d*)(?:\.\d+)?"
+
+
+def sniff_format(data, file_name=None):
+    """"xlsx", "xlsb", "xls", "ods" or "csv" for a file's bytes.
+
+    The leading bytes decide; the name's extension only matters for a file
+    that is neither a zip nor an OLE container, so a broken .xlsx still fails
+    as an xlsx rather than being read as text.
+    """
+    if data.startswith(ZIP_MAGIC):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            names = set(archive.namelist())
+        if "xl/workbook.bin" in names:
+            return "xlsb"
+        if "content.xml" in names:
+            return "ods"
+        return "xlsx"
+    if data.startswith(OLE_MAGIC):
+        return "xls"
+    extension = posixpath.splitext(str(file_name or "").lower())[1].lstrip(".")
+    if extension in EXCEL_EXTENSIONS:
+        return EXCEL_EXTENSIONS[extension]
+    if b"\0" in data[:4096]:
+        raise ValueError("Unrecognised file: not an Excel workbook or a CSV text file")
+    return "csv"
+
+
+class OpenpyxlReader:
+    """xlsx/xlsm: row visibility from a streaming scan of the sheet XML, cells from a read-only openpyxl workbook"""
+
+    name = "openpyxl"
+    formats = ("xlsx",)
+
+    def available(self):
+        return True
+
+    def sheet_names(self, data):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            return [name for name, _ in _worksheets(archive)]
+
+    def read(self, data, sheet_name=0):
+        """(cell grid, 0-based visible rows or None)"""
+        import openpyxl
+
+        with stage("scan_visibility") as record:
+            visible_rows = get_visible_rows_streaming(io.BytesIO(data), sheet_name)
+            record["rows"] = len(visible_rows) if visible_rows is not None else None
+
+        with stage("load_workbook"):
+            # Same load options pd.read_excel uses for its own openpyxl engine
+            workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True, keep_links=False)
+        with stage("read_excel") as record:
+            cells = pd.read_excel(workbook, sheet_name=sheet_name, header=None, engine="openpyxl")
+            record["rows"] = len(cells)
+        return cells, visible_rows
+
+    def read_chunks(self, data, sheet_name=0, chunk_rows=CHUNK_ROWS):
+        """(cell grid, 0-based visible rows) per chunk_rows rows of the sheet, holding one chunk of cells at a time.
+
+        Cells are converted the way pd.read_excel converts them, so a chunk
+        reads the same as those rows of read()'s grid.
+        """
+        import openpyxl
+        from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+        try:
+            hidden_rows = scan_row_visibility(io.BytesIO(data), sheet_name).hidden_rows
+        except Exception as e:
+            logger.warning("Could not detect hidden rows from sheet XML: %s", e)
+            hidden_rows = set()
+
+        def convert(cell):
+            value = cell.value
+            if value is None or cell.data_type == TYPE_ERROR:
+                return np.nan
+            if cell.data_type == TYPE_NUMERIC:
+                return int(value) if int(value) == value else float(value)
+            return np.nan if isinstance(value, str) and value in EXCEL_NA_STRINGS else value
+
+        def chunk(rows, first_row):
+            width = max(map(len, rows))
+            cells = pd.DataFrame([row + [np.nan] * (width - len(row)) for row in rows], dtype=object)
+            visible = [i for i in range(len(rows)) if first_row + i + 1 not in hidden_rows]
+            return cells, visible
+
+        workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True, keep_links=False)
+        try:
+            worksheet = workbook[sheet_name] if isinstance(sheet_name, str) else workbook.worksheets[sheet_name]
+            worksheet.reset_dimensions()
+            rows, first_row = [], 0
+            for row in worksheet.rows:
+                rows.append([convert(cell) for cell in row])
+                if len(rows) == chunk_rows:
+                    yield chunk(rows, first_row)
+                    rows, first_row = [], first_row + len(rows)
+            if rows:
+                yield chunk(rows, first_row)
+        finally:
+            workbook.close()
+
+
+class CalamineReader:
+    """Any Excel or OpenDocument format through the Rust calamine reader, when python-calamine is installed.
+
+    Hidden rows are only known for xlsx (from the same streaming scan); other
+    formats are read with every row treated as visible.
+    """
+
+    name = "calamine"
+    formats = ("xlsx", "xlsb", "xls", "ods")
+
+    def available(self):
+        import importlib.util
+        return importlib.util.find_spec("python_calamine") is not None
+
+    def sheet_names(self, data):
+        from python_calamine import CalamineWorkbook
+        return list(CalamineWorkbook.from_filelike(io.BytesIO(data)).sheet_names)
+
+    def read(self, data, sheet_name=0):
+        visible_rows = None
+        if sniff_format(data) == "xlsx":
+            with stage("scan_visibility") as record:
+                visible_rows = get_visible_rows_streaming(io.BytesIO(data), sheet_name)
+                record["rows"] = len(visible_rows) if visible_rows is not None else None
+        with stage("read_excel") as record:
+            cells = pd.read_excel(io.BytesIO(data), sheet_name=sheet_name, header=None, engine="calamine")
+            record["rows"] = len(cells)
+        return cells, visible_rows
+
+    def read_chunks(self, data, sheet_name=0, chunk_rows=CHUNK_ROWS):
+        """read() sliced into chunks; calamine decodes the whole sheet at once, so memory is not bounded"""
+        cells, visible_rows = self.read(data, sheet_name)
+        visible = np.ones(len(cells), dtype=bool)
+        if visible_rows is not None:
+            visible[:] = False
+            visible[[r for r in visible_rows if r < len(cells)]] = True
+        for start in range(0, len(cells), chunk_rows):
+            yield (cells.iloc[start:start + chunk_rows].reset_index(drop=True),
+                   np.flatnonzero(visible[start:start + chunk_rows]).tolist())
+
+
+class CsvReader:
+    """CSV exports: one sheet, every row visible, and cells typed as pd.read_excel would type them.
+
+    A cell that is entirely a number, as Excel writes one to CSV (thousands
+    separators, a currency symbol), becomes an int or float; everything else
+    stays text. pyarrow parses files of PYARROW_CSV_MIN_BYTES and up.
+    """
+
+    name = "csv"
+    formats = ("csv",)
+
+    def __init__(self, engine=None):
+        # "c" or "pyarrow" to force a parser; None picks by size
+        self.engine = engine
+
+    def available(self):
+        return True
+
+    def sheet_names(self, data):
+        return [CSV_SHEET_NAME]
+
+    def parser_engine(self, size):
+        import importlib.util
+        if self.engine:
+            return self.engine
+        return "pyarrow" if size >= PYARROW_CSV_MIN_BYTES and importlib.util.find_spec("pyarrow") is not None else "c"
+
+    def decode(self, data):
+        """(text, delimiter) of the file's bytes"""
+        import csv
+
+        try:
+            text = data.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            # Excel's "CSV" on Windows writes the ANSI code page
+            text = data.decode("cp1252", errors="replace")
+        try:
+            delimiter = csv.Sniffer().sniff(text[:8192], delimiters=",;\t|").delimiter
+        except csv.Error:
+            delimiter = ","
+        return text, delimiter
+
+    def read(self, data, sheet_name=0):
+        import csv
+
+        text, delimiter = self.decode(data)
+        with stage("read_csv") as record:
+            try:
+                cells = pd.read_csv(io.StringIO(text), sep=delimiter, header=None, dtype=str, skip_blank_lines=False,
+                                    keep_default_na=False, na_values=[""], engine=self.parser_engine(len(data)))
+            except (pd.errors.ParserError, ValueError):
+                # Rows of different lengths; pad them like the empty cells of a sheet
+                rows = list(csv.reader(io.StringIO(text), delimiter=delimiter))
+                width = max((len(row) for row in rows), default=0)
+                cells = pd.DataFrame([row + [""] * (width - len(row)) for row in rows], dtype=str).replace("", np.nan)
+            cells.columns = range(cells.shape[1])
+            cells = cells.apply(_typed_csv_column)
+            record["rows"] = len(cells)
+        return cells, list(range(len(cells)))
+
+    def read_chunks(self, data, sheet_name=0, chunk_rows=CHUNK_ROWS):
+        """(cell grid, visible rows) per chunk_rows lines, each typed like read()'s grid"""
+        import csv
+
+        def chunk(rows):
+            width = max(map(len, rows))
+            cells = pd.DataFrame([row + [""] * (width - len(row)) for row in rows], dtype=str).replace("", np.nan)
+            return cells.apply(_typed_csv_column), list(range(len(cells)))
+
+        text, delimiter = self.decode(data)
+        rows = []
+        for row in csv.reader(io.StringIO(text), delimiter=delimiter):
+            rows.append(row)
+            if len(rows) == chunk_rows:
+                yield chunk(rows)
+                rows = []
+        if rows:
+            yield chunk(rows)
+
+
+def _typed_csv_column(values):
+    """A CSV column of text with its number cells as int/float, mixed like a read_excel column"""
+    numeric = values.str.fullmatch(CSV_NUMBER, na=False).to_numpy()
+    if not numeric.any():
+        return values
+    digits = values[numeric].str.replace(r"[,$€£₹\s]", "", regex=True)
+    is_float = digits.str.contains(".", regex=False).to_numpy()
+    if numeric.all() and not values.isna().any():
+        return pd.to_numeric(digits, downcast=None) if is_float.any() else digits.astype("int64")
+    out = values.to_numpy(dtype=object)
+    positions = np.flatnonzero(numeric)
+    out[positions[~is_float]] = [int(v) for v in digits[~is_float]]
+    out[positions[is_float]] = [float(v) for v in digits[is_float]]
+    return pd.Series(out, index=values.index, dtype=object)
+
+
+# Preferred first: a faster reader that happens to be installed, then the built-in ones
+READERS = [CalamineReader(), OpenpyxlReader(), CsvReader()]
+
+
+def select_readers(data, file_name=None, backend=None):
+    """The readers to try for a file, best first; backend (or INVOICE_READER) names a reader to insist on"""
+    backend = backend or os.environ.get("INVOICE_READER") or "auto"
+    file_format = sniff_format(data, file_name)
+    if backend != "auto":
+        readers = [reader for reader in READERS if reader.name == backend]
+        if not readers:
+            raise ValueError(f"Unknown reader {backend!r}; choose one of: auto, {', '.join(r.name for r in READERS)}")
+        if file_format not in readers[0].formats:
+            raise ValueError(f"The {backend} reader cannot read {file_format} files")
+        return readers
+    readers = [reader for reader in READERS if file_format in reader.formats and reader.available()]
+    if not readers:
+        raise ValueError(f"No reader for {file_format} files is installed; install python-calamine to read them")
+    return readers
+
+
+def supported_extensions():
+    """File extensions some installed reader can open, e.g. for an upload widget"""
+    formats = {f for reader in READERS if reader.available() for f in reader.formats}
+    return [ext for ext, f in EXCEL_EXTENSIONS.items() if f in formats] + ["csv"]
+
+
+# ===== Ingestion Function =====
+def read_workbook(uploaded_file, sheet_name=0, backend=None, file_name=None):
+    """Decode an uploaded workbook or CSV once into a ParsedWorkbook.
+
+    The upload is read into memory a single time and handed to the best
+    reader for its format (see select_readers); if that reader fails the next
+    one capable of the format is tried. For xlsx the default is row
+    visibility from a streaming scan of the sheet XML and the cell values
+    from a read-only openpyxl workbook handed straight to pd.read_excel, so
+    no cell objects are ever materialized for the whole sheet. file_name
+    stands in for the name of a plain buffer.
+    """
+    uploaded_file.seek(0)
+    data = uploaded_file.read()
+    file_name = file_name or getattr(uploaded_file, "name", None)
+
+    readers = select_readers(data, file_name, backend)
+    for position, reader in enumerate(readers):
+        try:
+            cells, visible_rows = reader.read(data, sheet_name)
+            break
+        except Exception as e:
+            if position == len(readers) - 1:
+                raise
+            logger.warning("The %s reader failed (%s: %s); trying %s",
+                           reader.name, type(e).__name__, e, readers[position + 1].name)
+
+    return ParsedWorkbook(cells, visible_rows, sheet_name=sheet_name, file_name=file_name, reader=reader.name)
+
+
+def stream_workbook(uploaded_file, sheet_name=0, head_rows=20, chunk_rows=CHUNK_ROWS, backend=None, file_name=None):
+    """Read one sheet a chunk of rows at a time: returns (head, chunks).
+
+    head is a ParsedWorkbook of the first chunk(s) of the sheet, with at
+    least head_rows visible rows unless the sheet is shorter, for finding
+    the header row and the header fields. chunks yields the visible rows
+    after the head as cell grids of at most chunk_rows rows, so only one
+    chunk of cells is held at a time (except with calamine, which decodes
+    the whole sheet). Readers fall back as in read_workbook while the head is read.
+    """
+    uploaded_file.seek(0)
+    data = uploaded_file.read()
+    file_name = file_name or getattr(uploaded_file, "name", None)
+
+    readers = select_readers(data, file_name, backend)
+    for position, reader in enumerate(readers):
+        chunks = reader.read_chunks(data, sheet_name, max(chunk_rows, head_rows))
+        try:
+            cells, visible_rows = _stream_head(chunks, head_rows)
+            break
+        except Exception as e:
+            chunks.close()
+            if position == len(readers) - 1:
+                raise
+            logger.warning("The %s reader failed (%s: %s); trying %s",
+                           reader.name, type(e).__name__, e, readers[position + 1].name)
+
+    head = ParsedWorkbook(cells, visible_rows, sheet_name=sheet_name, file_name=file_name, reader=reader.name)
+    return head, SheetChunks(cells, chunks)
+
+
+class SheetChunks:
+    """The visible rows after the head of a streamed sheet, one cell grid per chunk.
+
+    Chunks are read as object cells, whereas a whole-sheet read types each
+    column; text_columns (complete once iterated) are the column positions
+    holding nothing but text on every row, hidden ones and the head's
+    included, i.e. the columns pd.read_excel would give the str dtype.
+    """
+
+    def __init__(self, head_cells, chunks):
+        self._chunks = chunks
+        self._seen = set()
+        self._mixed = set()
+        self._note(head_cells)
+
+    def _note(self, cells):
+        for col in cells.columns:
+            if col in self._mixed:
+                continue
+            kind = pd.api.types.infer_dtype(cells[col], skipna=True)
+            if kind == "empty":
+                continue
+            self._seen.add(col)
+            if kind != "string":
+                self._mixed.add(col)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        cells, visible = next(self._chunks)
+        self._note(cells)
+        return cells.iloc[visible].reset_index(drop=True)
+
+    def close(self):
+        self._chunks.close()
+
+    @property
+    def text_columns(self):
+        return self._seen - self._mixed
+
+
+def _stream_head(chunks, head_rows):
+    """(cell grid, visible rows) of the first chunks of a stream, until head_rows of them are visible"""
+    grids, visible_rows, offset = [], [], 0
+    for cells, visible in chunks:
+        grids.append(cells)
+        visible_rows.extend(offset + r for r in visible)
+        offset += len(cells)
+        if len(visible_rows) >= head_rows:
+            break
+    if not grids:
+        return pd.DataFrame(), []
+    return pd.concat(grids, ignore_index=True) if len(grids) > 1 else grids[0], visible_rows
+
+
+def list_worksheets(source, file_name=None):
+    """Names of the worksheets in a workbook (path or binary file object), in workbook order; one for a CSV"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            data = f.read()
+        file_name = file_name or str(source)
+    else:
+        data = source.read()
+        file_name = file_name or getattr(source, "name", None)
+    return select_readers(data, file_name)[0].sheet_names(data)
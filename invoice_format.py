@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from money import from_cents, to_cents, whole_dollars
+
+
+# ===== Fixed Text =====
+# Printed on every invoice, as reportlab paragraph markup (which is also valid HTML)
+SUPPLIER_DETAILS = ("<b>SAR APPARELS INDIA PVT.LTD.</b><br/><b>Address:</b> 6, Picaso Bithi, Kolkata - 700017<br/>"
+                    "<b>Phone:</b> 9817473373<br/><b>Fax:</b> N.A.")
+SIGNATORY = "for RNA Resources Group Ltd-Landmark (Babyshop)"
+
+# ===== Number Formatting =====
+def indian_format(number):
+    """Format number with Indian comma placement (x,xx,xxx pattern)"""
+    if number == 0:
+        return "0.00"
+
+    # Convert to string with 2 decimal places
+    num_str = f"{number:.2f}"
+    integer_part, decimal_part = num_str.split(".")
+
+    # Reverse the integer part for easier processing
+    reversed_int = integer_part[::-1]
+
+    # Add commas: first comma after 3 digits, then every 2 digits
+    formatted = ""
+    for i, digit in enumerate(reversed_int):
+        if i == 3:  # First comma after 3 digits
+            formatted = "," + formatted
+        elif i > 3 and (i - 3) % 2 == 0:  # Then every 2 digits
+            formatted = "," + formatted
+        formatted = digit + formatted
+
+    return f"{formatted}.{decimal_part}"
+
+
+def total_in_words(total_cents):
+    """The "TOTAL IN WORDS" line for an order total in cents, in whole dollars"""
+    # Only needed here, so importing this module doesn't pay for it
+    from num2words import num2words
+    total_words_str = num2words(whole_dollars(total_cents), to='cardinal', lang='en').upper()
+    # Remove commas from the total in words
+    total_words_str = total_words_str.replace(",", "")
+    return f"TOTAL IN WORDS: USD {total_words_str} DOLLARS"
+
+
+# ===== Product Rows =====
+PRODUCT_HEADERS = ["STYLE NO.","ITEM DESCRIPTION","FABRIC TYPE\nKNITTED / WOVEN","H.S NO\n(8digit)",
+                   "COMPOSITION OF\nMATERIAL","COUNTRY OF\nORIGIN","QTY","UNIT PRICE\nFOB","AMOUNT"]
+PRODUCT_TEXT_COLUMNS = ["STYLE NO","ITEM DESCRIPTION","FABRIC TYPE","HS CODE","COMPOSITION","COUNTRY OF ORIGIN"]
+
+
+def _column(df, name, default):
+    return df[name] if name in df.columns else pd.Series(default, index=df.index)
+
+
+def line_values(df):
+    """(qty, price, amount) of every order line: QTY as int, UNIT PRICE as float, AMOUNT in int cents"""
+    qty = _column(df, "QTY", 0).fillna(0).astype(int)
+    price = _column(df, "UNIT PRICE", 0.0).fillna(0.0).astype(float)
+    # AMOUNT as entered, falling back to QTY x UNIT PRICE where it is missing or zero
+    computed = qty * price
+    amount = _column(df, "AMOUNT", computed).astype(float)
+    return qty, price, to_cents(amount.where(amount != 0, computed))
+
+
+def format_product_rows(df):
+    """Product table cells for every order line, formatted a column at a time.
+
+    Returns (rows, qty, amount): rows is a list of 9-cell lists, qty and amount
+    are QTY and AMOUNT per line as numpy int arrays, the amount in cents so
+    subtotals and totals add up without float drift.
+    """
+    qty, price, amount = line_values(df)
+    cells = [_column(df, name, "").astype(str) for name in PRODUCT_TEXT_COLUMNS]
+    cells += [qty.map("{:,}".format), price.map("{:.2f}".format), pd.Series(from_cents(amount)).map("{:.2f}".format)]
+    rows = [list(row) for row in zip(*(c.tolist() for c in cells))]
+    return rows, qty.to_numpy(), amount
+
+
+def add_section_subtotals(rows, qty, amount, sections):
+    """Close each run of lines from the same section (e.g. PO sheet) with a "<section> subtotal" row.
+
+    The subtotal rows count zero in the returned qty and amount, so page
+    subtotals and the order total are unchanged. Returns (rows, qty, amount,
+    indices of the subtotal rows).
+    """
+    sections = np.asarray(sections, dtype=object)
+    if len(sections) == 0:
+        return rows, qty, amount, np.array([], dtype=int)
+    # Last line of every run of equal section values
+    ends = np.flatnonzero(np.append(sections[1:] != sections[:-1], True))
+    starts = np.append(0, ends[:-1] + 1)
+    qty_sums = np.add.reduceat(qty, starts)
+    amount_sums = np.add.reduceat(amount, starts)
+
+    out_rows = []
+    for start, end, section_qty, section_amount in zip(starts, ends, qty_sums, amount_sums):
+        out_rows.extend(rows[start:end + 1])
+        out_rows.append([f"{sections[end]} subtotal","","","","","",f"{int(section_qty):,}","",
+                         f"USD            {indian_format(section_amount / 100)}"])
+    # Each subtotal row lands after its run's lines plus the subtotals before it
+    subtotal_rows = ends + np.arange(1, len(ends) + 1)
+    out_qty = np.insert(qty, ends + 1, 0)
+    out_amount = np.insert(amount, ends + 1, 0)
+    return out_rows, out_qty, out_amount, subtotal_rows
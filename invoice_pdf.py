@@ -0,0 +1,573 @@
+import io
+import queue
+import threading
+
+import numpy as np
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import (BaseDocTemplate, Frame, PageTemplate, Table, TableStyle, Paragraph, Spacer,
+                                Flowable, PageBreak)
+
+from assets import AssetImage, get_stamp
+from form_fields import FORM_DEFAULTS  # kept importable from here for existing callers
+from invoice_format import (PRODUCT_HEADERS, SIGNATORY, SUPPLIER_DETAILS, add_section_subtotals, format_product_rows,
+                            indian_format, total_in_words)
+from metrics import lap_timer
+
+
+# ===== Static Blocks =====
+class StaticBlock(Flowable):
+    """Wraps a flowable whose content is the same on every invoice.
+
+    The inner flowable is laid out once per process. On each canvas it is drawn
+    into a named PDF form (XObject) the first time, and every later use just
+    references that form.
+    """
+
+    # Slack around the wrapped size so descenders and negative spacing aren't clipped by the form BBox
+    BBOX_PAD = 20
+
+    def __init__(self, name, flowable):
+        Flowable.__init__(self)
+        self.name = name
+        self.flowable = flowable
+        self._wrapped = None
+        self._lock = threading.Lock()
+
+    def wrap(self, availWidth, availHeight):
+        with self._lock:
+            if self._wrapped is None or self._wrapped[0] != availWidth:
+                self._wrapped = (availWidth,) + tuple(self.flowable.wrap(availWidth, availHeight))
+            return self._wrapped[1], self._wrapped[2]
+
+    def getSpaceBefore(self):
+        return self.flowable.getSpaceBefore()
+
+    def getSpaceAfter(self):
+        return self.flowable.getSpaceAfter()
+
+    def split(self, availWidth, availHeight):
+        return []
+
+    def draw(self):
+        canv = self.canv
+        avail_width, width, height = self._wrapped
+        form_name = f"{self.name}_{int(avail_width * 100)}"
+        if not canv.hasForm(form_name):
+            pad = self.BBOX_PAD
+            canv.beginForm(form_name, -pad, -pad, width + pad, height + pad)
+            with self._lock:
+                self.flowable.drawOn(canv, 0, 0)
+            canv.endForm()
+        canv.doForm(form_name)
+
+# ===== Invoice Template =====
+class InvoiceTemplate:
+    """Styles, column widths, table styles and static blocks of the proforma invoice.
+
+    Built once per process by get_invoice_template(); generate_proforma_invoice
+    then only lays out the fields that change from one invoice to the next.
+    """
+
+    def __init__(self):
+        styles = getSampleStyleSheet()
+        self.title_style = ParagraphStyle('Title', parent=styles['Normal'], fontSize=12,
+                                          alignment=TA_CENTER, fontName='Helvetica-Bold', spaceAfter=6,
+                                          borderWidth=1, borderColor=colors.black, borderPadding=(2,6,6,6))
+        self.header_style = ParagraphStyle('Header', parent=styles['Normal'], fontSize=7,
+                                           fontName='Helvetica-Bold', alignment=TA_LEFT,
+                                           spaceBefore=0, spaceAfter=0, leading=8)
+        self.normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=6, alignment=TA_LEFT,
+                                           spaceBefore=0, spaceAfter=0, leading=7)
+        self.supplier_detail_style = ParagraphStyle('SupplierDetail', parent=self.header_style, leading=12)
+        self.top_align_style = ParagraphStyle('TopAlign', parent=self.header_style, alignment=TA_LEFT, spaceBefore=0, leading=12)
+        # Compact styles for bank and consignee details
+        self.bank_style = ParagraphStyle('BankCompact', parent=self.normal_style, fontSize=7, fontName='Helvetica',
+                                         leading=12, spaceAfter=0, spaceBefore=0, leftIndent=0, rightIndent=0)
+        self.consignee_style = ParagraphStyle('ConsigneeCompact', parent=self.normal_style, leading=12, spaceAfter=0, spaceBefore=0)
+        self.goods_style = ParagraphStyle('Goods', parent=self.normal_style, fontSize=7)
+        self.currency_style = ParagraphStyle('Currency', parent=self.normal_style,
+                                             fontSize=8, alignment=TA_RIGHT, fontName='Helvetica-Bold')
+        self.total_words_style = ParagraphStyle('TotalWords', parent=styles['Normal'], fontName='Helvetica-Bold', fontSize=7, alignment=TA_LEFT)
+        self.terms_style = ParagraphStyle('TermsCompact', parent=self.normal_style, spaceBefore=-10)
+
+        # width setup - adjust product table to align with header sections
+        # First calculate the total table width from original product columns to maintain consistency
+        original_product_col_widths = [0.8*inch, 1.3*inch, 0.8*inch, 0.7*inch,
+                                       1.1*inch, 0.7*inch, 0.5*inch, 0.6*inch, 0.8*inch]
+        total_table_width = sum(original_product_col_widths)
+
+        # Calculate widths so the line between H.S NO and COMPOSITION aligns with center divider above
+        left_section_width = total_table_width/2  # This should align with the center line above
+        right_section_width = total_table_width/2
+
+        # Distribute left section width among first 4 columns (STYLE NO, ITEM DESC, FABRIC TYPE, H.S NO)
+        # Distribute right section width among last 5 columns (COMPOSITION, COUNTRY, QTY, UNIT PRICE, AMOUNT)
+        self.product_col_widths = [
+            left_section_width * 0.2,   # STYLE NO (20% of left)
+            left_section_width * 0.35,  # ITEM DESCRIPTION (35% of left)
+            left_section_width * 0.25,  # FABRIC TYPE (25% of left)
+            left_section_width * 0.2,   # H.S NO (20% of left)
+            right_section_width * 0.22, # COMPOSITION (22% of right)
+            right_section_width * 0.18, # COUNTRY OF ORIGIN (18% of right) - increased from 15%
+            right_section_width * 0.15, # QTY (15% of right)
+            right_section_width * 0.2,  # UNIT PRICE (20% of right)
+            right_section_width * 0.25  # AMOUNT (25% of right) - reduced from 28%
+        ]
+        self.header_col_widths = [total_table_width/2, total_table_width/2]
+
+        # Table styles
+        self.supplier_table_style = TableStyle([('BOX',(0,0),(-1,-1),1,colors.black),
+                                                ('LINEBEFORE',(1,0),(1,-1),1,colors.black),
+                                                ('LINEBELOW',(1,0),(1,0),1,colors.black),
+                                                ('VALIGN',(0,1),(1,1),'TOP'),
+                                                ('BOTTOMPADDING',(0,1),(0,1),50),    # Increased bottom padding to 50 points
+                                                ('BOTTOMPADDING',(1,1),(1,1),50)])  # Increased bottom padding to 50 points
+        self.consignee_table_style = TableStyle([('BOX',(0,0),(-1,-1),1,colors.black),
+                                                 ('LINEBEFORE',(1,0),(1,-1),1,colors.black),
+                                                 ('VALIGN',(0,0),(-1,-1),'TOP'),
+                                                 # Ultra tight spacing
+                                                 ('TOPPADDING',(0,0),(-1,-1),0),    # Zero top padding for all cells
+                                                 ('BOTTOMPADDING',(0,0),(-1,-1),1), # Minimal bottom padding for all cells
+                                                 ('LEFTPADDING',(0,0),(-1,-1),2),   # Minimal left padding
+                                                 ('RIGHTPADDING',(0,0),(-1,-1),2)]) # Minimal right padding
+        self.shipping_table_style = TableStyle([('BOX',(0,0),(-1,-1),1,colors.black),
+                                                ('LINEBEFORE',(1,0),(1,-1),1,colors.black),
+                                                ('VALIGN',(0,0),(-1,-1),'TOP'),
+                                                ('TOPPADDING',(0,0),(-1,-1),1),    # Minimal top padding
+                                                ('BOTTOMPADDING',(0,0),(-1,-1),1)]) # Minimal bottom padding
+        self.combined_table_style = TableStyle([
+                                                # Outer border only - NO line between rows
+                                                ('BOX',(0,0),(-1,-1),1,colors.black),
+                                                ('LINEBEFORE',(1,0),(1,-1),1,colors.black),
+                                                ('VALIGN',(0,0),(0,0),'TOP'),      # Description of goods - TOP alignment
+                                                ('VALIGN',(1,0),(1,0),'BOTTOM')   # Currency - BOTTOM alignment
+                                               ])
+        self.product_table_style = TableStyle([
+            ('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'),
+            ('FONTSIZE',(0,0),(-1,-1),6),
+            ('ALIGN',(0,0),(-1,-1),'CENTER'),
+            ('VALIGN',(0,0),(-1,-1),'MIDDLE'),
+            ('BOX',(0,0),(-1,-1),1,colors.black),
+            ('LINEBEFORE',(1,0),(1,-1),0.5,colors.black),
+            ('LINEBEFORE',(2,0),(2,-1),0.5,colors.black),
+            ('LINEBEFORE',(3,0),(3,-1),0.5,colors.black),
+            ('LINEBEFORE',(4,0),(4,-1),0.5,colors.black),
+            ('LINEBEFORE',(5,0),(5,-1),0.5,colors.black),
+            ('LINEBEFORE',(6,0),(6,-1),0.5,colors.black),
+            ('LINEBEFORE',(7,0),(7,-1),0.5,colors.black),
+            ('LINEBEFORE',(8,0),(8,-1),0.5,colors.black),
+            ('LINEBELOW',(0,0),(-1,0),0.5,colors.black),
+            ('LINEABOVE',(0,-1),(-1,-1),0.5,colors.black),
+            ('SPAN',(0,-1),(5,-1)),
+            ('ALIGN',(0,-1),(5,-1),'CENTER'),
+            ('SPAN',(6,-1),(7,-1)),
+            ('FONTNAME',(0,-1),(-1,-1),'Helvetica-Bold'),  # Make TOTAL row bold
+            ('WORDWRAP', (0,0), (-1,-1), 'CJK'),  # Enable text wrapping for all cells
+        ])
+        # Large orders: the same grid without WORDWRAP (cells are pre-truncated, rows have a fixed height);
+        # ChunkedProductTable adds the subtotal and total row commands per page
+        self.long_table_commands = [cmd for cmd in self.product_table_style.getCommands()
+                                    if cmd[0] != 'WORDWRAP' and cmd[1][1] != -1]
+        self.long_table_header_height = 30
+        self.long_table_row_height = 18
+        self.signature_table_style = TableStyle([('BOX',(0,0),(-1,-1),1,colors.black),
+                                                 ('VALIGN',(0,-1),(-1,-1),'BOTTOM'),
+                                                 ('SPAN',(0,0),(-1,0)),
+                                                 ('BOTTOMPADDING',(0,2),(0,2),15),  # Add bottom padding to stamp row
+                                                 ('LEFTPADDING',(0,2),(0,2),30),   # Add left padding to move stamp right
+                                                 ('TOPPADDING',(0,1),(0,1),0),     # Zero top padding for Terms row
+                                                 ('BOTTOMPADDING',(0,1),(0,1),0),  # Zero bottom padding for Terms row
+                                                 ('TOPPADDING',(0,2),(0,2),40)])   # Increased top padding to push e-signature down more
+
+        # Static blocks - identical on every invoice
+        self.supplier_heading = StaticBlock("supplier_heading",
+                                            Paragraph("<b>Supplier Name:</b><br/><br/>", self.header_style))  # Added equal spacing to supplier name
+        self.supplier_details = StaticBlock("supplier_details",
+                                            Paragraph(SUPPLIER_DETAILS, self.supplier_detail_style))
+        self.consignee_heading = StaticBlock("consignee_heading",
+                                             Paragraph("<b>Consignee:</b><br/><br/>", self.header_style))
+        self.lc_advising_bank = StaticBlock("lc_advising_bank",
+                                            Paragraph("<b>L/C Advising Bank:</b> (If applicable)", self.normal_style))
+        self.currency = StaticBlock("currency", Paragraph("<b>CURRENCY: USD</b>", self.currency_style))
+        self.terms = StaticBlock("terms", Paragraph("Terms & Conditions (If Any)", self.terms_style))
+        self.signed_by = StaticBlock("signed_by", Paragraph("Signed by …………………….(Affix Stamp here)", self.normal_style))
+        self.signatory = StaticBlock("signatory", Paragraph("&nbsp;" * 30 + SIGNATORY, self.normal_style))
+
+_invoice_template = None
+_invoice_template_lock = threading.Lock()
+
+def get_invoice_template():
+    """Process-wide InvoiceTemplate, built on first use"""
+    global _invoice_template
+    with _invoice_template_lock:
+        if _invoice_template is None:
+            _invoice_template = InvoiceTemplate()
+    return _invoice_template
+
+# ===== Product Table =====
+
+# Orders with at least this many lines are rendered with ChunkedProductTable
+LARGE_ORDER_ROWS = 500
+
+def subtotal_row_commands(row):
+    """Table style for one subtotal row: bold, rule above, label and QTY cells merged"""
+    return [('LINEABOVE',(0,row),(-1,row),0.5,colors.black),
+            ('SPAN',(0,row),(5,row)),
+            ('SPAN',(6,row),(7,row)),
+            ('FONTNAME',(0,row),(-1,row),'Helvetica-Bold')]
+
+
+class ChunkedProductTable(Flowable):
+    """Product lines of a large order, laid out one page at a time.
+
+    Every line has the same fixed height, so split() works out how many lines
+    fit from the available height alone and emits one Table per page, closed
+    by a page subtotal. A single long Table instead re-measures all remaining
+    rows at every page break. The last page also carries the blank spacer rows
+    and the order total. Lines listed in subtotal_rows (sorted indices into rows)
+    are styled like the page subtotal.
+    """
+
+    SPACER_ROWS = 5
+
+    def __init__(self, rows, qty, amount, template, start=0, subtotal_rows=None):
+        Flowable.__init__(self)
+        self.rows = rows
+        self.qty = qty
+        self.amount = amount
+        self.subtotal_rows = subtotal_rows if subtotal_rows is not None else np.array([], dtype=int)
+        # Running totals so any page's subtotal is one subtraction
+        self.qty_cumsum = qty.cumsum() if start == 0 else None
+        self.amount_cumsum = amount.cumsum() if start == 0 else None
+        self.template = template
+        self.start = start
+
+    def _remainder(self, start):
+        rest = ChunkedProductTable(self.rows, self.qty, self.amount, self.template, start, self.subtotal_rows)
+        rest.qty_cumsum, rest.amount_cumsum = self.qty_cumsum, self.amount_cumsum
+        return rest
+
+    def _subtotal(self, start, stop):
+        """(QTY, AMOUNT in cents) of lines start..stop"""
+        if stop == start:
+            return 0, 0
+        qty = self.qty_cumsum[stop - 1] - (self.qty_cumsum[start - 1] if start else 0)
+        amount = self.amount_cumsum[stop - 1] - (self.amount_cumsum[start - 1] if start else 0)
+        return int(qty), int(amount)
+
+    def _height(self, lines, last):
+        template = self.template
+        footer_rows = 1 + (self.SPACER_ROWS + 1 if last else 0)
+        return template.long_table_header_height + (lines + footer_rows) * template.long_table_row_height
+
+    def _table(self, start, stop, last):
+        """Header, lines start..stop, page subtotal and, on the last page, spacer rows and the order total"""
+        template = self.template
+        page_qty, page_amount = self._subtotal(start, stop)
+        data = [PRODUCT_HEADERS] + self.rows[start:stop]
+        data.append(["Page subtotal","","","","","",f"{page_qty:,}","",f"USD            {indian_format(page_amount / 100)}"])
+        commands = list(template.long_table_commands) + subtotal_row_commands(len(data) - 1)
+        first, end = np.searchsorted(self.subtotal_rows, [start, stop])
+        for row in self.subtotal_rows[first:end]:
+            # +1 for the header row
+            commands += subtotal_row_commands(int(row) - start + 1)
+        if last:
+            total_qty, total_amount = self._subtotal(0, len(self.rows))
+            data += [["","","","","","","","",""]] * self.SPACER_ROWS
+            data.append(["Total","","","","","",f"{total_qty:,}","",f"USD            {indian_format(total_amount / 100)}"])
+            commands += subtotal_row_commands(len(data) - 1)
+        heights = [template.long_table_header_height] + [template.long_table_row_height] * (len(data) - 1)
+        return Table(data, colWidths=template.product_col_widths, rowHeights=heights, style=TableStyle(commands))
+
+    def wrap(self, availWidth, availHeight):
+        self.width = sum(self.template.product_col_widths)
+        self.height = self._height(len(self.rows) - self.start, last=True)
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        template = self.template
+        remaining = len(self.rows) - self.start
+        fit = int((availHeight - self._height(0, last=False)) // template.long_table_row_height)
+        # Always leave at least one line for the last page, which also carries the total
+        lines = min(fit, remaining - 1)
+        if lines <= 0:
+            return []
+        stop = self.start + lines
+        return [self._table(self.start, stop, last=False), self._remainder(stop)]
+
+    def draw(self):
+        table = self._table(self.start, len(self.rows), last=True)
+        table.wrap(self.width, self.height)
+        table.drawOn(self.canv, 0, 0)
+
+
+# ===== PDF Generator =====
+def invoice_doc(output):
+    """A4 document template of the invoice, writing to a path or file object"""
+    doc = BaseDocTemplate(output, pagesize=A4,
+                          topMargin=24, bottomMargin=24,
+                          leftMargin=34.6, rightMargin=34.6)
+    frame = Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id='normal')
+    doc.addPageTemplates([PageTemplate(id='Invoice', frames=frame, pagesize=doc.pagesize)])
+    return doc
+
+
+def invoice_story(df, form_data, template=None, large_order=None, section_column=None):
+    """The flowables of one invoice, ready for a document build"""
+    if template is None:
+        template = get_invoice_template()
+    header_style = template.header_style
+    normal_style = template.normal_style
+    header_col_widths = template.header_col_widths
+
+    elements = []
+
+    elements.append(Paragraph("Proforma Invoice", template.title_style))
+
+    # Supplier section
+    supplier_data = [
+        [template.supplier_heading,
+         Paragraph(f"<b>No. & date of PI:</b> {form_data['pi_number']}<br/><br/>", header_style)],  # Keep spacing for PI number
+        [template.supplier_details,
+         Paragraph(f"<b>Landmark order Reference:</b> {form_data['order_ref']}<br/><b>Buyer Name:</b> {form_data['buyer_name']}<br/><b>Brand Name:</b> {form_data['brand_name']}", template.top_align_style)],
+    ]
+    elements.append(Table(supplier_data, colWidths=header_col_widths, style=template.supplier_table_style))
+
+    # Consignee section - ULTRA TIGHT SPACING
+    consignee_data = [
+        [template.consignee_heading,
+         Paragraph(f"<b>Payment Term:</b> {form_data['payment_term']}", normal_style)],
+        [Paragraph(f"{form_data['consignee_name']}<br/>{form_data['consignee_address']}<br/>{form_data['consignee_tel']}",
+                   template.consignee_style),
+         Paragraph(f"<br/><br/><b>Bank Details</b><br/><b>BENEFICIARY</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:-&nbsp;{form_data['bank_beneficiary']}<br/><b>ACCOUNT NO</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:- {form_data['bank_account']}<br/><b>BANK'S NAME</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:- {form_data['bank_name']}<br/><b>BANK ADDRESS</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:- 2 BRABOURNE ROAD, GOVIND BHAVAN,<br/>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;GROUND FLOOR, KOLKATA-700001<br/><b>SWIFT CODE</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:- {form_data['bank_swift']}<br/><b>BANK CODE</b>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;:- {form_data['bank_code']}",
+                   template.bank_style)]
+    ]
+    elements.append(Table(consignee_data, colWidths=header_col_widths, style=template.consignee_table_style))
+
+    # Shipping section - REDUCED SPACING BELOW AGREED SHIPMENT DATE
+    shipping_data = [
+        [Paragraph(f"<b>Loading Country:</b> {form_data['loading_country']}", normal_style),
+         template.lc_advising_bank],
+        [Paragraph(f"<b>Port of Loading:</b> {form_data['port_loading']}", normal_style), ""],
+        [Paragraph(f"<b>Agreed Shipment Date:</b> {form_data['shipment_date']}", normal_style), ""],
+        ["", Paragraph(f"<b>Remarks:</b> {form_data['remarks']}", normal_style)]
+    ]
+    shipping_table = Table(shipping_data, colWidths=header_col_widths, style=template.shipping_table_style)
+
+    # Set specific row heights to reduce spacing - reduced by 9 units total
+    shipping_table._argH[0] = 9   # Loading Country row (was 18, now 9)
+    shipping_table._argH[1] = 9   # Port of Loading row (was 18, now 9)
+    shipping_table._argH[2] = 9   # Agreed Shipment Date row (was 18, now 9)
+    shipping_table._argH[3] = 11  # Remarks row (was 20, now 11)
+
+    elements.append(shipping_table)
+
+    # Combined Goods and Currency block (NO LINE BETWEEN ROWS)
+    combined_data = [
+        # Row 1: Description of goods (left), Currency on right
+        [Paragraph(f"<b>Description of goods:</b> {form_data['goods_desc']}", template.goods_style),
+         template.currency]
+    ]
+    combined_table = Table(combined_data, colWidths=header_col_widths, style=template.combined_table_style)
+    # Set row height
+    combined_table._argH[0] = 50  # Single row height
+    elements.append(combined_table)
+
+    # Product Table with additional empty rows
+    rows, qty, amount = format_product_rows(df)
+    total_qty, total_cents = int(qty.sum()), int(amount.sum())
+    subtotal_rows = None
+    if section_column is not None and section_column in df.columns:
+        rows, qty, amount, subtotal_rows = add_section_subtotals(rows, qty, amount, df[section_column].astype(str))
+    if large_order is None:
+        large_order = len(rows) >= LARGE_ORDER_ROWS
+
+    if large_order:
+        # Page-sized tables with per-page subtotals; the last one carries the order total
+        elements.append(ChunkedProductTable(rows, qty, amount, template, subtotal_rows=subtotal_rows))
+    else:
+        table_data = [PRODUCT_HEADERS] + rows
+
+        # Add 5 empty rows for spacing
+        for i in range(5):
+            table_data.append(["","","","","","","","",""])
+
+        # TOTAL row with Indian formatting
+        table_data.append(
+            ["Total","","","","","",f"{total_qty:,}","",f"USD            {indian_format(total_cents / 100)}"]
+        )
+
+        product_table = Table(table_data,colWidths=template.product_col_widths, repeatRows=1)
+        product_table.setStyle(template.product_table_style)
+        if subtotal_rows is not None:
+            product_table.setStyle(TableStyle([command for row in subtotal_rows
+                                               for command in subtotal_row_commands(int(row) + 1)]))
+        elements.append(product_table)
+
+    # Signature block with e-stamp and total in words
+    total_words_str = total_in_words(total_cents)
+
+    signature_data = [
+        [Paragraph(total_words_str, template.total_words_style), ""],
+        [template.terms, ""],
+        [AssetImage(get_stamp(), width=2.4*inch, height=1.2*inch), ""],
+        ["", ""],  # Empty row for spacing
+        [template.signed_by, template.signatory]
+    ]
+    signature_table = Table(signature_data, colWidths=header_col_widths, style=template.signature_table_style)
+
+    # Set specific row heights
+    signature_table._argH[1] = 4   # Keep the "Terms & Conditions" row small
+    signature_table._argH[2] = 120 # Increase e-signature row height further to restore original spacing
+    elements.append(signature_table)
+    return elements
+
+
+def generate_proforma_invoice(df, form_data, template=None, large_order=None, section_column=None, output=None):
+    """Render the proforma invoice PDF; large_order=None picks the chunked product table from the line count.
+
+    With section_column (e.g. parsing.SHEET_COLUMN on a merged multi-sheet
+    order) each run of lines with the same value there closes with its own subtotal row.
+    Returns a BytesIO, or writes straight to output (a path or file object) and returns that.
+    """
+    laps = lap_timer()
+    elements = invoice_story(df, form_data, template, large_order, section_column)
+    laps.lap("build_story", len(df))
+
+    buffer = io.BytesIO() if output is None else output
+    doc = invoice_doc(buffer)
+    doc.build(elements)
+    laps.lap("doc_build", doc.page)
+    if output is None:
+        buffer.seek(0)
+    return buffer
+
+
+class _BundleAbandoned(Exception):
+    """Ends a bundle's build without writing the file"""
+
+
+class _StoryFeed(list):
+    """The flowables doc.build() lays out, refilled one invoice at a time as the build runs dry.
+
+    build() takes each flowable off the front once it is placed, so only the
+    invoice being laid out is held. next_story() returns the next invoice's
+    flowables, or None after the last one.
+    """
+
+    def __init__(self, next_story):
+        super().__init__()
+        self.next_story = next_story
+        self.ended = False
+
+    def __len__(self):
+        if not self.ended and not super().__len__():
+            story = self.next_story()
+            if story is None:
+                self.ended = True
+            else:
+                self.extend(story)
+        return super().__len__()
+
+
+class InvoiceBundle:
+    """Many invoices written into one PDF, each starting on a new page.
+
+    A single document build runs on a background thread for the whole
+    bundle. add() turns an invoice into flowables and hands them over, and
+    the build lays them out while the next order is read, so only the
+    invoice being added and the one being laid out are held as flowables;
+    reportlab keeps just its compact record of each finished page until
+    close() writes the file. Layout errors are raised by the next add() or
+    by close(). The stamp image and the static blocks are embedded once and
+    referenced from every invoice.
+
+        with InvoiceBundle("march.pdf") as bundle:
+            for df, form_data in orders:
+                bundle.add(df, form_data)
+    """
+
+    def __init__(self, output, template=None):
+        self.output = output
+        self.template = template or get_invoice_template()
+        self.invoices = 0
+        # One invoice waits here while the previous one is laid out; add() blocks beyond that
+        self._stories = queue.Queue(maxsize=1)
+        self._abandoned = False
+        self._error = None
+        self._builder = None
+        self._closed = False
+
+    def _next_story(self):
+        story = self._stories.get()
+        if story is None and self._abandoned:
+            raise _BundleAbandoned()
+        return story
+
+    def _build(self, laps):
+        doc = invoice_doc(self.output)
+        feed = _StoryFeed(self._next_story)
+        try:
+            doc.build(feed)
+            laps.lap("doc_build", doc.page)
+        except _BundleAbandoned:
+            pass
+        except Exception as e:
+            self._error = e
+            # Keep taking invoices until close() so add() never waits on a build that has stopped
+            while not feed.ended and self._next_story() is not None:
+                pass
+
+    def _start(self):
+        if self._builder is None:
+            # The lap timer is taken here, since the build thread does not see the caller's trace
+            self._builder = threading.Thread(target=self._build, args=(lap_timer(),), name="invoice-bundle",
+                                             daemon=True)
+            self._builder.start()
+
+    def add(self, df, form_data, large_order=None, section_column=None):
+        """Hand one more invoice to the build; returns the number of invoices added so far"""
+        if self._closed:
+            raise ValueError("InvoiceBundle is closed")
+        if self._error is not None:
+            raise self._error
+        laps = lap_timer()
+        story = invoice_story(df, form_data, self.template, large_order, section_column)
+        if self.invoices:
+            story.insert(0, PageBreak())
+        laps.lap("build_story", len(df))
+        self._start()
+        self._stories.put(story)
+        self.invoices += 1
+        return self.invoices
+
+    def _finish(self, abandon):
+        if self._closed:
+            return
+        self._closed = True
+        if abandon and self._builder is None:
+            return
+        self._abandoned = abandon
+        self._start()
+        self._stories.put(None)
+        self._builder.join()
+
+    def close(self):
+        """Lay out the invoices still queued and write the PDF to output"""
+        self._finish(abandon=False)
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave output as it was rather than write half a run
+            self._finish(abandon=True)
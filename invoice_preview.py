@@ -0,0 +1,132 @@
+from html import escape
+
+import numpy as np
+
+from invoice_format import (PRODUCT_HEADERS, SIGNATORY, SUPPLIER_DETAILS, add_section_subtotals,
+                            format_product_rows, indian_format, line_values, total_in_words)
+
+# Order lines shown in the preview table; the rest are summed into the totals
+PREVIEW_ROWS = 100
+
+# Scoped to the preview and marked !important, so the app's dark theme and font sizes don't reach the "paper"
+PREVIEW_CSS = """
+<style>
+.invoice-preview, .invoice-preview * { color: #000 !important; font-family: Helvetica, Arial, sans-serif !important;
+    font-size: 11px !important; line-height: 1.35 !important; }
+.invoice-preview { background: #fff; padding: 16px; border-radius: 4px; }
+.invoice-preview .ip-title { text-align: center; font-size: 14px !important; font-weight: 700 !important;
+    border: 1px solid #000; padding: 4px; margin-bottom: 6px; }
+.invoice-preview table { width: 100%; border-collapse: collapse; margin: 0; }
+.invoice-preview .ip-block td { width: 50%; border: 1px solid #000; padding: 3px 5px; vertical-align: top; }
+.invoice-preview .ip-lines th, .invoice-preview .ip-lines td { border: 1px solid #000; padding: 2px 4px;
+    text-align: center; }
+.invoice-preview .ip-lines th { font-weight: 700 !important; white-space: pre-line; }
+.invoice-preview .ip-lines .ip-sum td { font-weight: 700 !important; }
+.invoice-preview .ip-lines .ip-more td { font-style: italic; }
+.invoice-preview .ip-words { border: 1px solid #000; border-top: 0; padding: 4px 5px; font-weight: 700 !important; }
+</style>
+"""
+
+
+def _field(form_data, name):
+    return escape(str(form_data.get(name, "")))
+
+
+def _block(left, right):
+    return f'<table class="ip-block"><tr><td>{left}</td><td>{right}</td></tr></table>'
+
+
+def _row(cells, css_class=None):
+    attr = f' class="{css_class}"' if css_class else ""
+    return f"<tr{attr}>" + "".join(f"<td>{escape(str(cell))}</td>" for cell in cells) + "</tr>"
+
+
+def _sum_row(label, qty, amount):
+    """A subtotal/total row like the PDF's: label over the six text columns, QTY over two, AMOUNT; all text"""
+    return (f'<tr class="ip-sum"><td colspan="6">{escape(label)}</td><td colspan="2">{escape(qty)}</td>'
+            f"<td>{escape(amount)}</td></tr>")
+
+
+def _total_row(label, qty, cents):
+    return _sum_row(label, f"{int(qty):,}", f"USD {indian_format(int(cents) / 100)}")
+
+
+def section_totals(sections, qty, amount):
+    """[(section, QTY, AMOUNT in cents)] for each run of lines with the same section value"""
+    sections = np.asarray(sections, dtype=object)
+    if len(sections) == 0:
+        return []
+    ends = np.flatnonzero(np.append(sections[1:] != sections[:-1], True))
+    starts = np.append(0, ends[:-1] + 1)
+    return list(zip(sections[ends], np.add.reduceat(qty, starts), np.add.reduceat(amount, starts)))
+
+
+# ===== Preview =====
+def invoice_preview_html(df, form_data, section_column=None, max_rows=PREVIEW_ROWS):
+    """The invoice as an HTML fragment: header blocks, product table and totals, without building the PDF.
+
+    Totals cover every line; only the first max_rows lines are listed, so
+    the preview costs the same for any order size. Section subtotals
+    (section_column) sit inline when every line is listed and after the
+    listed lines otherwise.
+    """
+    qty, _, amount = line_values(df)
+    qty, amount = qty.to_numpy(), np.asarray(amount)
+    total_qty, total_cents = int(qty.sum()), int(amount.sum())
+    sections = df[section_column].astype(str) if section_column is not None and section_column in df.columns else None
+
+    rows, row_qty, row_amount = format_product_rows(df.iloc[:max_rows])
+    subtotal_rows = set()
+    if sections is not None and len(df) <= max_rows:
+        rows, _, _, positions = add_section_subtotals(rows, row_qty, row_amount, sections)
+        subtotal_rows = set(positions.tolist())
+
+    body = []
+    for i, row in enumerate(rows):
+        if i in subtotal_rows:
+            body.append(_sum_row(row[0], row[6], row[8]))
+        else:
+            body.append(_row(row))
+    hidden = len(df) - min(len(df), max_rows)
+    if hidden:
+        body.append(_row([f"… and {hidden:,} more line(s), listed in the PDF"] + [""] * 8, "ip-more"))
+        if sections is not None:
+            body += [_total_row(f"{section} subtotal", section_qty, section_cents)
+                     for section, section_qty, section_cents in section_totals(sections, qty, amount)]
+    body.append(_total_row("Total", total_qty, total_cents))
+
+    header = "".join(f"<th>{escape(h)}</th>" for h in PRODUCT_HEADERS)
+    bank = "<br/>".join([
+        "<b>Bank Details</b>",
+        f"<b>BENEFICIARY</b> :- {_field(form_data, 'bank_beneficiary')}",
+        f"<b>ACCOUNT NO</b> :- {_field(form_data, 'bank_account')}",
+        f"<b>BANK'S NAME</b> :- {_field(form_data, 'bank_name')}",
+        # The PDF prints this fixed address rather than the form's bank address
+        "<b>BANK ADDRESS</b> :- 2 BRABOURNE ROAD, GOVIND BHAVAN, GROUND FLOOR, KOLKATA-700001",
+        f"<b>SWIFT CODE</b> :- {_field(form_data, 'bank_swift')}",
+        f"<b>BANK CODE</b> :- {_field(form_data, 'bank_code')}",
+    ])
+    parts = [
+        PREVIEW_CSS,
+        '<div class="invoice-preview">',
+        '<div class="ip-title">Proforma Invoice</div>',
+        _block(f"<b>Supplier Name:</b><br/>{SUPPLIER_DETAILS}",
+               f"<b>No. & date of PI:</b> {_field(form_data, 'pi_number')}<br/>"
+               f"<b>Landmark order Reference:</b> {_field(form_data, 'order_ref')}<br/>"
+               f"<b>Buyer Name:</b> {_field(form_data, 'buyer_name')}<br/>"
+               f"<b>Brand Name:</b> {_field(form_data, 'brand_name')}"),
+        _block(f"<b>Consignee:</b><br/>{_field(form_data, 'consignee_name')}<br/>"
+               f"{_field(form_data, 'consignee_address')}<br/>{_field(form_data, 'consignee_tel')}",
+               f"<b>Payment Term:</b> {_field(form_data, 'payment_term')}<br/>{bank}"),
+        _block(f"<b>Loading Country:</b> {_field(form_data, 'loading_country')}<br/>"
+               f"<b>Port of Loading:</b> {_field(form_data, 'port_loading')}<br/>"
+               f"<b>Agreed Shipment Date:</b> {_field(form_data, 'shipment_date')}",
+               f"<b>L/C Advising Bank:</b> (If applicable)<br/><b>Remarks:</b> {_field(form_data, 'remarks')}"),
+        _block(f"<b>Description of goods:</b> {_field(form_data, 'goods_desc')}",
+               '<div style="text-align: right"><b>CURRENCY: USD</b></div>'),
+        f'<table class="ip-lines"><tr>{header}</tr>{"".join(body)}</table>',
+        f'<div class="ip-words">{escape(total_in_words(total_cents))}<br/><br/>'
+        f"Signed by …………………….(Affix Stamp here) &nbsp; {SIGNATORY}</div>",
+        "</div>",
+    ]
+    return "".join(parts)
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# An unreadable or unwritable store file is reported here rather than on stdout
+logger = logging.getLogger("invoice.layouts")
+
+
+# ===== Header Fingerprint =====
+def normalize_header(text):
+    """Header text compared case- and spacing-insensitively"""
+    return " ".join(str(text).split()).lower()
+
+
+def layout_fingerprint(header_row, headers, col_map):
+    """Digest of a header layout: where the header row sits, its normalized headers and the column map"""
+    payload = json.dumps([header_row, [normalize_header(h) for h in headers], col_map], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ===== Compiled Column Matcher =====
+class ColumnMatcher:
+    """A column map compiled into one regex, matched against each header once.
+
+    Gives the same mapping as trying every variant against every header in
+    turn: each target takes the first of its variants (in col_map order) that
+    some header contains, case-insensitively, and the first such header.
+    """
+
+    def __init__(self, col_map):
+        self.col_map = col_map
+        variants = sorted({v.lower() for names in col_map.values() for v in names}, key=len, reverse=True)
+        # A lookahead finds the longest variant starting at every position, overlaps included
+        self.pattern = re.compile("(?=(" + "|".join(re.escape(v) for v in variants) + "))")
+        # Any shorter variant matching at the same position is a prefix of the longest one
+        self.prefixes = {v: [w for w in variants if v.startswith(w)] for v in variants}
+
+    def match(self, headers):
+        """(mapping, choices): mapping is {target: header position or None}; choices explains each
+        target's pick, with the other headers that also matched, for review"""
+        first_header = {}
+        matched_by = {}
+        for position, header in enumerate(headers):
+            text = str(header).lower()
+            for m in self.pattern.finditer(text):
+                for variant in self.prefixes[m.group(1)]:
+                    first_header.setdefault(variant, position)
+                    matched_by.setdefault(variant, []).append(position)
+
+        mapping, choices = {}, {}
+        for target, variants in self.col_map.items():
+            found = next(((v, first_header[v.lower()]) for v in variants if v.lower() in first_header), None)
+            mapping[target] = found[1] if found else None
+            candidates = sorted({p for v in variants for p in matched_by.get(v.lower(), [])})
+            choices[target] = {
+                "header": str(headers[found[1]]) if found else None,
+                "variant": found[0] if found else None,
+                "alternatives": [str(headers[p]) for p in candidates if not found or p != found[1]],
+            }
+        return mapping, choices
+
+
+# ===== Layout Store =====
+class LayoutStore:
+    """Resolved column mappings of known header layouts, keyed by layout_fingerprint().
+
+    Holds at most max_entries layouts, dropping the least recently used. With
+    a path the store is loaded from and saved to that JSON file, so the
+    mappings (and the choices behind them) survive restarts and can be
+    reviewed or corrected by hand. Each process keeps its own copy; the last
+    one to save wins.
+    """
+
+    def __init__(self, path=None, max_entries=256):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._layouts = OrderedDict()
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning("Ignoring unreadable layout store %s: %s", self.path, e)
+            return
+        for entry in sorted(entries, key=lambda e: e.get("last_used", 0)):
+            self._layouts[entry["fingerprint"]] = entry
+        self._evict()
+
+    def _evict(self):
+        while len(self._layouts) > self.max_entries:
+            self._layouts.popitem(last=False)
+
+    def header_rows(self):
+        """Header row positions of the known layouts, most used first"""
+        with self._lock:
+            counts = {}
+            for layout in self._layouts.values():
+                counts[layout["header_row"]] = counts.get(layout["header_row"], 0) + layout["hits"] + 1
+        return sorted(counts, key=counts.get, reverse=True)
+
+    def get(self, fingerprint):
+        """The stored layout, or None for an unknown one"""
+        with self._lock:
+            layout = self._layouts.get(fingerprint)
+            if layout is not None:
+                layout["hits"] += 1
+                layout["last_used"] = time.time()
+                self._layouts.move_to_end(fingerprint)
+            return layout
+
+    def put(self, fingerprint, layout):
+        with self._lock:
+            self._layouts[fingerprint] = dict(layout, fingerprint=fingerprint, hits=0, last_used=time.time())
+            self._layouts.move_to_end(fingerprint)
+            self._evict()
+        self.save()
+
+    def layouts(self):
+        """Every stored layout, most recently used first"""
+        with self._lock:
+            return [dict(layout) for layout in reversed(self._layouts.values())]
+
+    def __len__(self):
+        return len(self._layouts)
+
+    def save(self):
+        """Write the store to its JSON file (hit counts included); a no-op without a path"""
+        if not self.path:
+            return
+        entries = self.layouts()
+        # Write to a temp file first so a crashed write never leaves a truncated store
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning("Could not write layout store %s: %s", self.path, e)
+
+    def clear(self):
+        with self._lock:
+            self._layouts.clear()
+        self.save()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def layout_store():
+    """Process-wide LayoutStore; INVOICE_LAYOUT_STORE names its JSON file, INVOICE_LAYOUT_ENTRIES bounds it"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LayoutStore(os.environ.get("INVOICE_LAYOUT_STORE") or None,
+                                 int(os.environ.get("INVOICE_LAYOUT_ENTRIES", "256")))
+        return _store
@@ -0,0 +1,298 @@
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import marshal
+import pstats
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("invoice.metrics")
+
+_current_trace = contextvars.ContextVar("invoice_pipeline_trace", default=None)
+
+
+def max_rss_mb():
+    """High-water mark of this process's resident memory in MB, or None where unavailable"""
+    if resource is None:
+        return None
+    # ru_maxrss is KB on Linux (bytes on macOS, close enough for a diagnostic)
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+# ===== Pipeline Trace =====
+class PipelineTrace:
+    """Wall time, row counts and peak memory of each stage of one request.
+
+    With trace_memory the peak is what tracemalloc saw allocated during the
+    stage; tracing makes allocation-heavy stages noticeably slower. Without it
+    the peak is the process's maximum RSS when the stage finished.
+    """
+
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.records = []
+        self.started = time.perf_counter()
+        self.total_seconds = None
+        self._started_tracemalloc = False
+
+    @property
+    def memory_source(self):
+        return "tracemalloc" if self.trace_memory else "max RSS"
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time one stage; set record["rows"] inside the block to report how many rows it handled.
+
+        Stages are meant to be flat: a nested stage resets the tracemalloc peak of its parent.
+        """
+        record = {"rows": None}
+        timer = self.laps()
+        try:
+            yield record
+        finally:
+            timer.lap(name, record["rows"])
+
+    def laps(self):
+        """A LapTimer whose laps are recorded as stages of this trace"""
+        return LapTimer(self)
+
+    def _record(self, name, seconds, rows, peak_bytes):
+        if self.trace_memory:
+            peak_mb = round(peak_bytes / (1024 * 1024), 2)
+        else:
+            peak_mb = max_rss_mb()
+        self.records.append({"stage": name, "seconds": round(seconds, 5), "rows": rows, "peak_mb": peak_mb})
+
+    def ran(self, *stages):
+        """True if any of the named stages was recorded"""
+        return any(r["stage"] in stages for r in self.records)
+
+    def _start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def _finish(self):
+        self.total_seconds = round(time.perf_counter() - self.started, 5)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+
+class LapTimer:
+    """Times consecutive stages of straight-line code: each lap() closes the stage that just ran"""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._restart()
+
+    def _restart(self):
+        if self.trace.trace_memory:
+            tracemalloc.reset_peak()
+            self._base = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+
+    def lap(self, name, rows=None):
+        """Record the time since the previous lap (or since the timer was created) as stage name"""
+        seconds = time.perf_counter() - self._start
+        peak = tracemalloc.get_traced_memory()[1] - self._base if self.trace.trace_memory else None
+        self.trace._record(name, seconds, rows, peak)
+        self._restart()
+
+
+class _NullLapTimer:
+    def lap(self, name, rows=None):
+        pass
+
+
+@contextlib.contextmanager
+def trace_request(name, trace_memory=False, registry=None):
+    """Collect stage() records from everything called inside the block into a new PipelineTrace.
+
+    On exit each stage is written to the "invoice.metrics" logger as a JSON line
+    and added to the process-wide metrics registry.
+    """
+    trace = PipelineTrace(name, trace_memory)
+    trace._start()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace._finish()
+        registry = registry or REGISTRY
+        for record in trace.records:
+            registry.observe(record)
+            logger.info(json.dumps(dict(record, event="stage", request=name)))
+        logger.info(json.dumps({"event": "request", "request": name, "seconds": trace.total_seconds,
+                                "stages": len(trace.records), "max_rss_mb": max_rss_mb()}))
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Record a stage on the active trace; a cheap no-op when nothing is being traced"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield {}
+        return
+    with trace.stage(name) as record:
+        yield record
+
+
+def lap_timer():
+    """LapTimer on the active trace, or one that records nothing when nothing is being traced"""
+    trace = _current_trace.get()
+    return _NullLapTimer() if trace is None else trace.laps()
+
+
+# ===== Metrics Registry =====
+class MetricsRegistry:
+    """Running per-stage totals across all requests of the process, in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._collectors = []
+
+    def add_collector(self, collect):
+        """Append collect()'s exposition lines (gauges of a cache or store) to every prometheus_text()"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def observe(self, record):
+        with self._lock:
+            totals = self._stages.setdefault(record["stage"], {"runs": 0, "seconds": 0.0, "rows": 0, "last": 0.0, "max": 0.0})
+            totals["runs"] += 1
+            totals["seconds"] += record["seconds"]
+            totals["rows"] += record["rows"] or 0
+            totals["last"] = record["seconds"]
+            totals["max"] = max(totals["max"], record["seconds"])
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(totals) for name, totals in self._stages.items()}
+
+    def prometheus_text(self):
+        """Exposition text for a /metrics endpoint"""
+        stages = self.snapshot()
+        series = [
+            ("invoice_stage_runs_total", "counter", "Times each pipeline stage ran", "runs"),
+            ("invoice_stage_seconds_total", "counter", "Wall time spent in each pipeline stage", "seconds"),
+            ("invoice_stage_rows_total", "counter", "Rows handled by each pipeline stage", "rows"),
+            ("invoice_stage_last_seconds", "gauge", "Wall time of the latest run of each stage", "last"),
+            ("invoice_stage_max_seconds", "gauge", "Slowest run of each stage", "max"),
+        ]
+        lines = []
+        for metric, kind, help_text, key in series:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name in sorted(stages):
+                lines.append(f'{metric}{{stage="{name}"}} {stages[name][key]:g}')
+        rss = max_rss_mb()
+        if rss is not None:
+            lines.append("# HELP invoice_process_max_rss_bytes Peak resident memory of the process")
+            lines.append("# TYPE invoice_process_max_rss_bytes gauge")
+            lines.append(f"invoice_process_max_rss_bytes {int(rss * 1024 * 1024)}")
+        with self._lock:
+            collectors = list(self._collectors)
+        for collect in collectors:
+            lines += collect()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would otherwise flood stderr
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=None):
+    """Serve registry.prometheus_text() at http://host:port/metrics from a daemon thread"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry or REGISTRY})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def enable_metrics_log(stream=None):
+    """Print the JSON stage lines of the "invoice.metrics" logger to stderr (or stream)"""
+    if not any(getattr(h, "_invoice_metrics", False) for h in logger.handlers):
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler._invoice_metrics = True
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+# ===== Profiling =====
+_profile_lock = threading.Lock()
+
+
+class ProfileCapture:
+    """cProfile of one block of code; dump() gives bytes that pstats/snakeviz can load"""
+
+    def __init__(self):
+        self.profile = None
+        self.skipped = False
+
+    def dump(self):
+        return marshal.dumps(self.profile.stats) if self.profile else b""
+
+    def summary(self, limit=25):
+        """Top functions by cumulative time, as pstats prints them"""
+        if not self.profile:
+            return ""
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+@contextlib.contextmanager
+def capture_profile(enabled=True):
+    """Profile the block when enabled; only one block per process is profiled at a time"""
+    capture = ProfileCapture()
+    if not enabled:
+        yield capture
+        return
+    # Python allows a single active profiler, so a concurrent request just goes unprofiled
+    if not _profile_lock.acquire(blocking=False):
+        capture.skipped = True
+        yield capture
+        return
+    try:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield capture
+        finally:
+            profile.disable()
+            profile.create_stats()
+            capture.profile = profile
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+
+# ===== Integer Cents =====
+def to_cents(dollars):
+    """Dollar amounts (scalar, array or Series) as int64 cents, rounding half a cent up.
+
+    Missing, infinite or non-numeric values count as zero. Values are first rounded to
+    six decimals so a price stored as 1.005 (really 1.00499999...) still
+    becomes 101 cents.
+    """
+    values = np.atleast_1d(np.asarray(dollars))
+    if values.dtype.kind not in "biuf":
+        values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    values = values.astype(float)
+    values = np.where(np.isfinite(values), values, 0.0)
+    # Half away from zero, so credits round like charges
+    cents = (np.sign(values) * np.floor(np.round(np.abs(values) * 100, 6) + 0.5)).astype(np.int64)
+    return cents if np.ndim(dollars) else int(cents[0])
+
+
+def from_cents(cents):
+    """Cents as float dollars; every whole number of cents maps to the same float, so they compare and group exactly"""
+    return np.asarray(cents, dtype=np.int64) / 100
+
+
+def whole_dollars(cents):
+    """Total cents rounded to whole dollars, half a dollar up, e.g. for the amount in words"""
+    cents = int(cents)
+    return (cents + 50) // 100 if cents >= 0 else -((-cents + 50) // 100)
@@ -0,0 +1,339 @@
+import numpy as np
+import pandas as pd
+
+from metrics import lap_timer
+from money import from_cents, to_cents
+
+NUMERIC_COLUMNS = ["QTY", "UNIT PRICE", "AMOUNT"]
+
+# Longest text each column may show on the invoice before it is cut with "..."
+TEXT_LIMITS = {
+    "STYLE NO": 12,
+    "ITEM DESCRIPTION": 18,
+    "FABRIC TYPE": 12,
+    "COMPOSITION": 15,
+}
+COUNTRY_LIMIT = 12
+
+# Common country abbreviations
+COUNTRY_ABBREVIATIONS = {
+    "United States of America": "USA",
+    "United Kingdom": "UK",
+    "United Arab Emirates": "UAE",
+    "Saudi Arabia": "KSA",
+    "South Africa": "ZA",
+    "New Zealand": "NZ",
+}
+
+
+# ===== Vectorized Text Helpers =====
+def fill_text(values):
+    """values with NaN replaced by an empty string; categoricals gain "" as a category if they need it"""
+    if isinstance(values.dtype, pd.CategoricalDtype) and values.hasnans and "" not in values.cat.categories:
+        values = values.cat.add_categories("")
+    return values.fillna("")
+
+
+def per_category(values, transform):
+    """transform(values) for a categorical Series, worked out once per category rather than once per row"""
+    values = fill_text(values)
+    text = pd.Index(transform(pd.Series(values.cat.categories)))
+    # The transform can map two categories to the same text
+    categories = text.unique()
+    codes = categories.get_indexer(text)[values.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=values.index)
+
+
+def plain_text_columns(df):
+    """df with categorical columns turned back into ordinary strings, e.g. for st.data_editor,
+    which would otherwise offer a category's existing values as a fixed choice"""
+    categorical = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    return df.astype({c: "str" for c in categorical}) if categorical else df
+
+
+def truncate_series(values, max_length=15):
+    """Strip text and cut anything longer than max_length to max_length-3 chars plus an ellipsis"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return per_category(values, lambda text: truncate_series(text, max_length))
+    text = values.fillna("").astype(str).str.strip()
+    too_long = text.str.len() > max_length
+    return text.where(~too_long, text.str[:max_length - 3] + "...")
+
+
+def abbreviate_countries(values, max_length=COUNTRY_LIMIT):
+    """Replace known country names with their abbreviation and truncate the rest"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return per_category(values, lambda text: abbreviate_countries(text, max_length))
+    text = values.fillna("").astype(str).str.strip()
+    abbreviated = text.map(COUNTRY_ABBREVIATIONS)
+    return abbreviated.where(abbreviated.notna(), truncate_series(text, max_length))
+
+
+# ===== Single-value Text Helpers =====
+def truncate_text(value, max_length=15):
+    """truncate_series() for one value"""
+    text = "" if pd.isna(value) else str(value).strip()
+    return text if len(text) <= max_length else text[:max_length - 3] + "..."
+
+
+def abbreviate_country(value, max_length=COUNTRY_LIMIT):
+    """abbreviate_countries() for one value"""
+    text = "" if pd.isna(value) else str(value).strip()
+    return COUNTRY_ABBREVIATIONS.get(text) or truncate_text(text, max_length)
+
+
+# ===== Validation =====
+def rejection_reasons(edited_df):
+    """Why each row would be dropped from the invoice; empty string for rows that are kept.
+
+    Checks the rows as the user left them, before NaNs are filled with defaults:
+    STYLE NO must be non-blank, QTY and UNIT PRICE must be present (zero is allowed).
+    """
+    n = len(edited_df)
+    style = edited_df["STYLE NO"] if "STYLE NO" in edited_df.columns else pd.Series([np.nan] * n, index=edited_df.index)
+    checks = [
+        ("missing STYLE NO", style.isna().to_numpy() | (style.astype(str).str.strip() == "").to_numpy()),
+        ("missing QTY", _missing(edited_df, "QTY")),
+        ("missing UNIT PRICE", _missing(edited_df, "UNIT PRICE")),
+    ]
+
+    reasons = pd.Series("", index=edited_df.index, dtype=object)
+    for reason, mask in checks:
+        separator = np.where(reasons == "", "", "; ")
+        reasons = reasons.where(~mask, reasons + separator + reason)
+    return reasons
+
+
+def _missing(df, col):
+    if col not in df.columns:
+        return np.ones(len(df), dtype=bool)
+    return df[col].isna().to_numpy()
+
+
+# ===== Normalization Stage =====
+def normalize_rows(edited_df):
+    """Clean and truncate every row and say why each would be rejected; no rows are dropped.
+
+    Returns (normalized_df, reasons) indexed like edited_df. Each row only
+    depends on itself, so any subset of rows can be normalized on its own.
+    """
+    working_df = edited_df.copy()
+
+    # Clean and handle NaN values before processing
+    for col in working_df.columns:
+        if col in NUMERIC_COLUMNS:
+            # Replace NaN with 0 for numeric columns
+            working_df[col] = working_df[col].fillna(0)
+        else:
+            # Replace NaN with empty string for text columns
+            working_df[col] = fill_text(working_df[col])
+
+    # Convert numeric columns with proper error handling; prices are kept to whole cents
+    working_df["QTY"] = pd.to_numeric(working_df["QTY"], errors="coerce").fillna(0).astype(int)
+    price_cents = to_cents(working_df["UNIT PRICE"])
+    working_df["UNIT PRICE"] = from_cents(price_cents)
+
+    # Apply truncation and abbreviations column by column
+    working_df["COUNTRY OF ORIGIN"] = abbreviate_countries(
+        working_df.get("COUNTRY OF ORIGIN", pd.Series("", index=working_df.index)))
+    for col, max_length in TEXT_LIMITS.items():
+        working_df[col] = truncate_series(working_df.get(col, pd.Series("", index=working_df.index)), max_length)
+
+    # Calculate amounts after all cleaning is done, in cents so they hold an exact number of cents
+    working_df["AMOUNT"] = from_cents(working_df["QTY"].to_numpy() * price_cents)
+
+    return working_df, rejection_reasons(edited_df)
+
+
+def normalize_invoice_lines(edited_df):
+    """Clean, truncate and validate data_editor rows in bulk.
+
+    Returns (working_df, rejected_df): the invoice-ready rows with recomputed
+    AMOUNT, and the dropped rows as the user left them plus a REASON column.
+    """
+    laps = lap_timer()
+    working_df, reasons = normalize_rows(edited_df)
+
+    # Remove rows where required fields are not filled (but allow zero values)
+    keep = (reasons == "").to_numpy()
+    rejected_df = edited_df[~keep].assign(REASON=reasons[~keep])
+    working_df = working_df[keep].reset_index(drop=True)
+    laps.lap("normalize", len(working_df))
+    return working_df, rejected_df
+
+
+def prepare_invoice_lines(edited_df):
+    """Clean, truncate and validate data_editor rows before they go on the invoice"""
+    working_df, _ = normalize_invoice_lines(edited_df)
+    return working_df
+
+
+# ===== Incremental Normalization =====
+# Up to this many changed rows are renormalized value by value: for a handful
+# of rows the fixed cost of each pandas column operation outweighs the work
+ROW_AT_A_TIME_LIMIT = 64
+
+
+def _to_number(value):
+    """pd.to_numeric(errors="coerce").fillna(0) for one value"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if number != number else number
+
+
+def normalize_few_rows(edited_df):
+    """normalize_rows() one value at a time, for the few rows a data_editor edit touches"""
+    n = len(edited_df)
+    columns = {}
+    for col in edited_df.columns:
+        fill = 0 if col in NUMERIC_COLUMNS else ""
+        columns[col] = [fill if pd.isna(v) else v for v in edited_df[col].tolist()]
+    columns["QTY"] = [int(_to_number(v)) for v in columns["QTY"]]
+    price_cents = to_cents(np.array([_to_number(v) for v in columns["UNIT PRICE"]], dtype=float))
+    columns["UNIT PRICE"] = from_cents(price_cents).tolist()
+    columns["COUNTRY OF ORIGIN"] = [abbreviate_country(v) for v in columns.get("COUNTRY OF ORIGIN", [""] * n)]
+    for col, max_length in TEXT_LIMITS.items():
+        columns[col] = [truncate_text(v, max_length) for v in columns.get(col, [""] * n)]
+    columns["AMOUNT"] = from_cents(np.array(columns["QTY"], dtype=np.int64) * price_cents).tolist()
+
+    def missing(col):
+        return edited_df[col].isna().tolist() if col in edited_df.columns else [True] * n
+
+    styles = edited_df["STYLE NO"].tolist() if "STYLE NO" in edited_df.columns else [None] * n
+    checks = [
+        ("missing STYLE NO", [pd.isna(v) or str(v).strip() == "" for v in styles]),
+        ("missing QTY", missing("QTY")),
+        ("missing UNIT PRICE", missing("UNIT PRICE")),
+    ]
+    reasons = ["; ".join(reason for reason, flags in checks if flags[i]) for i in range(n)]
+    return pd.DataFrame(columns, index=edited_df.index), pd.Series(reasons, index=edited_df.index, dtype=object)
+
+
+def changed_mask(before, after):
+    """True for each row of after whose values differ from the same row of before (same index; NaN equals NaN)"""
+    changed = np.zeros(len(after), dtype=bool)
+    for col in after.columns:
+        a, b = after[col], before[col]
+        if a.dtype.kind == "f" and b.dtype.kind == "f":
+            x, y = a.to_numpy(), b.to_numpy()
+            changed |= ~((x == y) | (np.isnan(x) & np.isnan(y)))
+        else:
+            changed |= ~(a.eq(b) | (a.isna() & b.isna())).to_numpy()
+    return changed
+
+
+class IncrementalNormalizer:
+    """normalize_invoice_lines() for a data_editor frame that changes a few cells per rerun.
+
+    Keeps every row of the last frame normalized (rejected ones included)
+    along with the QTY and AMOUNT (in cents) totals of the kept rows. update() diffs the
+    new frame against the last one and renormalizes only the rows that were
+    edited or added; removed rows just drop out. The totals move by the
+    difference the touched rows make. A change of columns, or an index with
+    duplicates, starts over with a full pass. Categorical columns are compared
+    and stored as plain text, since edits can bring in any value.
+    """
+
+    def __init__(self):
+        self.source = None
+        self.normalized = None
+        self.reasons = None
+        self.kept = None
+        self.total_qty = 0
+        self.total_cents = 0
+        self.rows_recomputed = 0
+        self._result = None
+
+    @property
+    def total_amount(self):
+        return self.total_cents / 100
+
+    def _normalize(self, rows):
+        if len(rows) > ROW_AT_A_TIME_LIMIT:
+            normalized, reasons = normalize_rows(rows)
+        else:
+            normalized, reasons = normalize_few_rows(rows)
+        return normalized, reasons.to_numpy()
+
+    def _kept_totals(self, positions):
+        kept = positions[self.kept[positions]]
+        return (int(self.normalized["QTY"].to_numpy()[kept].sum()),
+                int(to_cents(self.normalized["AMOUNT"].to_numpy()[kept]).sum()))
+
+    def _full(self, edited_df):
+        self.normalized, reasons = normalize_rows(edited_df)
+        # A writable copy; pandas hands out read-only views
+        self.reasons = np.array(reasons, dtype=object)
+        self.kept = self.reasons == ""
+        self.total_qty, self.total_cents = self._kept_totals(np.arange(len(edited_df)))
+        self.rows_recomputed = len(edited_df)
+
+    def _patch(self, edited_df, positions):
+        """Cells edited in place: overwrite just the normalized values that changed"""
+        qty, amount = self._kept_totals(positions)
+        normalized, reasons = self._normalize(edited_df.iloc[positions])
+        for j, col in enumerate(normalized.columns):
+            values = normalized[col].tolist()
+            if self.normalized[col].iloc[positions].tolist() != values:
+                self.normalized.iloc[positions, j] = values
+        self.reasons[positions] = reasons
+        self.kept[positions] = reasons == ""
+        new_qty, new_amount = self._kept_totals(positions)
+        self.total_qty += new_qty - qty
+        self.total_cents += new_amount - amount
+
+    def _reshape(self, previous, edited_df):
+        """Rows added or removed: keep the unchanged rows, renormalize the rest, restore the editor's order"""
+        common = edited_df.index.intersection(previous.index)
+        changed = common[changed_mask(previous.loc[common], edited_df.loc[common])]
+        dirty = changed.append(edited_df.index.difference(previous.index))
+        stale = previous.index.get_indexer(changed.append(previous.index.difference(edited_df.index)))
+        qty, amount = self._kept_totals(stale)
+
+        unchanged = np.setdiff1d(np.arange(len(previous)), stale)
+        normalized, reasons = self._normalize(edited_df.loc[dirty])
+        # The value-at-a-time path builds plain object columns
+        normalized = normalized.astype(self.normalized.dtypes.to_dict())
+        order = pd.Index(previous.index[unchanged].append(dirty)).get_indexer(edited_df.index)
+        self.normalized = pd.concat([self.normalized.iloc[unchanged], normalized]).iloc[order]
+        self.reasons = np.concatenate([self.reasons[unchanged], reasons])[order]
+        self.kept = self.reasons == ""
+        new_qty, new_amount = self._kept_totals(order.argsort()[len(unchanged):])
+        self.total_qty += new_qty - qty
+        self.total_cents += new_amount - amount
+        self.rows_recomputed = len(dirty)
+
+    def update(self, edited_df):
+        """Same (working_df, rejected_df) as normalize_invoice_lines(edited_df), recomputing only changed rows"""
+        laps = lap_timer()
+        edited_df = plain_text_columns(edited_df)
+        previous = self.source
+        unchanged = False
+        if (previous is None or not previous.columns.equals(edited_df.columns)
+                or not edited_df.index.is_unique):
+            self._full(edited_df)
+            self._result = None
+        elif edited_df.index.equals(previous.index):
+            positions = np.flatnonzero(changed_mask(previous, edited_df))
+            self.rows_recomputed = len(positions)
+            if len(positions):
+                self._patch(edited_df, positions)
+                self._result = None
+            unchanged = not len(positions)
+        else:
+            self._reshape(previous, edited_df)
+            self._result = None
+        if not unchanged:
+            # An unchanged frame keeps the copy already held, so a plain rerun allocates nothing
+            self.source = edited_df.copy()
+
+        if self._result is None:
+            rejected = ~self.kept
+            rejected_df = edited_df[rejected].assign(
+                REASON=pd.Series(self.reasons[rejected], index=edited_df.index[rejected], dtype=object))
+            working_df = self.normalized[self.kept].reset_index(drop=True)
+            self._result = (working_df, rejected_df)
+        laps.lap("normalize_incremental", self.rows_recomputed)
+        return self._result
@@ -0,0 +1,507 @@
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from cache import parse_cache_key
+from extraction import FABRIC_TYPE_MATCHER, INVOICE_DETAIL_MATCHER
+from ingest import list_worksheets, read_workbook, stream_workbook
+from layouts import ColumnMatcher, layout_fingerprint, layout_store, normalize_header
+from metrics import lap_timer, stage
+from money import from_cents, to_cents
+
+# ===== Column Mapping =====
+COLUMN_MAP = {
+    "STYLE NO": ["Style", "Style No", "Item Style", "STYLE"],
+    "ITEM DESCRIPTION": ["Descreption", "Description", "Item Description", "Item Desc", "DESC"],
+    "COMPOSITION": ["Composition", "Fabric Composition"],
+    "UNIT PRICE": ["Fob$", "USD Fob$", "Fob USD", "Fob $", "Unit Price", "FOB"],
+    "QTY": ["Total Qty", "Quantity", "Qty", "QTY"],
+    "AMOUNT": ["Total Value", "Amount", "Value", "TOTAL VALUE"],
+}
+
+# Columns of the order lines preprocess_excel_flexible_auto returns, in invoice order
+ORDER_LINE_COLUMNS = [
+    "STYLE NO", "ITEM DESCRIPTION", "FABRIC TYPE", "HS CODE",
+    "COMPOSITION", "COUNTRY OF ORIGIN", "QTY", "UNIT PRICE", "AMOUNT",
+]
+
+# Files from this size (in MB) up are parsed with preprocess_streaming; an xlsx holds about 20,000 order rows per MB
+STREAMING_MIN_MB = 2
+
+# Column that records which worksheet each line of a merged multi-sheet order came from
+SHEET_COLUMN = "SHEET"
+
+# Column that lists the POs each line of a consolidated invoice came from
+PO_COLUMN = "PO"
+
+
+class HeaderNotFound(ValueError):
+    """The sheet has no row with a "Style" column header"""
+
+# ===== PI Number =====
+def generate_pi_number():
+    """Generate PI Number with today's date"""
+    today = datetime.datetime.now()
+    pi_date = today.strftime("%d/%m/%Y")
+    # Simple counter - in production, you might want a more sophisticated numbering system
+    import random
+    pi_num = f"SAR/LG/{random.randint(1000, 9999)}"
+    return f"{pi_num} Dt. {pi_date}"
+
+# ===== Auto-extraction Function =====
+def extract_invoice_details(workbook):
+    """Extract invoice details from Excel sheet using keyword search - only from first 6 rows"""
+    extracted_data = {'pi_number': generate_pi_number()}
+    with stage("extract_details") as record:
+        extracted_data.update(INVOICE_DETAIL_MATCHER.match(workbook.cells))
+        record["rows"] = len(workbook.cells)
+    return extracted_data
+
+# ===== Fabric Type Lookup =====
+def extract_fabric_type(workbook, default="Knitted"):
+    """Read fabric type by searching the visible rows for the "Texture :" keyword; workbook may also be a cell grid"""
+    try:
+        cells = workbook.visible_cells() if hasattr(workbook, "visible_cells") else workbook
+        return FABRIC_TYPE_MATCHER.match(cells).get('fabric_type', default)
+    except Exception as e:
+        return default  # Default fallback if search fails
+
+# ===== Compact Columns =====
+def group_sum(df, keys, value):
+    """df.groupby(keys, dropna=False, as_index=False)[value].sum() with text keys returned as categoricals.
+
+    Each key column is factorized once into sorted codes and the codes are
+    combined into one integer per row, so the grouping itself is integer work
+    and the grouped text comes back dictionary-encoded for free.
+    """
+    combined = np.zeros(len(df), dtype=np.int64)
+    radix = 1
+    factors = []
+    for col in keys:
+        codes, uniques = pd.factorize(df[col], sort=True)
+        # NaN groups last, as groupby(dropna=False) orders it
+        codes = np.where(codes < 0, len(uniques), codes)
+        if radix * (len(uniques) + 1) >= 2 ** 62:
+            # Renumber the combinations seen so far before the combined key could overflow
+            combined = np.unique(combined, return_inverse=True)[1].astype(np.int64)
+            radix = int(combined.max()) + 1 if len(combined) else 1
+        combined = combined * (len(uniques) + 1) + codes
+        radix *= len(uniques) + 1
+        factors.append((codes, uniques))
+
+    # Sorted unique keys put the groups in key order, like groupby(sort=True)
+    _, first, groups = np.unique(combined, return_index=True, return_inverse=True)
+    columns = {}
+    for col, (codes, uniques) in zip(keys, factors):
+        if pd.api.types.is_numeric_dtype(df[col]):
+            columns[col] = df[col].to_numpy()[first]
+        else:
+            group_codes = codes[first]
+            columns[col] = pd.Categorical.from_codes(np.where(group_codes == len(uniques), -1, group_codes), categories=uniques)
+    totals = np.zeros(len(first), dtype=np.int64)
+    np.add.at(totals, groups, df[value].to_numpy(dtype=np.int64))
+    columns[value] = totals
+    return pd.DataFrame(columns)
+
+
+def constant_categorical(value, length):
+    """A column holding value on every row, stored once"""
+    return pd.Categorical.from_codes(np.zeros(length, dtype=np.int8), categories=[value])
+
+# ===== Header Layout =====
+_matchers = {}
+
+
+def column_matcher(col_map):
+    """ColumnMatcher for col_map, compiled once per distinct map"""
+    key = json.dumps(col_map, sort_keys=True)
+    if key not in _matchers:
+        _matchers[key] = ColumnMatcher(col_map)
+    return _matchers[key]
+
+
+def style_rows(grid):
+    """For each row of a cell grid (2-d object array): does any cell contain "Style" (any case)?"""
+    return (np.char.find(np.char.lower(grid.astype(str)), "style") >= 0).any(axis=1)
+
+
+def stacked_headers(grid, header_row_idx):
+    """Header texts of the grid row at header_row_idx, each joined with the cell above it when there is one"""
+    texts = [str(value) for value in grid[header_row_idx]]
+    if header_row_idx > 0:
+        texts = [f"{above} {text}" for above, text in zip(map(str, grid[header_row_idx - 1]), texts)]
+    return pd.Series([text.strip() for text in texts], dtype="str")
+
+
+def resolve_header_layout(df_raw, max_rows, col_map, layouts=None):
+    """Find the header row and map its headers to col_map's columns.
+
+    Returns (header row index, headers, {target column: header or None}, layout).
+    A sheet whose header row matches a layout in the store (same position,
+    same headers, no "Style" above) reuses the stored mapping without any
+    matching; otherwise the first row with "Style" among the first max_rows
+    is matched with the compiled ColumnMatcher and the result stored. layout
+    is what the store keeps: fingerprint, header row, normalized headers,
+    mapping, the matcher's choices and whether it was already known.
+    """
+    if layouts is None:
+        layouts = layout_store()
+    # Only the first max_rows rows can hold the header; one small grid is cheaper than row-by-row access
+    grid = df_raw.iloc[:max_rows].to_numpy(dtype=object)
+
+    for header_row_idx in layouts.header_rows():
+        if header_row_idx >= len(grid):
+            continue
+        # The first "Style" row is the header, so a layout lower down must have none above it
+        if style_rows(grid[:header_row_idx]).any():
+            continue
+        headers = stacked_headers(grid, header_row_idx)
+        layout = layouts.get(layout_fingerprint(header_row_idx, headers, col_map))
+        normalized = [normalize_header(h) for h in headers]
+        # A hand-edited mapping naming a header this layout doesn't have is ignored
+        if layout is None or any(name is not None and name not in normalized for name in layout["mapping"].values()):
+            continue
+        df_columns = {target: None if name is None else headers.iloc[normalized.index(name)]
+                      for target, name in layout["mapping"].items()}
+        return header_row_idx, headers, df_columns, dict(layout, known=True)
+
+    style = np.flatnonzero(style_rows(grid))
+    if not len(style):
+        raise HeaderNotFound("Could not detect header row with 'Style' column!")
+    header_row_idx = int(style[0])
+    headers = stacked_headers(grid, header_row_idx)
+    positions, choices = column_matcher(col_map).match(list(headers))
+    df_columns = {target: None if p is None else headers.iloc[p] for target, p in positions.items()}
+
+    fingerprint = layout_fingerprint(header_row_idx, headers, col_map)
+    layout = {
+        "header_row": header_row_idx,
+        "headers": [normalize_header(h) for h in headers],
+        "mapping": {target: None if p is None else normalize_header(headers.iloc[p]) for target, p in positions.items()},
+        "choices": choices,
+    }
+    layouts.put(fingerprint, layout)
+    return header_row_idx, headers, df_columns, dict(layout, fingerprint=fingerprint, known=False)
+
+# ===== Preprocessing Function =====
+# Order lines with the same values here are one invoice line
+GROUP_BY_COLUMNS = ["STYLE NO", "ITEM DESCRIPTION", "COMPOSITION", "UNIT PRICE"]
+
+
+def clean_order_rows(rows, headers, df_columns):
+    """The order rows among raw cell rows below the header: named, filtered, QTY as int and UNIT PRICE in cents.
+
+    Works on any run of rows on its own, so a sheet can be cleaned all at once or a chunk at a time.
+    """
+    df = rows.reindex(columns=range(len(headers)))
+    df.columns = headers
+    df = df.reset_index(drop=True)
+
+    rename_dict = {v: k for k, v in df_columns.items() if v is not None}
+    if rename_dict:
+        df = df.rename(columns=rename_dict)
+
+    required_cols_defaults = {
+        "STYLE NO": "",
+        "ITEM DESCRIPTION": "",
+        "COMPOSITION": "",
+        "UNIT PRICE": 0.0,
+        "QTY": 0,
+        "AMOUNT": 0.0,
+    }
+    for col, default in required_cols_defaults.items():
+        if col not in df.columns:
+            df[col] = default
+
+    df["STYLE NO"] = df["STYLE NO"].astype(str).str.strip()
+    df = df[~df["STYLE NO"].isin(["", "nan", "NaN", "None", "NONE"])]
+    df = df[~df["STYLE NO"].str.contains("total|grand|remarks|note", case=False, na=False)]
+    
+    # Remove specific unwanted style codes (as backup filter)
+    df = df[df["STYLE NO"] != "SA0167A21"]
+
+    df["QTY"] = pd.to_numeric(df.get("QTY", 0), errors="coerce").fillna(0).astype(int)
+    # Whole cents, so prices that differ only by float noise fall into the same group
+    df["UNIT PRICE"] = to_cents(df.get("UNIT PRICE", 0.0))
+
+    df = df[~((df["QTY"] == 0) & (df["UNIT PRICE"] == 0) & (df["STYLE NO"].str.strip() == ""))]
+
+    for c in GROUP_BY_COLUMNS:
+        if c not in df.columns:
+            df[c] = "" if c != "UNIT PRICE" else 0
+    return df
+
+
+def finish_order_lines(grouped, fabric_type_value, layout):
+    """Grouped rows (UNIT PRICE in cents) as order lines: AMOUNT, the constant columns, invoice column order"""
+    price_cents = grouped["UNIT PRICE"].to_numpy()
+    grouped["AMOUNT"] = from_cents(grouped["QTY"].to_numpy() * price_cents)
+    grouped["UNIT PRICE"] = from_cents(price_cents)
+
+    # static extras
+    grouped["FABRIC TYPE"] = constant_categorical(fabric_type_value, len(grouped))
+    grouped["HS CODE"] = constant_categorical("61112000", len(grouped))
+    grouped["COUNTRY OF ORIGIN"] = constant_categorical("India", len(grouped))
+
+    for c in ORDER_LINE_COLUMNS:
+        if c not in grouped.columns:
+            grouped[c] = "" if c not in ["QTY", "UNIT PRICE", "AMOUNT"] else 0.0
+    grouped = grouped[ORDER_LINE_COLUMNS].reset_index(drop=True)
+    grouped.attrs["header_layout"] = layout
+    return grouped
+
+
+def preprocess_excel_flexible_auto(workbook, max_rows=20, col_map=None, layouts=None):
+    """Grouped order lines of a PO sheet.
+
+    Text columns come back as categoricals; UNIT PRICE is grouped on as whole
+    cents and AMOUNT is QTY x UNIT PRICE worked out in cents, both returned as
+    dollar floats that hold an exact number of cents. The header layout used
+    is recorded in df.attrs["header_layout"]; layouts is the LayoutStore of
+    known layouts (the process-wide one by default).
+    """
+    laps = lap_timer()
+
+    # Work only on the rows that are visible in Excel
+    df_raw = workbook.visible_cells()
+    laps.lap("filter_visible", len(df_raw))
+
+    if col_map is None:
+        col_map = COLUMN_MAP
+
+    # detect header row, or recognise a known header layout
+    header_row_idx, headers, df_columns, layout = resolve_header_layout(df_raw, max_rows, col_map, layouts)
+    laps.lap("known_header" if layout["known"] else "detect_header", header_row_idx + 1)
+
+    df = clean_order_rows(df_raw.iloc[header_row_idx + 1:], headers, df_columns)
+    laps.lap("clean_rows", len(df))
+
+    grouped = group_sum(df, GROUP_BY_COLUMNS, "QTY")
+    laps.lap("group_lines", len(grouped))
+
+    fabric_type_value = extract_fabric_type(workbook)
+    laps.lap("extract_fabric_type")
+
+    return finish_order_lines(grouped, fabric_type_value, layout)
+
+
+# ===== Streaming Preprocessing =====
+def preprocess_streaming(head, chunks, max_rows=20, col_map=None, layouts=None):
+    """preprocess_excel_flexible_auto for a sheet read with stream_workbook, one chunk of rows at a time.
+
+    The header is found in head; then every chunk of rows is cleaned and
+    folded into the running style-level aggregate straight away, so memory
+    grows with the number of distinct order lines rather than with the rows
+    of the sheet. Gives the same order lines as the whole-sheet parse.
+    """
+    laps = lap_timer()
+    if col_map is None:
+        col_map = COLUMN_MAP
+
+    head_rows = head.visible_cells()
+    header_row_idx, headers, df_columns, layout = resolve_header_layout(head_rows, max_rows, col_map, layouts)
+    laps.lap("known_header" if layout["known"] else "detect_header", header_row_idx + 1)
+
+    running = None
+    fabric_type_value = None
+    rows = 0
+    for position, chunk in enumerate(itertools.chain([head_rows], chunks)):
+        rows += len(chunk)
+        # "Texture :" sits on the same row as its value, so the first chunk that has one decides
+        if fabric_type_value is None:
+            fabric_type_value = extract_fabric_type(chunk, default=None)
+        lines = clean_order_rows(chunk.iloc[header_row_idx + 1:] if position == 0 else chunk, headers, df_columns)
+        lines = lines[GROUP_BY_COLUMNS + ["QTY"]]
+        if running is not None:
+            lines = pd.concat([running, lines], ignore_index=True)
+        running = group_sum(lines, GROUP_BY_COLUMNS, "QTY")
+    laps.lap("stream_rows", rows)
+
+    # Text columns read in one go come back with str categories, other columns with object ones
+    for col in ["ITEM DESCRIPTION", "COMPOSITION"]:
+        positions = [i for i, header in enumerate(headers) if header == df_columns.get(col)]
+        text = not positions or (len(positions) == 1 and positions[0] in chunks.text_columns)
+        categories = running[col].cat.categories.astype("str" if text else object)
+        running[col] = pd.Categorical.from_codes(running[col].cat.codes, categories=categories)
+
+    return finish_order_lines(running, fabric_type_value or "Knitted", layout)
+
+# ===== Multi-sheet Workbooks =====
+def streaming_min_bytes():
+    """Files of this many bytes and up are parsed a chunk of rows at a time; INVOICE_STREAM_MIN_MB overrides it"""
+    return int(float(os.environ.get("INVOICE_STREAM_MIN_MB", STREAMING_MIN_MB)) * 1024 * 1024)
+
+
+def parse_sheet(file_bytes, sheet_name, max_rows=20, col_map=None, file_name=None):
+    """Parse one worksheet; returns (order lines, extracted header fields) or None without a "Style" header.
+
+    Large files are streamed (see preprocess_streaming) rather than read
+    whole. Module-level so it can run on a process pool; the PI number is
+    left to the caller.
+    """
+    try:
+        if len(file_bytes) >= streaming_min_bytes():
+            workbook, chunks = stream_workbook(io.BytesIO(file_bytes), sheet_name, head_rows=max_rows,
+                                               file_name=file_name)
+            with contextlib.closing(chunks):
+                df = preprocess_streaming(workbook, chunks, max_rows=max_rows, col_map=col_map)
+        else:
+            workbook = read_workbook(io.BytesIO(file_bytes), sheet_name, file_name=file_name)
+            df = preprocess_excel_flexible_auto(workbook, max_rows=max_rows, col_map=col_map)
+    except HeaderNotFound:
+        return None
+    extracted = extract_invoice_details(workbook)
+    extracted.pop('pi_number', None)
+    return df, extracted
+
+
+def load_order_sheets(uploaded_file, parse_cache, executor=None, max_rows=20, col_map=None):
+    """Parse every worksheet that has a "Style" header row, concurrently when an executor is given.
+
+    Returns [(sheet name, order lines, extracted fields)] in workbook order,
+    each with a fresh pi_number. Sheets are cached one by one, including the
+    ones without a header so reruns don't parse them again; parse_cache=None
+    parses every sheet without caching. Raises HeaderNotFound when no sheet
+    has a header row.
+    """
+    if col_map is None:
+        col_map = COLUMN_MAP
+
+    uploaded_file.seek(0)
+    file_bytes = uploaded_file.read()
+    file_name = getattr(uploaded_file, "name", None)
+    sheet_names = list_worksheets(io.BytesIO(file_bytes), file_name)
+
+    results = {}
+    misses = []
+    with stage("parse_cache_get") as record:
+        for name in sheet_names:
+            key = parse_cache_key(file_bytes, max_rows, col_map, sheet_name=name)
+            cached = parse_cache.get(key) if parse_cache is not None else None
+            if cached is None:
+                misses.append((name, key))
+            else:
+                results[name] = cached
+        record["rows"] = len(results)
+
+    if misses:
+        with stage("parse_sheets") as record:
+            if executor is not None and len(misses) > 1:
+                futures = [executor.submit(parse_sheet, file_bytes, name, max_rows, col_map, file_name)
+                           for name, _ in misses]
+                parsed = [future.result() for future in futures]
+            else:
+                parsed = [parse_sheet(file_bytes, name, max_rows, col_map, file_name) for name, _ in misses]
+            for (name, key), result in zip(misses, parsed):
+                # () marks a sheet without an order, since None means a cache miss
+                results[name] = result if result is not None else ()
+                if parse_cache is not None:
+                    parse_cache.put(key, results[name])
+            record["rows"] = len(misses)
+
+    orders = [(name, results[name][0].copy(), dict(results[name][1], pi_number=generate_pi_number()))
+              for name in sheet_names if results[name]]
+    if not orders:
+        raise HeaderNotFound("Could not detect header row with 'Style' column!")
+    return orders
+
+
+def merge_sheet_orders(orders):
+    """One order from several sheets: all lines in workbook order, with the sheet name in SHEET_COLUMN"""
+    frames = [df.assign(**{SHEET_COLUMN: name}) for name, df, _ in orders]
+    merged = pd.concat(frames, ignore_index=True)
+    return merged[[SHEET_COLUMN] + [c for c in merged.columns if c != SHEET_COLUMN]]
+
+
+def merge_sheet_details(orders):
+    """Header fields for a merged invoice: the first sheet's, with every sheet's order reference listed"""
+    details = dict(orders[0][2])
+    refs = [extracted['order_ref'] for _, _, extracted in orders if extracted.get('order_ref')]
+    if refs:
+        details['order_ref'] = ", ".join(dict.fromkeys(refs))
+    return details
+
+
+def sheet_form_data(form_data, form_extracted, sheet_extracted):
+    """Form values for one sheet's own invoice.
+
+    Any field the user left at the value the form was pre-filled with
+    (form_extracted) takes this sheet's extracted value instead, so PI numbers,
+    order references and ship dates follow their sheet while manual edits still win.
+    """
+    sheet_form = dict(form_data)
+    for field, value in sheet_extracted.items():
+        if field in sheet_form and sheet_form[field] == form_extracted.get(field):
+            sheet_form[field] = value
+    return sheet_form
+
+
+# ===== Consolidated Orders =====
+# Lines from different POs merge when all of these match; FABRIC TYPE, HS CODE and
+# COUNTRY OF ORIGIN are constant within a PO but can differ between them
+CONSOLIDATION_KEYS = ["STYLE NO", "ITEM DESCRIPTION", "FABRIC TYPE", "HS CODE",
+                      "COMPOSITION", "COUNTRY OF ORIGIN", "UNIT PRICE"]
+
+
+def order_source(extracted, file_name, sheet_name=None):
+    """Label of one PO on a consolidated invoice: its order reference, else the file (and sheet) name"""
+    if extracted.get('order_ref'):
+        return extracted['order_ref']
+    return file_name if sheet_name is None else f"{file_name} / {sheet_name}"
+
+
+class OrderConsolidator:
+    """Running aggregate of the order lines of many POs, folded in one PO at a time.
+
+    add() merges a PO's grouped lines into the aggregate straight away, so
+    only the aggregate (one row per distinct line and PO) is kept, never the
+    POs themselves. lines() gives the consolidated invoice lines with the POs
+    each came from in PO_COLUMN.
+    """
+
+    def __init__(self):
+        self._running = None
+        self.sources = []
+
+    def add(self, df, source):
+        """Fold the order lines of one PO (as preprocess_excel_flexible_auto returns them) into the aggregate"""
+        lines = df[CONSOLIDATION_KEYS + ["QTY"]].assign(**{PO_COLUMN: source, "UNIT PRICE": to_cents(df["UNIT PRICE"])})
+        if self._running is not None:
+            lines = pd.concat([self._running, lines], ignore_index=True)
+        self._running = group_sum(lines, CONSOLIDATION_KEYS + [PO_COLUMN], "QTY")
+        self.sources.append(source)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def lines(self):
+        """Consolidated order lines, PO_COLUMN first, with QTY summed over every PO that has the line"""
+        running = self._running
+        columns = [PO_COLUMN] + ORDER_LINE_COLUMNS
+        if running is None:
+            return pd.DataFrame(columns=columns)
+        # group_sum sorts by PO last, so the rows of one line are next to each other
+        changed = np.zeros(len(running), dtype=bool)
+        changed[:1] = True
+        for col in CONSOLIDATION_KEYS:
+            values = running[col].cat.codes.to_numpy() if isinstance(running[col].dtype, pd.CategoricalDtype) else running[col].to_numpy()
+            changed[1:] |= values[1:] != values[:-1]
+        starts = np.flatnonzero(changed)
+        ends = np.append(starts[1:], len(running))
+
+        consolidated = running.iloc[starts][CONSOLIDATION_KEYS].reset_index(drop=True)
+        qty = np.add.reduceat(running["QTY"].to_numpy(), starts) if len(starts) else np.zeros(0, dtype=np.int64)
+        sources = running[PO_COLUMN].astype(str).tolist()
+        price_cents = consolidated["UNIT PRICE"].to_numpy()
+        consolidated["QTY"] = qty
+        consolidated["UNIT PRICE"] = from_cents(price_cents)
+        consolidated["AMOUNT"] = from_cents(qty * price_cents)
+        consolidated[PO_COLUMN] = [", ".join(sources[start:end]) for start, end in zip(starts, ends)]
+        return consolidated[columns]
+
@@ -0,0 +1,200 @@
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from cache import pdf_cache_key
+from metrics import REGISTRY, trace_request
+
+# Seconds per invoice line assumed until a render has been timed
+DEFAULT_SECONDS_PER_LINE = 0.0005
+DEFAULT_SECONDS_PER_JOB = 0.1
+
+
+class RenderQueueFull(Exception):
+    """The render pool already holds its maximum number of queued and running jobs"""
+
+
+# ===== Worker Process =====
+def _warm_worker():
+    """Build the invoice template and load the stamp before the first job arrives"""
+    from invoice_pdf import get_invoice_template
+    from assets import get_stamp
+    get_invoice_template()
+    get_stamp()
+
+
+def _render(df, form_data, section_column=None):
+    """Runs in a worker process: PDF bytes plus the stage records of the render"""
+    from invoice_pdf import generate_proforma_invoice
+    with trace_request("render_job") as trace:
+        pdf = generate_proforma_invoice(df, form_data, section_column=section_column).getvalue()
+    return pdf, trace.records
+
+
+# ===== Job Handle =====
+class RenderJob:
+    """Handle for one queued PDF render; safe to keep in st.session_state"""
+
+    def __init__(self, job_id, key, future, lines, estimate):
+        self.id = job_id
+        self.key = key
+        self.future = future
+        self.lines = lines
+        self.estimate = estimate
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        # Served from the PDF cache without a render
+        self.cached = False
+        self.cacheable = False
+
+    @property
+    def status(self):
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            return "failed" if self.future.exception() is not None else "done"
+        return "running" if self.started is not None else "queued"
+
+    def done(self):
+        return self.future.done()
+
+    def progress(self):
+        """Estimated completion between 0 and 1, from the recent seconds-per-line rate"""
+        if self.future.done():
+            return 1.0
+        if self.started is None:
+            return 0.0
+        # Never claim completion before the worker reports it
+        return min((time.monotonic() - self.started) / max(self.estimate, 1e-3), 0.95)
+
+    def elapsed(self):
+        end = self.finished or time.monotonic()
+        return end - self.submitted
+
+    def result(self, timeout=None):
+        """What the worker function produced; raises the worker's exception if it failed"""
+        result, _ = self.future.result(timeout)
+        return result
+
+    def pdf_bytes(self):
+        """The rendered PDF of a RenderPool.submit() job"""
+        return self.result()
+
+    def cancel(self):
+        """Drop the job if no worker has picked it up yet"""
+        return self.future.cancel()
+
+
+# ===== Render Pool =====
+class RenderPool:
+    """Process pool shared by every session of the server, with a hard cap on outstanding jobs.
+
+    max_workers renders run in parallel; at most max_pending jobs (running
+    plus queued) are accepted, and submit() raises RenderQueueFull beyond that.
+    With a cache.PdfCache, submit() serves PDFs rendered before straight from
+    it and stores every new one.
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, pdf_cache=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pdf_cache = pdf_cache
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._seconds_per_line = None
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        # Forking a multi-threaded Streamlit server can deadlock a child, so workers are spawned
+        return ProcessPoolExecutor(max_workers=self.max_workers, initializer=_warm_worker,
+                                   mp_context=multiprocessing.get_context("spawn"))
+
+    def estimate_seconds(self, lines):
+        rate = self._seconds_per_line or DEFAULT_SECONDS_PER_LINE
+        return DEFAULT_SECONDS_PER_JOB + rate * lines
+
+    def submit(self, df, form_data, section_column=None):
+        """Queue a render of df with form_data and return its RenderJob.
+
+        An identical request that is still pending returns the existing job,
+        and one already in the PDF cache a finished job holding the cached PDF.
+        """
+        key = pdf_cache_key(df, form_data, section_column)
+        if self.pdf_cache is not None:
+            pdf = self.pdf_cache.get(key)
+            if pdf is not None:
+                return self._cached_job(key, pdf, len(df))
+        return self.submit_task(key, _render, df, dict(form_data), section_column, lines=len(df),
+                                cacheable=self.pdf_cache is not None)
+
+    def _cached_job(self, key, pdf, lines):
+        future = Future()
+        future.set_result((pdf, []))
+        job = RenderJob(next(self._ids), key, future, lines, 0.0)
+        job.started = job.finished = job.submitted
+        job.cached = True
+        return job
+
+    def submit_task(self, key, func, *args, lines=0, cacheable=False):
+        """Queue func(*args) on a worker; func must return (result, stage records).
+
+        Jobs are de-duplicated on key while pending; raises RenderQueueFull when
+        max_pending jobs are already outstanding. With cacheable the result,
+        PDF bytes, is stored in the pool's PDF cache under key.
+        """
+        with self._lock:
+            for job in self._pending.values():
+                if job.key == key:
+                    return job
+            if len(self._pending) >= self.max_pending:
+                raise RenderQueueFull(
+                    f"{len(self._pending)} PDFs are already being generated; please try again shortly")
+            try:
+                future = self._executor.submit(func, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); start a fresh pool for new jobs
+                self._executor = self._new_executor()
+                future = self._executor.submit(func, *args)
+            job = RenderJob(next(self._ids), key, future, lines, self.estimate_seconds(lines))
+            job.cacheable = cacheable
+            self._pending[job.id] = job
+            # The first jobs begin straight away; later ones are marked running in _finished
+            if len(self._pending) <= self.max_workers:
+                job.started = job.submitted
+        future.add_done_callback(lambda f, job=job: self._finished(job))
+        return job
+
+    def _finished(self, job):
+        job.finished = time.monotonic()
+        with self._lock:
+            self._pending.pop(job.id, None)
+            # The oldest queued job takes the freed worker
+            for waiting in self._pending.values():
+                if waiting.started is None:
+                    waiting.started = job.finished
+                    break
+        if job.future.cancelled() or job.future.exception() is not None:
+            return
+        result, records = job.future.result()
+        if job.cacheable:
+            self.pdf_cache.put(job.key, result)
+        for record in records:
+            REGISTRY.observe(record)
+        if job.lines:
+            # Time measured in the worker, so process start-up and queueing don't inflate the rate
+            render_seconds = sum(record["seconds"] for record in records)
+            rate = max(render_seconds - DEFAULT_SECONDS_PER_JOB, 0) / job.lines
+            # Smooth the rate so one unusual order doesn't swing every estimate
+            self._seconds_per_line = rate if self._seconds_per_line is None else 0.7 * self._seconds_per_line + 0.3 * rate
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
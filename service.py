@@ -0,0 +1,339 @@
+"""Local HTTP service that turns a buyer PO workbook into a proforma invoice PDF.
+
+    python service.py --port 8502 --workers 2 --queue 8 --defaults defaults.json
+
+POST /render
+    Either a JSON body {"workbook": "<base64 xlsx>", "form": {...form fields...}}
+    or the raw xlsx bytes, with the form fields as JSON in an X-Invoice-Form
+    header. CSV exports (and xls/xlsb/ods with python-calamine) work as well;
+    the format is recognised from the bytes. Form fields override values extracted from the PO, which override
+    the defaults file and form_fields.FORM_DEFAULTS. Every sheet with a "Style"
+    header goes on one invoice, with a subtotal per sheet when there are
+    several (X-Invoice-Sheets gives the count). Returns application/pdf.
+    When every worker is busy and the queue is full the answer is 429 with
+    Retry-After and X-Queue-Depth / X-Queue-Limit headers.
+GET /healthz
+    JSON with worker, queue and request counts.
+GET /metrics
+    Prometheus text: pipeline stage totals plus request and queue gauges.
+
+With --pdf-cache DIR a PO whose lines and form fields were rendered before is
+answered from the PDF kept in DIR (X-Invoice-Cache: hit), and /healthz and
+/metrics report the cache's hits, misses and evictions.
+
+Bind to localhost (the default) or put it behind something that authenticates.
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from form_fields import FORM_DEFAULTS
+from metrics import REGISTRY, trace_request
+from render_jobs import RenderPool, RenderQueueFull
+
+MAX_BODY_BYTES = 50 * 1024 * 1024
+
+
+class InvalidOrder(Exception):
+    """The uploaded workbook could not be turned into invoice lines"""
+
+
+# ===== Worker =====
+def render_workbook(data, form, defaults, pdf_cache=None):
+    """Runs in a worker process: parse, extract, normalize and render one PO.
+
+    With pdf_cache, a (directory, max bytes) pair, a PDF rendered before for
+    the same lines and form fields is served from that directory instead.
+    Returns ((pdf bytes, invoice lines, order sheets, cache report), stage
+    records) as RenderPool expects; the cache report is None without a cache.
+    """
+    from batch import build_form_data
+    from cache import pdf_cache_key, shared_pdf_cache
+    from invoice_pdf import generate_proforma_invoice
+    from normalization import prepare_invoice_lines
+    from parsing import SHEET_COLUMN, load_order_sheets, merge_sheet_details, merge_sheet_orders
+
+    with trace_request("service_render") as trace:
+        try:
+            orders = load_order_sheets(io.BytesIO(data), None)
+        except Exception as e:
+            # Parse failures are the client's file, so the handler answers 422 rather than 500
+            raise InvalidOrder(f"{type(e).__name__}: {e}") from None
+        if len(orders) == 1:
+            _, df, extracted = orders[0]
+        else:
+            df, extracted = merge_sheet_orders(orders), merge_sheet_details(orders)
+        form_data = build_form_data(extracted, defaults)
+        form_data.update(form)
+        lines = prepare_invoice_lines(df)
+        cache_report = pdf = None
+        if pdf_cache is not None:
+            cache = shared_pdf_cache(*pdf_cache)
+            # A PI number the client didn't send is generated afresh on every parse, so it stays out of the key
+            key_fields = form_data if "pi_number" in form else {k: v for k, v in form_data.items() if k != "pi_number"}
+            key = pdf_cache_key(lines, key_fields, SHEET_COLUMN)
+            pdf = cache.get(key)
+            cache_report = {"hit": pdf is not None, "pid": os.getpid()}
+        if pdf is None:
+            pdf = generate_proforma_invoice(lines, form_data, section_column=SHEET_COLUMN).getvalue()
+            if pdf_cache is not None:
+                cache.put(key, pdf)
+        if cache_report is not None:
+            cache_report["stats"] = cache.stats()
+    return (pdf, len(lines), len(orders), cache_report), trace.records
+
+
+# ===== Service State =====
+class RenderService:
+    """The worker pool, defaults and request counters behind the HTTP handler"""
+
+    def __init__(self, workers=2, queue=8, defaults=None, timeout=300, pdf_cache=None):
+        self.pool = RenderPool(max_workers=workers, max_pending=queue)
+        self.defaults = defaults or {}
+        self.timeout = timeout
+        self.pdf_cache = pdf_cache
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.responses = {}
+        # Latest PdfCache.stats() of each worker process, which count their own hits and evictions
+        self.cache_stats = {}
+
+    def record_cache(self, cache_report):
+        if cache_report is not None:
+            with self._lock:
+                self.cache_stats[cache_report["pid"]] = cache_report["stats"]
+
+    def pdf_cache_totals(self):
+        """Cache counts summed over the worker processes, or None without a cache"""
+        if self.pdf_cache is None:
+            return None
+        with self._lock:
+            worker_stats = list(self.cache_stats.values())
+        totals = {name: sum(stats[name] for stats in worker_stats)
+                  for name in ("hits", "misses", "stores", "evictions", "evicted_bytes")}
+        # Every worker shares the directory, so the last one to look reports its size
+        totals["disk_bytes"] = worker_stats[-1]["disk_bytes"] if worker_stats else 0
+        totals["disk_entries"] = worker_stats[-1]["disk_entries"] if worker_stats else 0
+        return totals
+
+    def count(self, status):
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+
+    def queue_headers(self):
+        return {
+            "X-Queue-Depth": str(self.pool.pending()),
+            "X-Queue-Limit": str(self.pool.max_pending),
+            "X-Workers": str(self.pool.max_workers),
+        }
+
+    def health(self):
+        with self._lock:
+            responses = dict(self.responses)
+        return {
+            "status": "ok",
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "workers": self.pool.max_workers,
+            "queue_depth": self.pool.pending(),
+            "queue_limit": self.pool.max_pending,
+            "responses": responses,
+            "pdf_cache": self.pdf_cache_totals(),
+        }
+
+    def metrics_text(self):
+        with self._lock:
+            responses = dict(self.responses)
+        lines = [
+            "# HELP invoice_service_queue_depth Renders running or waiting for a worker",
+            "# TYPE invoice_service_queue_depth gauge",
+            f"invoice_service_queue_depth {self.pool.pending()}",
+            "# HELP invoice_service_queue_limit Renders accepted before answering 429",
+            "# TYPE invoice_service_queue_limit gauge",
+            f"invoice_service_queue_limit {self.pool.max_pending}",
+            "# HELP invoice_service_responses_total HTTP responses by status code",
+            "# TYPE invoice_service_responses_total counter",
+        ]
+        lines += [f'invoice_service_responses_total{{code="{code}"}} {n}' for code, n in sorted(responses.items())]
+        cache = self.pdf_cache_totals()
+        if cache is not None:
+            for name, kind, help_text in [
+                ("hits", "counter", "Renders served from the PDF cache"),
+                ("misses", "counter", "Renders not found in the PDF cache"),
+                ("evictions", "counter", "PDFs dropped from the cache to stay within its size limit"),
+                ("evicted_bytes", "counter", "Bytes of the PDFs dropped from the cache"),
+                ("disk_bytes", "gauge", "Bytes of PDFs the cache directory holds"),
+                ("disk_entries", "gauge", "PDFs the cache directory holds"),
+            ]:
+                metric = f"invoice_pdf_cache_{name}" + ("_total" if kind == "counter" else "")
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}", f"{metric} {cache[name]}"]
+        return REGISTRY.prometheus_text() + "\n".join(lines) + "\n"
+
+    def submit(self, data, form):
+        digest = hashlib.sha256(data)
+        digest.update(json.dumps(form, sort_keys=True).encode("utf-8"))
+        return self.pool.submit_task(digest.hexdigest(), render_workbook, data, form, self.defaults, self.pdf_cache)
+
+
+# ===== HTTP Handler =====
+class RenderHandler(BaseHTTPRequestHandler):
+    service = None
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body, content_type, headers=None):
+        self.service.count(status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/healthz":
+            self._send_json(200, self.service.health(), self.service.queue_headers())
+        elif path == "/metrics":
+            self._send(200, self.service.metrics_text().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send_json(404, {"error": f"no such endpoint: {path}"})
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/render":
+            self._send_json(404, {"error": f"no such endpoint: {self.path}"})
+            return
+        try:
+            data, form = self._read_request()
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except OverflowError as e:
+            self._send_json(413, {"error": str(e)})
+            return
+
+        service = self.service
+        try:
+            job = service.submit(data, form)
+        except RenderQueueFull as e:
+            self._send_json(429, {"error": str(e)}, dict(service.queue_headers(), **{"Retry-After": "1"}))
+            return
+
+        try:
+            pdf, lines, sheets, cache_report = job.result(timeout=service.timeout)
+        except FutureTimeout:
+            self._send_json(504, {"error": f"render did not finish within {service.timeout}s"}, service.queue_headers())
+            return
+        except InvalidOrder as e:
+            self._send_json(422, {"error": str(e)}, service.queue_headers())
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"}, service.queue_headers())
+            return
+
+        service.record_cache(cache_report)
+        headers = dict(service.queue_headers())
+        if cache_report is not None:
+            headers["X-Invoice-Cache"] = "hit" if cache_report["hit"] else "miss"
+        headers["X-Invoice-Lines"] = str(lines)
+        headers["X-Invoice-Sheets"] = str(sheets)
+        headers["X-Render-Seconds"] = f"{job.elapsed():.3f}"
+        headers["Content-Disposition"] = 'attachment; filename="proforma_invoice.pdf"'
+        self._send(200, pdf, "application/pdf", headers)
+
+    def _read_request(self):
+        """(workbook bytes, form fields) from a JSON body or a raw xlsx body plus X-Invoice-Form"""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            raise ValueError("empty request body")
+        if length > MAX_BODY_BYTES:
+            # The body is left unread, so the connection can't be reused
+            self.close_connection = True
+            raise OverflowError(f"request body larger than {MAX_BODY_BYTES} bytes")
+        body = self.rfile.read(length)
+
+        if self.headers.get("Content-Type", "").split(";")[0].strip() == "application/json":
+            try:
+                payload = json.loads(body)
+                data = base64.b64decode(payload["workbook"], validate=True)
+            except (json.JSONDecodeError, KeyError, TypeError, binascii.Error) as e:
+                raise ValueError(f'expected {{"workbook": <base64 xlsx>, "form": {{...}}}}: {e}')
+            form = payload.get("form") or {}
+        else:
+            data = body
+            try:
+                form = json.loads(self.headers.get("X-Invoice-Form") or "{}")
+            except json.JSONDecodeError as e:
+                raise ValueError(f"X-Invoice-Form is not valid JSON: {e}")
+
+        if not isinstance(form, dict):
+            raise ValueError("form fields must be a JSON object")
+        unknown = set(form) - set(FORM_DEFAULTS)
+        if unknown:
+            raise ValueError(f"unknown form fields: {', '.join(sorted(unknown))}")
+        return data, {k: str(v) for k, v in form.items()}
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"{self.address_string()} - {format % args}\n")
+
+
+def make_server(host="127.0.0.1", port=8502, workers=2, queue=8, defaults=None, timeout=300, pdf_cache=None):
+    """Build the HTTP server and its RenderService; call serve_forever() to start answering"""
+    service = RenderService(workers, queue, defaults, timeout, pdf_cache)
+    handler = type("BoundRenderHandler", (RenderHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+# ===== Command Line =====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve proforma invoice rendering over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--workers", type=int, default=min(2, os.cpu_count() or 1), help="render processes")
+    parser.add_argument("--queue", type=int, default=8, help="renders accepted (running + waiting) before 429")
+    parser.add_argument("--timeout", type=int, default=300, help="seconds a request waits for its render")
+    parser.add_argument("--defaults", help="JSON file with default form field values")
+    parser.add_argument("--pdf-cache", metavar="DIR", help="serve repeated renders from PDFs kept in DIR")
+    parser.add_argument("--pdf-cache-mb", type=int, default=1024, help="size limit of --pdf-cache (default: 1024)")
+    args = parser.parse_args(argv)
+
+    defaults = {}
+    if args.defaults:
+        with open(args.defaults, encoding="utf-8") as f:
+            defaults = json.load(f)
+        unknown = set(defaults) - set(FORM_DEFAULTS)
+        if unknown:
+            parser.error(f"Unknown form fields in {args.defaults}: {', '.join(sorted(unknown))}")
+
+    pdf_cache = (args.pdf_cache, args.pdf_cache_mb * 1024 * 1024) if args.pdf_cache else None
+    server = make_server(args.host, args.port, args.workers, args.queue, defaults, args.timeout, pdf_cache)
+    print(f"Serving invoices on http://{args.host}:{server.server_address[1]} "
+          f"({args.workers} workers, queue limit {args.queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.pool.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    # Go through the importable module so spawned workers unpickle the same functions and exceptions
+    import service
+    sys.exit(service.main())
@@ -0,0 +1,282 @@
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# Spill files are <prefix><session id>.pkl, apart from the parse cache's <key>.pkl entries
+SPILL_PREFIX = "session-"
+
+# Failed spills and unreadable spill files are reported here rather than on stdout
+logger = logging.getLogger("invoice.sessions")
+
+
+# ===== Byte Accounting =====
+def value_bytes(value, seen=None):
+    """Approximate bytes held by value: frames counted deep, containers and plain objects by their contents.
+
+    An object reachable twice (the normalizer's working_df held by the
+    preview too) is counted once per seen set.
+    """
+    seen = set() if seen is None else seen
+    if value is None or id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if hasattr(value, "memory_usage"):
+        # DataFrame.memory_usage() gives a Series per column, Series.memory_usage() an int
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(value_bytes(item, seen) for item in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return sum(value_bytes(item, seen) for item in value)
+    if hasattr(value, "__dict__"):
+        return value_bytes(vars(value), seen)
+    return 0
+
+
+def is_frame(value):
+    return hasattr(value, "columns") and hasattr(value, "memory_usage")
+
+
+# ===== Compact Frames =====
+def compact_frame(df):
+    """(df with its text columns as categoricals, their original dtypes) for restore_frame()"""
+    import pandas as pd
+    dtypes = {column: dtype for column, dtype in df.dtypes.items()
+              if dtype == object or (pd.api.types.is_string_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype))}
+    return (df.astype({column: "category" for column in dtypes}) if dtypes else df), dtypes
+
+
+def restore_frame(df, dtypes):
+    """The frame compact_frame() was given, text columns back in their original dtypes"""
+    return df.astype(dtypes) if dtypes else df
+
+
+# ===== Session Store =====
+class _Session:
+    def __init__(self):
+        self.values = {}
+        # Original text dtypes of each frame while the session is parked
+        self.dtypes = None
+        self.bytes = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def parked(self):
+        return self.dtypes is not None
+
+    def measure(self):
+        seen = set()
+        self.bytes = sum(value_bytes(value, seen) for value in self.values.values())
+
+
+class SessionStore:
+    """Per-session order state of every Streamlit session in the process, under one memory budget.
+
+    Each session keeps named values: DataFrames (the order frames, such as
+    the editor's table) and values rebuilt from them on demand (the
+    normalizer, the preview). Bytes are counted per session on every put().
+    A session left alone for idle_seconds is parked: the rebuildable values
+    are dropped and the frames kept with their text columns as categoricals.
+    While the sessions together hold more than max_memory_bytes, the least
+    recently used ones are parked and spilled to spill_dir as a pickle, or
+    released without a directory; get() brings a parked or spilled session
+    back. Sessions unused for expire_seconds are forgotten, spill file
+    included. The session being served is never parked, spilled or released.
+    """
+
+    def __init__(self, max_memory_bytes=512 * 1024 * 1024, idle_seconds=15 * 60, spill_dir=None,
+                 expire_seconds=24 * 3600):
+        self.max_memory_bytes = max_memory_bytes
+        self.idle_seconds = idle_seconds
+        self.spill_dir = spill_dir
+        self.expire_seconds = expire_seconds
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        # session id -> (spill file, its bytes, last use)
+        self._spilled = {}
+        self._counts = {"parks": 0, "spills": 0, "restores": 0, "releases": 0, "expired": 0}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            # Spills of an earlier process belong to sessions that no longer exist; only the store's own
+            # files go, so a directory shared with the parse cache keeps its entries
+            for entry in os.scandir(spill_dir):
+                if entry.name.startswith(SPILL_PREFIX) and entry.name.endswith(".pkl"):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    def _spill_path(self, session_id):
+        return os.path.join(self.spill_dir, f"{SPILL_PREFIX}{session_id}.pkl")
+
+    def _park(self, session):
+        """Drop the rebuildable values and keep the frames compact (call with the lock held)"""
+        frames = {name: compact_frame(value) for name, value in session.values.items() if is_frame(value)}
+        session.values = {name: df for name, (df, _) in frames.items()}
+        session.dtypes = {name: dtypes for name, (_, dtypes) in frames.items()}
+        session.measure()
+        self._counts["parks"] += 1
+
+    def _unpark(self, session):
+        session.values = {name: restore_frame(df, session.dtypes[name]) for name, df in session.values.items()}
+        session.dtypes = None
+        session.measure()
+
+    def _spill(self, session_id, session):
+        """Move a session to disk, or release it without a spill directory (call with the lock held)"""
+        del self._sessions[session_id]
+        if not session.parked:
+            self._park(session)
+        if self.spill_dir and session.values:
+            # Write to a temp file first so a crashed write never leaves a truncated entry
+            path = self._spill_path(session_id)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    pickle.dump((session.values, session.dtypes), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+                self._spilled[session_id] = (path, os.path.getsize(path), session.last_used)
+                self._counts["spills"] += 1
+                return
+            except Exception as e:
+                logger.warning("Could not spill session %s: %s", session_id, e)
+        self._counts["releases"] += 1
+
+    def _load(self, session_id):
+        """The spilled session, back in memory and off the disk, or None (call with the lock held)"""
+        path, _, _ = self._spilled.pop(session_id)
+        session = _Session()
+        try:
+            with open(path, "rb") as f:
+                session.values, session.dtypes = pickle.load(f)
+        except Exception as e:
+            logger.warning("Ignoring unreadable spilled session %s: %s", session_id, e)
+            session = None
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return session
+
+    def _session(self, session_id):
+        """The session's entry, brought back into memory and marked as just used (call with the lock held)"""
+        session = self._sessions.get(session_id)
+        if session is None and session_id in self._spilled:
+            # Comes back parked, and is unparked below
+            session = self._load(session_id)
+        if session is None:
+            session = _Session()
+        elif session.parked:
+            self._unpark(session)
+            self._counts["restores"] += 1
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        return session
+
+    def _enforce(self, current):
+        """Expire, park and spill the other sessions until the budget holds (call with the lock held)"""
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if session_id == current:
+                continue
+            idle = now - session.last_used
+            if idle > self.expire_seconds:
+                del self._sessions[session_id]
+                self._counts["expired"] += 1
+            elif idle > self.idle_seconds and not session.parked:
+                self._park(session)
+        for session_id, (path, _, last_used) in list(self._spilled.items()):
+            if now - last_used > self.expire_seconds:
+                del self._spilled[session_id]
+                self._counts["expired"] += 1
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+        total = sum(session.bytes for session in self._sessions.values())
+        # Least recently used first; the current session was just moved to the end
+        for session_id, session in list(self._sessions.items()):
+            if total <= self.max_memory_bytes or session_id == current:
+                break
+            total -= session.bytes
+            self._spill(session_id, session)
+
+    def get(self, session_id, name, default=None):
+        with self._lock:
+            session = self._session(session_id)
+            value = session.values.get(name, default)
+            self._enforce(session_id)
+        return value
+
+    def put(self, session_id, name, value):
+        """Store value under name and recount the session's bytes; call again after changing a value in place"""
+        with self._lock:
+            session = self._session(session_id)
+            session.values[name] = value
+            session.measure()
+            self._enforce(session_id)
+
+    def pop(self, session_id, name, default=None):
+        with self._lock:
+            session = self._session(session_id)
+            value = session.values.pop(name, default)
+            session.measure()
+        return value
+
+    def drop(self, session_id):
+        """Forget a session, in memory and on disk"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if session_id in self._spilled:
+                path, _, _ = self._spilled.pop(session_id)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def session_bytes(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.bytes if session is not None else 0
+
+    def stats(self):
+        """Park, spill, restore and release counts, plus what the sessions hold now"""
+        with self._lock:
+            stats = dict(self._counts)
+            active = [s.bytes for s in self._sessions.values() if not s.parked]
+            parked = [s.bytes for s in self._sessions.values() if s.parked]
+            stats["active_sessions"], stats["active_bytes"] = len(active), sum(active)
+            stats["parked_sessions"], stats["parked_bytes"] = len(parked), sum(parked)
+            stats["memory_bytes"] = stats["active_bytes"] + stats["parked_bytes"]
+            stats["max_memory_bytes"] = self.max_memory_bytes
+            stats["spilled_sessions"] = len(self._spilled)
+            stats["spilled_bytes"] = sum(size for _, size, _ in self._spilled.values())
+        return stats
+
+    def prometheus_lines(self):
+        """Exposition lines for MetricsRegistry.add_collector()"""
+        stats = self.stats()
+        series = [
+            ("invoice_sessions_memory_bytes", "gauge", "Bytes of order state the sessions hold in memory", "memory_bytes"),
+            ("invoice_sessions_memory_limit_bytes", "gauge", "Memory budget of the session store", "max_memory_bytes"),
+            ("invoice_sessions_active", "gauge", "Sessions with their full state in memory", "active_sessions"),
+            ("invoice_sessions_parked", "gauge", "Idle sessions kept compact in memory", "parked_sessions"),
+            ("invoice_sessions_spilled", "gauge", "Sessions spilled to disk", "spilled_sessions"),
+            ("invoice_sessions_spilled_bytes", "gauge", "Bytes of spilled sessions on disk", "spilled_bytes"),
+            ("invoice_sessions_spills_total", "counter", "Sessions moved to disk over the budget", "spills"),
+            ("invoice_sessions_releases_total", "counter", "Sessions dropped over the budget without a spill directory", "releases"),
+            ("invoice_sessions_restores_total", "counter", "Parked or spilled sessions brought back", "restores"),
+        ]
+        lines = []
+        for metric, kind, help_text, key in series:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}", f"{metric} {stats[key]}"]
+        return lines